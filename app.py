@@ -2,10 +2,12 @@ from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 
-import models
-from auth import pwd_context
-from database import engine
+from config import METRICS_ENABLED, MIGRATE_ON_STARTUP, QUERY_STATS_ENABLED, SEED_ON_STARTUP
+from metrics import MetricsMiddleware
+from query_stats import QueryStatsMiddleware
+from password_service import password_service
 from dependencies import get_db
+from migrations import upgrade
 from routers.auth_routers import app as auth_router
 from routers.um_routers import app as um_routers
 from routers.file_routers import app as file_routers
@@ -17,12 +19,11 @@ from routers.learning_path_routers import app as learning_path_routers
 from routers.feedback_routers import app as feedback_routers
 from routers.external_certifications import app as external_certifications
 from routers.app_status import app as app_status
-from database import SessionLocal
+from routers.metrics_routers import app as metrics_routers
+from seed import seed_database
 
 # from create_sample_db import create_sample_data
 
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI()
 
 # create_sample_data()
@@ -36,130 +37,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if QUERY_STATS_ENABLED:
+    app.add_middleware(QueryStatsMiddleware)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # get_db()
 
 
 @app.on_event("startup")
-async def startup_event():
-    db = SessionLocal()
-    service_lines = [
-        "Business Risk",
-        "Assurance",
-        "Stat Audit",
-        "Accounting Advisory",
-        "Tech Risk",
-        "HR",
-        "Operations",
-        "Pursuits",
-        "IT Operations",
-        "Content Writer",
-        "Website Operation Specialist",
-        "Financial Due Diligence",
-        "Brands, Marketing and Communications",
-    ]
-    designations = [
-        "Co-Founder - Assurance and Advisory Leader",
-        "Director",
-        "Senior Consultant",
-        "Senior",
-        "Manager",
-        "Associate Director",
-        "Assistant Manager",
-        "Consultant",
-        "Associate",
-        "Executive - Operations",
-        "Executive",
-        "Executive Assistant",
-        "Associate (Support) – Operations",
-        "Trainee",
-    ]
-    external_roles = [
-        "Business Risk",
-        "Assurance",
-        "Stat Audit",
-        "Accounting Advisory",
-        "Tech Risk",
-        "HR",
-        "Operations",
-        "Pursuits",
-        "IT Operations",
-        "Content Writer",
-        "Website Operation Specialist",
-        "Financial Due Diligence",
-        "Brands, Marketing and Communications",
-    ]
-
-    # Add service lines
-    for name in service_lines:
-        service_line = models.ServiceLine(name=name)
-        db.add(service_line)
-
-    # Add designations
-    for name in designations:
-        designation = models.Designations(name=name)
-        db.add(designation)
-
-    # Add external roles
-    for name in external_roles:
-        external_role = models.ExternalRoles(name=name)
-        db.add(external_role)
+def startup_event():
+    if MIGRATE_ON_STARTUP:
+        upgrade()
+    # Inserts only what is missing; scaled deployments run `python seed.py` once instead
+    if SEED_ON_STARTUP:
+        seed_database()
 
-    try:
-        db.commit()
-    except:
-        pass
-    # Create roles
-
-    roles = [
-        models.Role(RoleName="Super Admin", Description="Manages the whole system"),
-        models.Role(
-            RoleName="Admin", Description="Manages a specific LOB or department"
-        ),
-        models.Role(
-            RoleName="Instructor",
-            Description="Manages own courses and can propose new ones",
-        ),
-        models.Role(RoleName="Employee", Description="Can view and enroll in courses"),
-    ]
-    db.add_all(roles)
-    try:
-        db.commit()
-    except:
-        pass
-
-    # Create service lines
-    service_lines = [
-        models.ServiceLine(name="Software Development"),
-        models.ServiceLine(name="Data Science"),
-    ]
-    db.add_all(service_lines)
-    try:
-        db.commit()
-    except:
-        pass
-
-    # Create users
-    super_admin = models.User(
-        email="superadmin@example.com",
-        password=pwd_context.hash("password"),
-        first_name="Super",
-        last_name="Admin",
-        role_name="Super Admin",
-        employee_id="SA001",
-        designation="Manager",
-        service_line_id=service_lines[0].name,
-        external_role_name="Assurance",
-        entity="PIERAG"
-    )
-    from datetime import datetime
 
-    new_status = models.AppStatus(status_update=True, update_datetime=datetime.now())
-    db.add(new_status)
-    db.add_all([super_admin])
-    try:
-        db.commit()
-    except:
-        pass
+@app.on_event("shutdown")
+def shutdown_event():
+    password_service.shutdown()
 
 
 app.include_router(auth_router)
@@ -173,6 +70,8 @@ app.include_router(learning_path_routers)
 app.include_router(external_certifications)
 app.include_router(feedback_routers)
 app.include_router(app_status)
+if METRICS_ENABLED:
+    app.include_router(metrics_routers)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,441 @@
+"""
+Streaming decoders for the base64 upload endpoints (``/files/upload_/``,
+``/courses/{id}/thumbnail_``, ``/chapters/{id}/content_/``).
+
+The request body is parsed as it arrives: the base64 text of each file is
+decoded in small blocks and written to a spool file while it is hashed, so an
+upload holds O(chunk) memory instead of the whole payload two or three times
+over. Spooled files are then handed to ``FileStorage.add_spooled_file``.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple
+
+import anyio
+from fastapi.exceptions import RequestValidationError
+from multipart.multipart import MultipartParser, parse_options_header
+from pydantic import BaseModel, ValidationError
+from starlette.requests import Request
+
+# Largest value accepted for a member that is not streamed (filename, titles ...)
+MAX_FIELD_SIZE = 64 * 1024
+
+# Request bodies for the OpenAPI schema of endpoints that read the stream themselves
+BASE64_FILE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {
+                    "type": "object",
+                    "required": ["filename", "content_type", "data"],
+                    "properties": {
+                        "filename": {"type": "string"},
+                        "content_type": {"type": "string"},
+                        "data": {"type": "string", "description": "Base64-encoded file"},
+                    },
+                }
+            }
+        },
+    }
+}
+BASE64_CONTENT_FORM_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["titles_json", "expected_time_to_complete", "files", "filenames", "content_types"],
+                    "properties": {
+                        "titles_json": {"type": "string", "description": "JSON-encoded list of titles"},
+                        "expected_time_to_complete": {"type": "string", "description": "JSON-encoded list"},
+                        "files": {"type": "array", "items": {"type": "string"}, "description": "Base64-encoded files"},
+                        "filenames": {"type": "array", "items": {"type": "string"}},
+                        "content_types": {"type": "array", "items": {"type": "string"}},
+                    },
+                }
+            }
+        },
+    }
+}
+
+_WHITESPACE = b" \t\r\n"
+_SIMPLE_ESCAPES = {
+    ord('"'): b'"', ord("\\"): b"\\", ord("/"): b"/", ord("b"): b"\b",
+    ord("f"): b"\f", ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t",
+}
+
+
+class Base64StreamDecoder:
+    """Decodes base64 text fed in arbitrary pieces; whitespace is ignored."""
+
+    def __init__(self):
+        self._pending = b""
+        self._padded = False
+
+    def feed(self, text: bytes) -> bytes:
+        text = text.translate(None, _WHITESPACE)
+        if not text:
+            return b""
+        if self._padded:
+            raise ValueError("Invalid Base64 encoding.")
+        text = self._pending + text
+        usable = len(text) - len(text) % 4
+        self._pending = text[usable:]
+        block = text[:usable]
+        if block.endswith(b"="):
+            self._padded = True
+        try:
+            return base64.b64decode(block, validate=True)
+        except binascii.Error:
+            raise ValueError("Invalid Base64 encoding.")
+
+    def finish(self):
+        if self._pending:
+            raise ValueError("Invalid Base64 encoding.")
+
+
+class SpooledUpload:
+    """A decoded file being written to disk, with its size and SHA-256."""
+
+    def __init__(self, directory: str):
+        descriptor, self.path = tempfile.mkstemp(dir=directory, suffix=".b64")
+        os.close(descriptor)
+        self._file = None
+        self._digest = hashlib.sha256()
+        self._decoder = Base64StreamDecoder()
+        self.size = 0
+        self.sha256: Optional[str] = None
+
+    async def write_text(self, text: bytes):
+        data = self._decoder.feed(text)
+        if not data:
+            return
+        if self._file is None:
+            self._file = await anyio.open_file(self.path, "wb")
+        self._digest.update(data)
+        self.size += len(data)
+        await self._file.write(data)
+
+    async def close(self):
+        self._decoder.finish()
+        if self._file is not None:
+            await self._file.aclose()
+            self._file = None
+        self.sha256 = self._digest.hexdigest()
+
+    async def discard(self):
+        if self._file is not None:
+            await self._file.aclose()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _FlatJsonParser:
+    """
+    Push parser for a flat JSON object of scalar members.
+
+    The string value of ``stream_field`` is unescaped and passed to ``on_stream``
+    piece by piece; every other member is collected into ``fields``.
+    """
+
+    def __init__(self, stream_field: str, on_stream: Callable[[bytes], None]):
+        self.stream_field = stream_field
+        self.on_stream = on_stream
+        self.fields: Dict[str, object] = {}
+        self._state = "start"
+        self._raw = bytearray()
+        self._key: Optional[str] = None
+        self._streaming = False
+        self._escape: Optional[bytearray] = None
+
+    def feed(self, chunk: bytes):
+        i, n = 0, len(chunk)
+        while i < n:
+            if self._state == "string":
+                i = self._feed_string(chunk, i)
+                continue
+            c = chunk[i]
+            if self._state == "scalar":
+                if c in b",}" or c in _WHITESPACE:
+                    self._end_value(json.loads(bytes(self._raw)))
+                    continue
+                self._append_raw(chunk[i:i + 1])
+                i += 1
+                continue
+            i += 1
+            if c in _WHITESPACE:
+                continue
+            if self._state == "start" and c == ord("{"):
+                self._state = "key_or_end"
+            elif self._state in ("key_or_end", "key") and c == ord('"'):
+                self._begin_string(streaming=False)
+                self._key = None
+            elif self._state == "key_or_end" and c == ord("}"):
+                self._state = "done"
+            elif self._state == "colon" and c == ord(":"):
+                self._state = "value"
+            elif self._state == "value" and c == ord('"'):
+                if self._key == self.stream_field and self._key in self.fields:
+                    raise ValueError(f"Duplicate member {self._key}.")
+                self._begin_string(streaming=self._key == self.stream_field)
+            elif self._state == "value" and c in b"-0123456789tfn":
+                self._raw = bytearray([c])
+                self._state = "scalar"
+            elif self._state == "after_value" and c == ord(","):
+                self._state = "key"
+            elif self._state == "after_value" and c == ord("}"):
+                self._state = "done"
+            else:
+                raise ValueError("Invalid JSON body.")
+
+    def close(self):
+        if self._state != "done":
+            raise ValueError("Invalid JSON body.")
+
+    def _append_raw(self, data: bytes):
+        self._raw += data
+        if len(self._raw) > MAX_FIELD_SIZE:
+            raise ValueError("JSON member is too large.")
+
+    def _begin_string(self, streaming: bool):
+        self._raw = bytearray()
+        self._streaming = streaming
+        self._return_state = "colon" if self._state in ("key_or_end", "key") else "after_value"
+        self._state = "string"
+
+    def _emit(self, data: bytes):
+        if not data:
+            return
+        if self._streaming:
+            self.on_stream(data)
+        else:
+            self._append_raw(data)
+
+    def _feed_escape(self, chunk: bytes, i: int) -> int:
+        self._escape.append(chunk[i])
+        needed = 5 if self._escape[0] == ord("u") else 1
+        if len(self._escape) == needed:
+            escape, self._escape = bytes(self._escape), None
+            self._emit(self._unescape(escape) if self._streaming else b"\\" + escape)
+        return i + 1
+
+    def _feed_string(self, chunk: bytes, i: int) -> int:
+        n = len(chunk)
+        while self._escape is not None and i < n:
+            i = self._feed_escape(chunk, i)
+
+        # One pass over the chunk: every search starts where the previous one stopped
+        quote = chunk.find(b'"', i)
+        while i < n:
+            limit = quote if quote != -1 else n
+            backslash = chunk.find(b"\\", i, limit)
+            if backslash == -1:
+                self._emit(chunk[i:limit])
+                i = limit
+                break
+            self._emit(chunk[i:backslash])
+            self._escape = bytearray()
+            i = backslash + 1
+            while self._escape is not None and i < n:
+                i = self._feed_escape(chunk, i)
+            if quote != -1 and quote < i:
+                # The quote was escaped; look for the real one
+                quote = chunk.find(b'"', i)
+        if quote == -1 or self._escape is not None or i < quote:
+            return n
+
+        # Closing quote
+        if self._return_state == "colon":
+            self._key = json.loads(b'"' + bytes(self._raw) + b'"')
+            self._state = "colon"
+        elif self._streaming:
+            self.fields[self._key] = None
+            self._state = "after_value"
+        else:
+            self._end_value(json.loads(b'"' + bytes(self._raw) + b'"'))
+        return quote + 1
+
+    def _unescape(self, escape: bytes) -> bytes:
+        if escape[0] == ord("u"):
+            code = int(escape[1:], 16)
+            if code > 0x7F:
+                raise ValueError("Invalid Base64 encoding.")
+            return bytes([code])
+        if escape[0] not in _SIMPLE_ESCAPES:
+            raise ValueError("Invalid JSON body.")
+        return _SIMPLE_ESCAPES[escape[0]]
+
+    def _end_value(self, value):
+        self.fields[self._key] = value
+        self._raw = bytearray()
+        self._state = "after_value"
+
+
+async def receive_json_base64(
+    request: Request, directory: str, data_field: str = "data"
+) -> Tuple[Dict[str, object], SpooledUpload]:
+    """
+    Streams a JSON body such as ``{"filename": ..., "content_type": ..., "data": "<base64>"}``.
+
+    Returns the other members and the spooled, decoded ``data_field``; raises
+    ``ValueError`` for malformed JSON or base64. The caller owns the spool file.
+    """
+    spool = SpooledUpload(directory)
+    pending: List[bytes] = []
+    parser = _FlatJsonParser(data_field, pending.append)
+    try:
+        async for chunk in request.stream():
+            parser.feed(chunk)
+            for text in pending:
+                await spool.write_text(text)
+            pending.clear()
+        parser.close()
+        if data_field not in parser.fields:
+            raise ValueError(f"Missing member {data_field}.")
+        await spool.close()
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await spool.discard()
+        raise
+    return parser.fields, spool
+
+
+async def receive_base64_file(
+    request: Request, directory: str, info_model: type
+) -> Tuple[BaseModel, SpooledUpload]:
+    """``receive_json_base64``, with the other members validated as ``info_model``."""
+    fields, spool = await receive_json_base64(request, directory)
+    try:
+        return info_model.model_validate(fields), spool
+    except ValidationError as e:
+        await spool.discard()
+        # Same error shape as a pydantic body parameter: locations start at "body"
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+
+def missing_form_fields(fields: Dict[str, List[str]], names: List[str]) -> List[dict]:
+    """Validation errors, in FastAPI's format, for required form fields that were not sent."""
+    return [
+        {"type": "missing", "loc": ("body", name), "msg": "Field required", "input": None}
+        for name in names
+        if name not in fields
+    ]
+
+
+async def _receive_buffered_form_base64(
+    request: Request, directory: str, file_field: str
+) -> Tuple[Dict[str, List[str]], List[SpooledUpload]]:
+    form = await request.form()
+    fields: Dict[str, List[str]] = {}
+    spools: List[SpooledUpload] = []
+    try:
+        for name, value in form.multi_items():
+            if name != file_field:
+                fields.setdefault(name, []).append(value)
+                continue
+            spool = SpooledUpload(directory)
+            spools.append(spool)
+            await spool.write_text(value.encode("utf-8"))
+            await spool.close()
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            for spooled in spools:
+                await spooled.discard()
+        raise
+    finally:
+        await form.close()
+    return fields, spools
+
+
+async def receive_form_base64(
+    request: Request, directory: str, file_field: str = "files"
+) -> Tuple[Dict[str, List[str]], List[SpooledUpload]]:
+    """
+    Streams a multipart form whose ``file_field`` parts carry base64 text.
+
+    Returns the other fields (every value, in order) and one spooled, decoded
+    file per ``file_field`` part. Raises ``ValueError`` for malformed input.
+    Other bodies, such as ``application/x-www-form-urlencoded``, are read with
+    ``request.form()`` and decoded the same way.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data":
+        return await _receive_buffered_form_base64(request, directory, file_field)
+    if b"boundary" not in options:
+        raise ValueError("Expected a multipart/form-data body.")
+
+    fields: Dict[str, List[str]] = {}
+    spools: List[SpooledUpload] = []
+    events: List[tuple] = []
+    part = {"header_field": b"", "header_value": b"", "headers": {}}
+
+    def on_header_field(data, start, end):
+        part["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["header_value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["header_field"].lower()] = part["header_value"]
+        part["header_field"], part["header_value"] = b"", b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        events.append(("begin", disposition.get(b"name", b"").decode("latin-1")))
+
+    def on_part_data(data, start, end):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", None))
+        part["headers"] = {}
+
+    parser = MultipartParser(
+        options[b"boundary"],
+        {
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    name, spool, value = None, None, bytearray()
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event, payload in events:
+                if event == "begin":
+                    name, value = payload, bytearray()
+                    if name == file_field:
+                        spool = SpooledUpload(directory)
+                        spools.append(spool)
+                elif event == "data" and spool is not None:
+                    await spool.write_text(payload)
+                elif event == "data":
+                    value += payload
+                    if len(value) > MAX_FIELD_SIZE:
+                        raise ValueError(f"Form field {name} is too large.")
+                elif spool is not None:
+                    await spool.close()
+                    spool = None
+                else:
+                    fields.setdefault(name, []).append(value.decode("utf-8"))
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            for spooled in spools:
+                await spooled.discard()
+        raise
+    return fields, spools
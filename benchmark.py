@@ -0,0 +1,198 @@
+"""
+In-process latency benchmark of the hot endpoints.
+
+Drives the app through ``TestClient`` against the database ``LMS_DATABASE_URL``
+points at (fill it with ``synthetic_data.py`` first), as the employee with the
+most enrollments and the counselor with the largest team, and prints
+p50 / p95 / p99 latency and statements per request for each scenario:
+
+    LMS_DATABASE_URL=sqlite:///./bench.db python benchmark.py --requests 200 --json after.json
+    python benchmark.py --baseline before.json --tolerance 0.2
+
+With ``--baseline`` the run exits non-zero when any scenario's p95 is more than
+``--tolerance`` slower than in the baseline results, so a regression fails CI
+before it is deployed.
+"""
+import json
+import logging
+import os
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("LMS_QUERY_STATS", "true")
+os.environ.setdefault("LMS_PASSWORD_HASH_WORKERS", "0")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+import auth
+from app import app
+from database import SessionLocal
+from models import Chapter, Content, Enrollment, User
+
+# Statement counts are read from the response headers; the per-request log lines would drown the report
+logging.getLogger("query_stats").setLevel(logging.ERROR)
+
+
+def percentile(sorted_values: List[float], share: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(share * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Scenario:
+    def __init__(self, name: str, request: Callable[[TestClient, int], object]):
+        """
+        Args:
+        name (str): Label in the report and the JSON results.
+        request (Callable): Sends the i-th request with the client and returns the response.
+        """
+        self.name = name
+        self.request = request
+
+
+def _actors(db) -> Dict[str, object]:
+    employee_id = db.scalar(
+        select(Enrollment.user_id)
+        .join(User, User.id == Enrollment.user_id)
+        .where(User.role_name == "Employee")
+        .group_by(Enrollment.user_id)
+        .order_by(func.count().desc())
+        .limit(1)
+    )
+    counselor_id = db.scalar(
+        select(User.counselor_id)
+        .where(User.counselor_id.is_not(None))
+        .group_by(User.counselor_id)
+        .order_by(func.count().desc())
+        .limit(1)
+    )
+    if employee_id is None or counselor_id is None:
+        raise SystemExit("No enrolled employee or counselor found; run synthetic_data.py first.")
+    content_ids = list(
+        db.scalars(
+            select(Content.id)
+            .join(Chapter, Chapter.id == Content.chapter_id)
+            .join(Enrollment, Enrollment.course_id == Chapter.course_id)
+            .where(Enrollment.user_id == employee_id)
+            .order_by(Content.id)
+        )
+    )
+    return {
+        "employee": db.get(User, employee_id).email,
+        "counselor": db.get(User, counselor_id).email,
+        "content_ids": content_ids,
+    }
+
+
+def _headers(email: str) -> dict:
+    return {"Authorization": f"Bearer {auth.create_access_token(data={'sub': email})}"}
+
+
+def scenarios(actors: Dict[str, object]) -> List[Scenario]:
+    employee = _headers(actors["employee"])
+    counselor = _headers(actors["counselor"])
+    content_ids = actors["content_ids"]
+    return [
+        Scenario("GET /courses/", lambda client, i: client.get("/courses/", headers=employee)),
+        Scenario("GET /courses/catalog/", lambda client, i: client.get("/courses/catalog/", headers=employee)),
+        Scenario("GET /stats/dash/new/ (employee)", lambda client, i: client.get("/stats/dash/new/", headers=employee)),
+        Scenario("GET /stats/dash/new/ (counselor)", lambda client, i: client.get("/stats/dash/new/", headers=counselor)),
+        Scenario(
+            "GET /um/counselor/{id}/team_members",
+            lambda client, i: client.get("/um/counselor/0/team_members", headers=counselor),
+        ),
+        Scenario(
+            "PUT /mark_as_done/{content_id}/",
+            lambda client, i: client.put(
+                f"/mark_as_done/{content_ids[i % len(content_ids)]}/", headers=employee
+            ),
+        ),
+    ]
+
+
+def run(client: TestClient, scenario: Scenario, requests: int, warmup: int) -> dict:
+    for i in range(warmup):
+        scenario.request(client, i)
+    timings, queries, errors = [], [], 0
+    for i in range(warmup, warmup + requests):
+        started = time.perf_counter()
+        response = scenario.request(client, i)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            errors += 1
+        if "x-db-query-count" in response.headers:
+            queries.append(int(response.headers["x-db-query-count"]))
+    timings.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": percentile(timings, 0.50),
+        "p95_ms": percentile(timings, 0.95),
+        "p99_ms": percentile(timings, 0.99),
+        "mean_ms": statistics.fmean(timings),
+        "queries": statistics.median(queries) if queries else None,
+    }
+
+
+def regressions(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    slower = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            slower.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+    return slower
+
+
+def print_report(results: Dict[str, dict]):
+    print(f"{'scenario':42} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8} {'errors':>7}")
+    for name, result in results.items():
+        queries = "-" if result["queries"] is None else f"{result['queries']:g}"
+        print(
+            f"{name:42} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} {result['p99_ms']:8.1f} "
+            f"{queries:>8} {result['errors']:>7}"
+        )
+
+
+def main(requests: int, warmup: int, only: Optional[str] = None) -> Dict[str, dict]:
+    db = SessionLocal()
+    try:
+        actors = _actors(db)
+    finally:
+        db.close()
+    results = {}
+    with TestClient(app) as client:
+        for scenario in scenarios(actors):
+            if only and only not in scenario.name:
+                continue
+            results[scenario.name] = run(client, scenario, requests, warmup)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Measure endpoint latency percentiles in-process.")
+    parser.add_argument("--requests", type=int, default=100, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--only", help="Run the scenarios whose name contains this text")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    results = main(args.requests, args.warmup, args.only)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if slower else 0)
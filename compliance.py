@@ -0,0 +1,143 @@
+"""
+Team compliance figures for counselors, computed for a whole page of team
+members with one grouped query instead of walking each member's enrollments.
+"""
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, not_, select
+from sqlalchemy.orm import Session
+
+from models import Course, Enrollment, EnrollmentRollup, User
+from schemas import UserTeamView
+
+TECHNICAL_HOURS_TARGET = 50
+NON_TECHNICAL_HOURS_TARGET = 15
+
+
+def _sum_if(condition, value=1):
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+
+class TeamComplianceEngine:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def team_page(
+        self,
+        counselor_id: int,
+        after_id: Optional[int] = None,
+        limit: int = 200,
+        unassigned_only: bool = False,
+    ) -> Tuple[List[UserTeamView], Optional[int]]:
+        """
+        Returns one page of a counselor's team with their compliance figures.
+
+        Members are ordered by id; pass the returned cursor as ``after_id`` to
+        fetch the next page. The cursor is None on the last page.
+
+        Args:
+        counselor_id (int): The counselor whose team members are listed.
+        after_id (int): Only list members with an id greater than this.
+        limit (int): Maximum number of members on the page.
+        unassigned_only (bool): Skip members already enrolled for more than
+            both the technical and non-technical targets.
+        """
+        status = func.coalesce(EnrollmentRollup.status, "Pending")
+        expected = func.coalesce(EnrollmentRollup.expected_time_to_complete, 0)
+        is_completed = status == "Completed"
+        is_technical = Course.category == "technical"
+        is_non_technical = Course.category == "nonTechnical"
+
+        completed_count = _sum_if(is_completed)
+        pending_count = _sum_if(and_(Enrollment.id.is_not(None), not_(is_completed)))
+        mandatory_overdue = _sum_if(
+            and_(
+                Course.category == "Mandatory",
+                not_(is_completed),
+                Enrollment.due_date < date.today(),
+            )
+        )
+        completed_hours = _sum_if(is_completed, expected)
+        technical_hours = _sum_if(and_(is_completed, is_technical), expected)
+        non_technical_hours = _sum_if(and_(is_completed, is_non_technical), expected)
+        tech_enrolled_hours = _sum_if(is_technical, expected)
+        non_tech_enrolled_hours = _sum_if(is_non_technical, expected)
+
+        query = (
+            select(
+                User.id,
+                User.dp_file_id,
+                User.first_name,
+                User.last_name,
+                User.email,
+                User.role_name,
+                User.employee_id,
+                User.designation,
+                User.service_line_id,
+                User.external_role_name,
+                User.entity,
+                completed_count.label("completed_count"),
+                pending_count.label("pending_count"),
+                mandatory_overdue.label("mandatory_overdue"),
+                completed_hours.label("completed_hours"),
+                technical_hours.label("technical_hours"),
+                non_technical_hours.label("non_technical_hours"),
+                tech_enrolled_hours.label("tech_enrolled_hours"),
+                non_tech_enrolled_hours.label("non_tech_enrolled_hours"),
+            )
+            .outerjoin(Enrollment, Enrollment.user_id == User.id)
+            .outerjoin(EnrollmentRollup, EnrollmentRollup.enrollment_id == Enrollment.id)
+            .outerjoin(Course, Course.id == Enrollment.course_id)
+            .where(User.counselor_id == counselor_id)
+            .group_by(User.id)
+            .order_by(User.id)
+            .limit(limit + 1)
+        )
+        if after_id is not None:
+            query = query.where(User.id > after_id)
+        if unassigned_only:
+            query = query.having(
+                not_(
+                    and_(
+                        tech_enrolled_hours > TECHNICAL_HOURS_TARGET,
+                        non_tech_enrolled_hours > NON_TECHNICAL_HOURS_TARGET,
+                    )
+                )
+            )
+
+        rows = self.db.execute(query).all()
+        next_cursor = rows[limit - 1].id if len(rows) > limit else None
+        return [self._team_view(row) for row in rows[:limit]], next_cursor
+
+    @staticmethod
+    def _team_view(row) -> UserTeamView:
+        compliant = (
+            row.technical_hours >= TECHNICAL_HOURS_TARGET
+            and row.non_technical_hours >= NON_TECHNICAL_HOURS_TARGET
+        )
+        return UserTeamView(
+            id=row.id,
+            dp_file_id=row.dp_file_id,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            email=row.email,
+            role_name=row.role_name,
+            employee_id=row.employee_id,
+            designation=row.designation,
+            service_line_id=row.service_line_id,
+            external_role_name=row.external_role_name,
+            entity=row.entity,
+            number_of_trainings_completed=row.completed_count,
+            hours_of_training_completed=row.completed_hours,
+            hours_of_non_technical_training_completed=row.non_technical_hours,
+            hours_of_technical_training_completed=row.technical_hours,
+            hours_of_technical_training_target=TECHNICAL_HOURS_TARGET,
+            hours_of_non_technical_training_target=NON_TECHNICAL_HOURS_TARGET,
+            number_of_trainings_pending=row.pending_count,
+            number_of_mandatory_trainings_overdue=row.mandatory_overdue,
+            total_tech_enrolled_hours=row.tech_enrolled_hours,
+            total_non_tech_enrolled_hours=row.non_tech_enrolled_hours,
+            compliance_status="Compliant" if compliant else "Non-Compliant",
+            reminder_needed=row.mandatory_overdue > 0,
+        )
@@ -1,2 +1,55 @@
+import os
+
 complience_total_tech_learning_target = 50*60
-complience_total_non_tech_learning_target = 15*60
\ No newline at end of file
+complience_total_non_tech_learning_target = 15*60
+
+# Database engine settings, overridable through the environment
+DATABASE_URL = os.getenv("LMS_DATABASE_URL", "sqlite:///./lms_test.db")
+DB_POOL_SIZE = int(os.getenv("LMS_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("LMS_DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("LMS_DB_POOL_TIMEOUT", "30"))  # seconds
+DB_POOL_RECYCLE = int(os.getenv("LMS_DB_POOL_RECYCLE", "1800"))  # seconds
+DB_ECHO = os.getenv("LMS_DB_ECHO", "false").lower() in ("1", "true", "yes")
+
+# Prometheus metrics at /metrics (see metrics.py for multi-worker setups)
+METRICS_ENABLED = os.getenv("LMS_METRICS", "true").lower() in ("1", "true", "yes")
+
+# Apply pending schema migrations when a worker starts; run `python migrations.py upgrade` instead when scaling out
+MIGRATE_ON_STARTUP = os.getenv("LMS_MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# Insert missing reference data when a worker starts; run `python seed.py` instead when scaling out
+SEED_ON_STARTUP = os.getenv("LMS_SEED_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# Per-request statement counts and N+1 warnings (query_stats)
+QUERY_STATS_ENABLED = os.getenv("LMS_QUERY_STATS", "false").lower() in ("1", "true", "yes")
+QUERY_STATS_REPEAT_THRESHOLD = int(os.getenv("LMS_QUERY_STATS_REPEAT_THRESHOLD", "5"))
+
+# SQLite connection pragmas
+SQLITE_BUSY_TIMEOUT = int(os.getenv("LMS_SQLITE_BUSY_TIMEOUT", "5000"))  # milliseconds
+SQLITE_MMAP_SIZE = int(os.getenv("LMS_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE = int(os.getenv("LMS_SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB
+
+# Authenticated-user cache used by auth.get_current_user
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("LMS_PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("LMS_PRINCIPAL_CACHE_MAX_ENTRIES", "1024"))
+
+# Bcrypt worker processes used by password_service (0 hashes inline)
+PASSWORD_HASH_WORKERS = int(os.getenv("LMS_PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("LMS_PASSWORD_HASH_MAX_PENDING", "64"))
+
+# Uploaded files: content-addressed blobs are stored once per SHA-256
+FILE_STORAGE_CONTENT_ADDRESSED = os.getenv("LMS_FILE_STORAGE_CONTENT_ADDRESSED", "true").lower() in ("1", "true", "yes")
+FILE_STORAGE_GC_GRACE_SECONDS = int(os.getenv("LMS_FILE_STORAGE_GC_GRACE_SECONDS", "3600"))
+
+# Resumable uploads (init -> PUT chunks -> finalize)
+UPLOAD_MAX_SIZE = int(os.getenv("LMS_UPLOAD_MAX_SIZE", str(20 * 1024 ** 3)))  # bytes
+UPLOAD_CHUNK_SIZE = int(os.getenv("LMS_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))  # suggested to clients
+UPLOAD_MAX_CHUNK_SIZE = int(os.getenv("LMS_UPLOAD_MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("LMS_UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+# A worker that stops renewing its write/finalize claim for this long is presumed dead
+UPLOAD_LOCK_TIMEOUT_SECONDS = int(os.getenv("LMS_UPLOAD_LOCK_TIMEOUT_SECONDS", "300"))
+
+# Resized image variants served by /files/{file_id}/image
+IMAGE_VARIANT_SIZES = sorted(int(size) for size in os.getenv("LMS_IMAGE_VARIANT_SIZES", "64,128,256,512,1024").split(","))
+IMAGE_VARIANT_QUALITY = int(os.getenv("LMS_IMAGE_VARIANT_QUALITY", "80"))
+IMAGE_VARIANT_MAX_AGE = int(os.getenv("LMS_IMAGE_VARIANT_MAX_AGE", str(365 * 24 * 3600)))  # seconds
@@ -0,0 +1,196 @@
+"""
+Keyset-paginated course catalog.
+
+Pages are ordered by the chosen sort column plus ``id`` and continued with an
+opaque cursor, so each page costs the same however deep into the catalog it is.
+Only plain course columns are selected by default; the per-course aggregates
+(counts, ratings, expected time, creator) are computed for the page only when
+requested through ``fields``.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import String, and_, exists, func, literal, or_, select, type_coerce
+from sqlalchemy.orm import Session
+
+from models import Course, Enrollment, EnrollmentRollup, User
+from schemas import CourseCatalogItem, UserSortDisplay
+
+BASE_COLUMNS = (
+    Course.id,
+    Course.title,
+    Course.category,
+    Course.status,
+    Course.service_line_id,
+    Course.difficulty_level,
+    Course.tags,
+    Course.entity,
+    Course.thumbnail_file_id,
+    Course.ratings,
+    Course.creation_date,
+    Course.approved_date,
+    Course.created_by,
+)
+
+# Sort name -> (column, descending)
+SORTS = {
+    "-creation_date": (Course.creation_date, True),
+    "creation_date": (Course.creation_date, False),
+    "title": (Course.title, False),
+    "-title": (Course.title, True),
+}
+DEFAULT_SORT = "-creation_date"
+
+
+def _completed_students_count():
+    return (
+        select(func.count(Enrollment.id))
+        .join(EnrollmentRollup, EnrollmentRollup.enrollment_id == Enrollment.id)
+        .where(Enrollment.course_id == Course.id, EnrollmentRollup.status == "Completed")
+        .correlate(Course)
+        .scalar_subquery()
+    )
+
+
+# Optional field -> expression computed per course on the page
+AGGREGATES = {
+    "description": lambda: Course.description,
+    "chapters_count": lambda: Course.chapters_count,
+    "enrolled_students_count": lambda: Course.enrolled_students_count,
+    "completed_students_count": _completed_students_count,
+    "feedback_count": lambda: Course.feedback_count,
+    "average_rating": lambda: Course.average_rating,
+    "expected_time_to_complete": lambda: Course.expected_time_to_complete,
+}
+OPTIONAL_FIELDS = tuple(AGGREGATES) + ("creator",)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_key, course_id: int) -> str:
+    if isinstance(sort_key, datetime):
+        sort_key = sort_key.isoformat(sep=" ")
+    raw = json.dumps([sort_key, course_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[object, int]:
+    try:
+        sort_key, course_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_key, int(course_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+
+
+class CourseCatalog:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def page(
+        self,
+        user_id: int,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        sort: str = DEFAULT_SORT,
+        fields: Iterable[str] = (),
+        status: Optional[str] = None,
+        category: Optional[str] = None,
+        service_line_id: Optional[str] = None,
+        difficulty_level: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+    ) -> Tuple[List[CourseCatalogItem], Optional[str]]:
+        """
+        Returns one page of the catalog and the cursor of the next page (None on the last page).
+
+        Args:
+        user_id (int): The user the ``is_enrolled`` flag is computed for.
+        cursor (str): Cursor returned with the previous page.
+        limit (int): Maximum number of courses on the page.
+        sort (str): One of ``SORTS``.
+        fields (Iterable[str]): Optional fields to include, from ``OPTIONAL_FIELDS``.
+        tags (List[str]): Match courses tagged with any of these.
+        """
+        fields = set(fields)
+        sort_column, descending = SORTS[sort]
+        # The cursor carries the value as stored, so it compares exactly like the
+        # rows do (SQLite keeps func.now() timestamps without microseconds).
+        sort_key = type_coerce(sort_column, String)
+
+        is_enrolled = exists().where(
+            Enrollment.course_id == Course.id, Enrollment.user_id == user_id
+        )
+        columns = list(BASE_COLUMNS) + [
+            is_enrolled.label("is_enrolled"),
+            sort_key.label("sort_key"),
+        ]
+        columns += [
+            AGGREGATES[name]().label(name) for name in AGGREGATES if name in fields
+        ]
+
+        query = select(*columns)
+        if status is not None:
+            query = query.where(Course.status == status)
+        if category is not None:
+            query = query.where(Course.category == category)
+        if service_line_id is not None:
+            query = query.where(Course.service_line_id == service_line_id)
+        if difficulty_level is not None:
+            query = query.where(Course.difficulty_level == difficulty_level)
+        if tags:
+            # Tags are stored comma-separated; match whole entries so "java" skips "javascript"
+            tag_list = literal(",") + func.replace(Course.tags, ", ", ",") + ","
+            query = query.where(
+                or_(*[tag_list.contains(f",{tag.strip()},", autoescape=True) for tag in tags])
+            )
+
+        if cursor is not None:
+            after_key, after_id = decode_cursor(cursor)
+            if descending:
+                query = query.where(
+                    or_(
+                        sort_key < after_key,
+                        and_(sort_key == after_key, Course.id < after_id),
+                    )
+                )
+            else:
+                query = query.where(
+                    or_(
+                        sort_key > after_key,
+                        and_(sort_key == after_key, Course.id > after_id),
+                    )
+                )
+        if descending:
+            query = query.order_by(sort_column.desc(), Course.id.desc())
+        else:
+            query = query.order_by(sort_column.asc(), Course.id.asc())
+
+        rows = self.db.execute(query.limit(limit + 1)).mappings().all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        creators: Dict[int, UserSortDisplay] = {}
+        if "creator" in fields:
+            creator_ids = {row["created_by"] for row in rows if row["created_by"]}
+            if creator_ids:
+                creators = {
+                    user.id: UserSortDisplay.from_orm(user)
+                    for user in self.db.scalars(select(User).where(User.id.in_(creator_ids)))
+                }
+
+        items = []
+        for row in rows:
+            values = dict(row)
+            values.pop("sort_key")
+            if "creator" in fields:
+                values["creator"] = creators.get(row["created_by"])
+            items.append(CourseCatalogItem(**values))
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_cursor(last["sort_key"], last["id"])
+        return items, next_cursor
@@ -0,0 +1,326 @@
+"""
+Bulk creation and diff-and-apply editing of whole course trees (course,
+chapters, contents and questions).
+
+The editor loads the tree with one query per table, works out what a
+``CourseUpdate`` inserts, updates and deletes, and writes each of those sets
+with one bulk statement per table. New trees are inserted the same way, a
+table at a time with primary keys returned, however many courses are created.
+Nothing is committed here: the caller commits once, so a save or an import is
+applied entirely or not at all.
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import Chapter, Content, Course, Questions
+from schemas import CourseCreate, CourseUpdate
+
+COURSE_TREE_FIELDS = {"chapters", "questions"}
+NEW_COURSE_TREE_FIELDS = {"chapters"}
+CHAPTER_TREE_FIELDS = {"id", "contents", "questions"}
+
+
+class InvalidTreeUpdate(ValueError):
+    pass
+
+
+class CourseTree:
+    """Snapshot of the chapters, contents and questions of one course."""
+
+    def __init__(self, db: Session, course_id: int):
+        self.course_id = course_id
+        self.chapters: Dict[int, Chapter] = {
+            chapter.id: chapter
+            for chapter in db.scalars(select(Chapter).where(Chapter.course_id == course_id))
+        }
+        self.contents: Dict[int, Content] = {}
+        self.questions: Dict[int, Questions] = {}
+        if self.chapters:
+            self.contents = {
+                content.id: content
+                for content in db.scalars(
+                    select(Content).where(Content.chapter_id.in_(list(self.chapters)))
+                )
+            }
+        question_scope = Questions.course_id == course_id
+        if self.chapters:
+            question_scope = or_(
+                question_scope, Questions.chapter_id.in_(list(self.chapters))
+            )
+        self.questions = {
+            question.id: question
+            for question in db.scalars(select(Questions).where(question_scope))
+        }
+
+    def content_ids(self, chapter_id: int) -> set:
+        return {i for i, content in self.contents.items() if content.chapter_id == chapter_id}
+
+    def question_ids(self, chapter_id: int = None) -> set:
+        if chapter_id is None:
+            return {
+                i
+                for i, question in self.questions.items()
+                if question.chapter_id is None and question.course_id == self.course_id
+            }
+        return {i for i, question in self.questions.items() if question.chapter_id == chapter_id}
+
+
+class CourseTreeDiff:
+    """Rows to insert, update and delete, per table."""
+
+    def __init__(self):
+        self.new_chapters: List[dict] = []
+        # Contents and questions of new chapters, keyed by the chapter's position
+        # in ``new_chapters`` until its id is known.
+        self.new_chapter_contents: Dict[int, List[dict]] = {}
+        self.new_chapter_questions: Dict[int, List[dict]] = {}
+        self.new_contents: List[dict] = []
+        self.new_questions: List[dict] = []
+        self.chapter_updates: List[dict] = []
+        self.content_updates: List[dict] = []
+        self.question_updates: List[dict] = []
+        self.deleted_chapters: set = set()
+        self.deleted_contents: set = set()
+        self.deleted_questions: set = set()
+
+    def is_empty(self) -> bool:
+        return not any(vars(self).values())
+
+
+def _changes(item, exclude) -> dict:
+    return {
+        var: value
+        for var, value in item.model_dump(exclude=exclude).items()
+        if value is not None
+    }
+
+
+class CourseTreeEditor:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def diff(
+        self, tree: CourseTree, course_data: CourseUpdate, user_id: int
+    ) -> CourseTreeDiff:
+        """
+        Works out the writes that turn ``tree`` into ``course_data``.
+
+        Like the editor always did, an empty or missing ``chapters`` or course
+        ``questions`` list leaves that part of the tree alone, and ``None``
+        fields keep their current value. Ids that are not part of the course
+        raise ``InvalidTreeUpdate`` before anything is written.
+        """
+        diff = CourseTreeDiff()
+
+        if course_data.questions:
+            self._diff_questions(
+                diff,
+                tree,
+                course_data.questions,
+                tree.question_ids(),
+                dict(course_id=tree.course_id, added_by=user_id),
+            )
+
+        if course_data.chapters:
+            kept_chapter_ids = set()
+            for c in course_data.chapters:
+                if c.id is None:
+                    position = len(diff.new_chapters)
+                    diff.new_chapters.append(
+                        dict(_changes(c, CHAPTER_TREE_FIELDS), course_id=tree.course_id)
+                    )
+                    diff.new_chapter_contents[position] = [
+                        _changes(content, {"id"}) for content in c.contents or []
+                    ]
+                    diff.new_chapter_questions[position] = [
+                        dict(_changes(question, {"id"}), added_by=user_id)
+                        for question in c.questions or []
+                    ]
+                    continue
+
+                if c.id not in tree.chapters:
+                    raise InvalidTreeUpdate(f"Chapter {c.id} is not part of this course")
+                kept_chapter_ids.add(c.id)
+                changes = _changes(c, CHAPTER_TREE_FIELDS)
+                if changes:
+                    diff.chapter_updates.append(dict(changes, id=c.id))
+
+                if c.contents is not None:
+                    self._diff_contents(diff, tree, c.id, c.contents)
+                if c.questions is not None:
+                    self._diff_questions(
+                        diff,
+                        tree,
+                        c.questions,
+                        tree.question_ids(c.id),
+                        dict(chapter_id=c.id, added_by=user_id),
+                    )
+
+            diff.deleted_chapters = set(tree.chapters) - kept_chapter_ids
+            for chapter_id in diff.deleted_chapters:
+                diff.deleted_contents |= tree.content_ids(chapter_id)
+                diff.deleted_questions |= tree.question_ids(chapter_id)
+
+        return diff
+
+    def _diff_contents(self, diff: CourseTreeDiff, tree: CourseTree, chapter_id, contents):
+        existing_ids = tree.content_ids(chapter_id)
+        kept_ids = set()
+        for content in contents:
+            if content.id is None:
+                diff.new_contents.append(
+                    dict(_changes(content, {"id"}), chapter_id=chapter_id)
+                )
+                continue
+            if content.id not in existing_ids:
+                raise InvalidTreeUpdate(
+                    f"Content {content.id} is not part of chapter {chapter_id}"
+                )
+            kept_ids.add(content.id)
+            changes = _changes(content, {"id"})
+            if changes:
+                diff.content_updates.append(dict(changes, id=content.id))
+        diff.deleted_contents |= existing_ids - kept_ids
+
+    def _diff_questions(
+        self, diff: CourseTreeDiff, tree: CourseTree, questions, existing_ids, defaults
+    ):
+        kept_ids = set()
+        for question in questions:
+            if question.id is None:
+                diff.new_questions.append(
+                    dict(_changes(question, {"id"}), **defaults)
+                )
+                continue
+            if question.id not in existing_ids:
+                raise InvalidTreeUpdate(f"Question {question.id} is not part of this course")
+            kept_ids.add(question.id)
+            changes = _changes(question, {"id"})
+            if changes:
+                diff.question_updates.append(dict(changes, id=question.id))
+        diff.deleted_questions |= existing_ids - kept_ids
+
+    def apply(self, diff: CourseTreeDiff):
+        """Writes ``diff`` with one bulk statement per table and operation."""
+        db = self.db
+        # Children first so no statement trips a foreign key.
+        if diff.deleted_questions:
+            db.execute(
+                delete(Questions)
+                .where(Questions.id.in_(list(diff.deleted_questions)))
+                .execution_options(synchronize_session=False)
+            )
+        if diff.deleted_contents:
+            db.execute(
+                delete(Content)
+                .where(Content.id.in_(list(diff.deleted_contents)))
+                .execution_options(synchronize_session=False)
+            )
+        if diff.deleted_chapters:
+            db.execute(
+                delete(Chapter)
+                .where(Chapter.id.in_(list(diff.deleted_chapters)))
+                .execution_options(synchronize_session=False)
+            )
+
+        if diff.chapter_updates:
+            db.execute(update(Chapter), diff.chapter_updates)
+        if diff.content_updates:
+            db.execute(update(Content), diff.content_updates)
+        if diff.question_updates:
+            db.execute(update(Questions), diff.question_updates)
+
+        new_contents = list(diff.new_contents)
+        new_questions = list(diff.new_questions)
+        if diff.new_chapters:
+            chapter_ids = db.scalars(
+                insert(Chapter).returning(Chapter.id, sort_by_parameter_order=True),
+                diff.new_chapters,
+            ).all()
+            for position, chapter_id in enumerate(chapter_ids):
+                new_contents += [
+                    dict(values, chapter_id=chapter_id)
+                    for values in diff.new_chapter_contents[position]
+                ]
+                new_questions += [
+                    dict(values, chapter_id=chapter_id)
+                    for values in diff.new_chapter_questions[position]
+                ]
+        if new_contents:
+            db.execute(insert(Content), new_contents)
+        if new_questions:
+            db.execute(insert(Questions), new_questions)
+
+    def update(self, course: Course, course_data: CourseUpdate, user_id: int) -> CourseTreeDiff:
+        """
+        Applies an editor save to ``course`` and its tree, without committing.
+
+        Args:
+        course (Course): The course being edited.
+        course_data (CourseUpdate): The editor's copy of the course.
+        user_id (int): Recorded as ``added_by`` on new questions.
+
+        Returns:
+        CourseTreeDiff: The writes that were applied.
+        """
+        for var, value in course_data.model_dump(exclude=COURSE_TREE_FIELDS).items():
+            if value is not None:
+                setattr(course, var, value)
+
+        diff = self.diff(CourseTree(self.db, course.id), course_data, user_id)
+        self.db.flush()
+        self.apply(diff)
+        return diff
+
+    def create(
+        self,
+        courses: List[CourseCreate],
+        created_by: int,
+        service_line_id: Optional[str] = None,
+    ) -> List[int]:
+        """
+        Inserts new courses with their chapters and quiz questions, without committing.
+
+        Args:
+        courses (List[CourseCreate]): The courses to create.
+        created_by (int): The creator of every course, also recorded as ``added_by`` on the questions.
+        service_line_id (str): Used for courses that don't name a service line.
+
+        Returns:
+        List[int]: The new course ids, in the order of ``courses``.
+        """
+        course_rows = []
+        for course_data in courses:
+            values = course_data.model_dump(exclude=NEW_COURSE_TREE_FIELDS)
+            if values["service_line_id"] is None:
+                values["service_line_id"] = service_line_id
+            course_rows.append(dict(values, created_by=created_by))
+        course_ids = self.db.scalars(
+            insert(Course).returning(Course.id, sort_by_parameter_order=True),
+            course_rows,
+        ).all()
+
+        chapter_rows, chapter_quizzes = [], []
+        for course_id, course_data in zip(course_ids, courses):
+            for chapter_data in course_data.chapters:
+                chapter_rows.append(
+                    dict(chapter_data.model_dump(exclude={"quizzes"}), course_id=course_id)
+                )
+                chapter_quizzes.append(chapter_data.quizzes)
+        if not chapter_rows:
+            return course_ids
+        chapter_ids = self.db.scalars(
+            insert(Chapter).returning(Chapter.id, sort_by_parameter_order=True),
+            chapter_rows,
+        ).all()
+
+        question_rows = [
+            dict(quiz_data.model_dump(), chapter_id=chapter_id, added_by=created_by)
+            for chapter_id, quizzes in zip(chapter_ids, chapter_quizzes)
+            for quiz_data in quizzes
+        ]
+        if question_rows:
+            self.db.execute(insert(Questions), question_rows)
+        return course_ids
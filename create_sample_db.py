@@ -2,19 +2,12 @@ import uuid
 from datetime import datetime, timedelta, date
 
 from passlib.context import CryptContext
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
+from database import SessionLocal, engine  # Set LMS_DATABASE_URL to target another database
 from models import *
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-DATABASE_URL = "sqlite:///./lms.db"  # Update this to your actual database URL
-
-# Create the engine and session
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 # Create tables
 Base.metadata.create_all(bind=engine)
 
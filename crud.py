@@ -9,7 +9,10 @@ from schemas import UserCreate, UserUpdate
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import and_
 from typing import Dict, Any, List
-from passlib.context import CryptContext
+
+from enrollment_rollups import rebuild_enrollment_rollups
+from password_service import password_service
+from principal_cache import principal_cache
 
 
 def add_roles_if_not_exists(db: Session):
@@ -64,10 +67,12 @@ def update_user(db: Session, user_id: int, user: UserUpdate):
     db_user = db.query(User).filter(User.id == user_id).first()
     if db_user:
         try:
+            previous_email = db_user.email
             for var, value in user.dict().items():
                 if value:
                     setattr(db_user, var, value)
             db.commit()
+            principal_cache.invalidate(previous_email, db_user.email)
             db.refresh(db_user)
         except Exception as e:
             db.rollback()
@@ -85,7 +90,15 @@ def delete_user(db: Session, user_id: int) -> User:
     if db_user:
         try:
             # Remove or update related records
+            db.query(EnrollmentRollup).filter(
+                EnrollmentRollup.enrollment_id.in_(
+                    db.query(Enrollment.id).filter(Enrollment.user_id == user_id)
+                )
+            ).delete(synchronize_session=False)
             db.query(Enrollment).filter(Enrollment.user_id == user_id).delete()
+            db.query(LearningActivityMonthly).filter(
+                LearningActivityMonthly.user_id == user_id
+            ).delete(synchronize_session=False)
             db.query(Feedback).filter(Feedback.user_id == user_id).delete()
             db.query(association_table).filter(
                 association_table.c.user_id == user_id
@@ -100,8 +113,10 @@ def delete_user(db: Session, user_id: int) -> User:
             )
 
             # Now delete the user
+            email = db_user.email
             db.delete(db_user)
             db.commit()
+            principal_cache.invalidate(email)
         except Exception as e:
             db.rollback()
             raise e
@@ -113,10 +128,7 @@ def get_user_by_email(db: Session, email: str) -> Optional[Type[User]]:
 
 
 def create_user(db: Session, user: UserCreate) -> User:
-    from auth import get_password_hash
-
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    user.password = pwd_context.hash(user.password)
+    user.password = password_service.hash(user.password)
     db_user = User(**user.dict())
     db.add(db_user)
     db.commit()
@@ -147,6 +159,8 @@ def enroll_users(course_id: int, user_ids: list[int], db: Session) -> dict:
             db.add(enrollment)
 
     if new_enrollments:
+        db.flush()
+        rebuild_enrollment_rollups(db, enrollment_ids=[e.id for e in new_enrollments])
         db.commit()
     else:
         return {"message": "All users are already enrolled", "course_id": course_id}
@@ -1,16 +1,233 @@
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./lms_test.db"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+from config import (
+    DATABASE_URL,
+    DB_ECHO,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    QUERY_STATS_ENABLED,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE,
+    SQLITE_MMAP_SIZE,
 )
+from metrics import DB_POOL_CHECKED_OUT, DB_POOL_CHECKOUT_WAIT
+from query_stats import instrument_engine
+
+SQLALCHEMY_DATABASE_URL = DATABASE_URL
+
+
+class PoolStats:
+    """Running counters for connection checkouts from an engine's pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_hold_seconds = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.total_wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def record_checkin(self, held_seconds: float):
+        with self._lock:
+            self.checked_out -= 1
+            self.total_hold_seconds += held_seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "total_wait_seconds": self.total_wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+                "total_hold_seconds": self.total_hold_seconds,
+            }
+
+
+class _InstrumentedPoolMixin:
+    """Records how long each checkout waited for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.stats.record_wait(waited)
+            DB_POOL_CHECKOUT_WAIT.labels(self.metrics_label).observe(waited)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    metrics_label = "sync"
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.close()
+
+
+def _instrument_checkouts(engine):
+    stats = engine.pool.stats
+    checked_out = DB_POOL_CHECKED_OUT.labels(engine.pool.metrics_label)
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        stats.record_checkout()
+        checked_out.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            stats.record_checkin(time.perf_counter() - checked_out_at)
+            checked_out.dec()
+
+
+def _engine_options(url, queue_pool_class) -> dict:
+    backend = make_url(url).get_backend_name()
+    options = {"echo": DB_ECHO}
+    queue_pool = dict(
+        poolclass=queue_pool_class,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    if backend == "sqlite":
+        options["connect_args"] = {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT / 1000,
+        }
+        if make_url(url).database in (None, "", ":memory:"):
+            options["poolclass"] = StaticPool
+        else:
+            options.update(queue_pool)
+    elif backend == "postgresql":
+        options.update(queue_pool, pool_pre_ping=True)
+    else:
+        raise ValueError(f"Unsupported database backend: {backend}")
+    return options
+
+
+def _configure_engine(sync_engine):
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+    if isinstance(sync_engine.pool, _InstrumentedPoolMixin):
+        _instrument_checkouts(sync_engine)
+    if QUERY_STATS_ENABLED:
+        instrument_engine(sync_engine)
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, **kwargs):
+    """
+    Creates an engine for ``url`` with the pool settings from config.
+
+    SQLite files get a pragma-tuned, instrumented QueuePool (WAL journal so
+    readers don't block the writer); in-memory SQLite shares one connection.
+    PostgreSQL (``postgresql+psycopg2://...``) gets an instrumented QueuePool
+    with pre-ping and recycling. Keyword arguments override the defaults passed
+    to ``create_engine``.
+    """
+    options = _engine_options(url, InstrumentedQueuePool)
+    options.update(kwargs)
+    db_engine = create_engine(url, **options)
+    _configure_engine(db_engine)
+    return db_engine
+
+
+def async_database_url(url: str) -> str:
+    """Maps a sync database URL onto its async driver (aiosqlite / asyncpg)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if backend == "postgresql":
+        return url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    raise ValueError(f"Unsupported database backend: {backend}")
+
+
+def create_async_db_engine(url: str = SQLALCHEMY_DATABASE_URL, **kwargs):
+    """Async counterpart of ``create_db_engine``, with the same pool settings and pragmas."""
+    url = async_database_url(url)
+    options = _engine_options(url, InstrumentedAsyncQueuePool)
+    if make_url(url).get_backend_name() == "sqlite":
+        # aiosqlite runs each connection on its own thread already
+        options["connect_args"].pop("check_same_thread")
+    options.update(kwargs)
+    db_engine = create_async_engine(url, **options)
+    _configure_engine(db_engine.sync_engine)
+    return db_engine
+
+
+def pool_status(db_engine=None) -> dict:
+    """Returns the pool's current size and checkout counters."""
+    db_engine = db_engine or engine
+    status = {"pool": db_engine.pool.status()}
+    stats = getattr(db_engine.pool, "stats", None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+
+
+def dialect_insert(bind, table):
+    """Returns an INSERT for ``table`` that supports ``on_conflict_do_update`` on ``bind``'s dialect."""
+    if bind.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
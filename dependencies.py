@@ -1,4 +1,9 @@
-from database import SessionLocal
+from fastapi import Depends
+from sqlalchemy.orm import Session
+
+from compliance import TeamComplianceEngine
+from database import AsyncSessionLocal, SessionLocal
+from learning_hours import LearningHoursService
 
 
 def get_db():
@@ -7,3 +12,16 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_learning_hours_service(db: Session = Depends(get_db)) -> LearningHoursService:
+    return LearningHoursService(db)
+
+
+def get_team_compliance_engine(db: Session = Depends(get_db)) -> TeamComplianceEngine:
+    return TeamComplianceEngine(db)
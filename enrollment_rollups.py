@@ -0,0 +1,349 @@
+"""
+Materialized per-enrollment progress figures.
+
+``enrollment_rollups`` keeps one row per enrollment with the hours, counters and
+status that ``Enrollment`` used to recompute through correlated subqueries on
+every load. Rows are adjusted incrementally when progress and quiz completions
+are written, so whether a course is finished is read from one row
+(``record_content_completion``) rather than counted over its contents and
+questions. They can be resynced from the raw tables with:
+
+    python enrollment_rollups.py [--course-id ID ...] [--enrollment-id ID ...]
+
+None of the helpers here commit; callers own the transaction.
+"""
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, distinct, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import (
+    Certificate,
+    Chapter,
+    Content,
+    Enrollment,
+    EnrollmentRollup,
+    Progress,
+    Questions,
+    QuizCompletions,
+)
+
+# Keeps IN (...) lists well below SQLite's bound-parameter limit on full rebuilds.
+WRITE_BATCH_SIZE = 500
+
+# Same rules the computed Enrollment.status used before the rollup table existed.
+ROLLUP_STATUS = case(
+    (
+        and_(
+            EnrollmentRollup.completed_hours > 0,
+            EnrollmentRollup.completed_hours
+            < EnrollmentRollup.expected_time_to_complete,
+        ),
+        "Active",
+    ),
+    (
+        and_(
+            EnrollmentRollup.completed_hours
+            == EnrollmentRollup.expected_time_to_complete,
+            EnrollmentRollup.pending_question_count == 0,
+        ),
+        "Completed",
+    ),
+    else_="Pending",
+)
+
+
+def _enrollment_scope(
+    enrollment_ids: Optional[Iterable[int]] = None,
+    course_ids: Optional[Iterable[int]] = None,
+    missing_only: bool = False,
+):
+    scope = select(Enrollment.id)
+    if enrollment_ids is not None:
+        scope = scope.where(Enrollment.id.in_(list(enrollment_ids)))
+    if course_ids is not None:
+        scope = scope.where(Enrollment.course_id.in_(list(course_ids)))
+    if missing_only:
+        scope = scope.where(
+            Enrollment.id.not_in(select(EnrollmentRollup.enrollment_id))
+        )
+    # Never correlate: the scope is reused inside queries that join enrollments.
+    return scope.correlate(None)
+
+
+def refresh_rollup_status(db: Session, enrollment_ids: Iterable[int]):
+    db.execute(
+        update(EnrollmentRollup)
+        .where(EnrollmentRollup.enrollment_id.in_(list(enrollment_ids)))
+        .values(status=ROLLUP_STATUS)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild_enrollment_rollups(
+    db: Session,
+    enrollment_ids: Optional[Iterable[int]] = None,
+    course_ids: Optional[Iterable[int]] = None,
+    missing_only: bool = False,
+) -> int:
+    """
+    Recomputes rollup rows from progress, contents and quiz completions.
+
+    Args:
+    enrollment_ids (Iterable[int]): Limit the rebuild to these enrollments.
+    course_ids (Iterable[int]): Limit the rebuild to enrollments of these courses.
+    missing_only (bool): Only build rows for enrollments that have none yet.
+
+    Returns:
+    int: The number of rollup rows written.
+    """
+    scope = _enrollment_scope(enrollment_ids, course_ids, missing_only)
+    enrollments = db.execute(
+        select(Enrollment.id, Enrollment.course_id).where(Enrollment.id.in_(scope))
+    ).all()
+    if not enrollments:
+        return 0
+
+    course_scope = (
+        select(Enrollment.course_id).where(Enrollment.id.in_(scope)).correlate(None)
+    )
+
+    # Expected minutes and content count per course
+    course_totals = {
+        course_id: (expected, contents)
+        for course_id, expected, contents in db.execute(
+            select(
+                Chapter.course_id,
+                func.coalesce(func.sum(Content.expected_time_to_complete), 0),
+                func.count(Content.id),
+            )
+            .join(Content, Content.chapter_id == Chapter.id)
+            .where(Chapter.course_id.in_(course_scope))
+            .group_by(Chapter.course_id)
+        )
+    }
+    course_questions = dict(
+        db.execute(
+            select(Questions.course_id, func.count(Questions.id))
+            .where(Questions.course_id.in_(course_scope))
+            .group_by(Questions.course_id)
+        ).all()
+    )
+
+    completed_hours = dict(
+        db.execute(
+            select(
+                Progress.enrollment_id,
+                func.coalesce(func.sum(Content.expected_time_to_complete), 0),
+            )
+            .join(Content, Content.id == Progress.content_id)
+            .where(Progress.enrollment_id.in_(scope))
+            .group_by(Progress.enrollment_id)
+        ).all()
+    )
+    completed_contents = dict(
+        db.execute(
+            select(Progress.enrollment_id, func.count(distinct(Content.id)))
+            .join(Content, Content.id == Progress.content_id)
+            .join(Chapter, Chapter.id == Content.chapter_id)
+            .join(Enrollment, Enrollment.id == Progress.enrollment_id)
+            .where(
+                Progress.enrollment_id.in_(scope),
+                Chapter.course_id == Enrollment.course_id,
+            )
+            .group_by(Progress.enrollment_id)
+        ).all()
+    )
+    answered_questions = dict(
+        db.execute(
+            select(
+                QuizCompletions.enrollment_id,
+                func.count(distinct(QuizCompletions.question_id)),
+            )
+            .join(Questions, Questions.id == QuizCompletions.question_id)
+            .join(Enrollment, Enrollment.id == QuizCompletions.enrollment_id)
+            .where(
+                QuizCompletions.enrollment_id.in_(scope),
+                QuizCompletions.correct_answer == True,
+                Questions.course_id == Enrollment.course_id,
+            )
+            .group_by(QuizCompletions.enrollment_id)
+        ).all()
+    )
+
+    rows = []
+    for enrollment_id, course_id in enrollments:
+        expected, total_contents = course_totals.get(course_id, (0, 0))
+        done_contents = completed_contents.get(enrollment_id, 0)
+        rows.append(
+            {
+                "enrollment_id": enrollment_id,
+                "expected_time_to_complete": expected,
+                "completed_hours": completed_hours.get(enrollment_id, 0),
+                "completed_content_count": done_contents,
+                "remaining_content_count": total_contents - done_contents,
+                "pending_question_count": course_questions.get(course_id, 0)
+                - answered_questions.get(enrollment_id, 0),
+            }
+        )
+
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        batch = rows[start:start + WRITE_BATCH_SIZE]
+        batch_ids = [row["enrollment_id"] for row in batch]
+        db.execute(
+            delete(EnrollmentRollup)
+            .where(EnrollmentRollup.enrollment_id.in_(batch_ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(insert(EnrollmentRollup), batch)
+        refresh_rollup_status(db, batch_ids)
+    return len(rows)
+
+
+def refresh_course_rollups(db: Session, course_id: int) -> int:
+    """Resyncs every enrollment of a course after its chapters, contents or questions changed."""
+    return rebuild_enrollment_rollups(db, course_ids=[course_id])
+
+
+def rollup_counts(db: Session, enrollment_id: int) -> Tuple[int, int]:
+    """The enrollment's remaining content and pending question counts, building its row if missing."""
+    counts = db.execute(
+        select(
+            EnrollmentRollup.remaining_content_count,
+            EnrollmentRollup.pending_question_count,
+        ).where(EnrollmentRollup.enrollment_id == enrollment_id)
+    ).first()
+    if counts is None:
+        rebuild_enrollment_rollups(db, enrollment_ids=[enrollment_id])
+        return rollup_counts(db, enrollment_id)
+    return tuple(counts)
+
+
+def apply_progress(db: Session, enrollment_id: int, content_id: int) -> Tuple[int, int]:
+    """
+    Accounts for a newly inserted progress row of ``content_id``.
+
+    Returns:
+    Tuple[int, int]: The enrollment's remaining content and pending question counts afterwards.
+    """
+    hours = (
+        select(Content.expected_time_to_complete)
+        .where(Content.id == content_id)
+        .scalar_subquery()
+    )
+    counts = db.execute(
+        update(EnrollmentRollup)
+        .where(EnrollmentRollup.enrollment_id == enrollment_id)
+        .values(
+            completed_hours=EnrollmentRollup.completed_hours + func.coalesce(hours, 0),
+            completed_content_count=EnrollmentRollup.completed_content_count + 1,
+            remaining_content_count=EnrollmentRollup.remaining_content_count - 1,
+        )
+        .returning(
+            EnrollmentRollup.remaining_content_count,
+            EnrollmentRollup.pending_question_count,
+        )
+        .execution_options(synchronize_session=False)
+    ).first()
+    if counts is None:
+        # Enrollment predates the rollup table; build its row from scratch.
+        rebuild_enrollment_rollups(db, enrollment_ids=[enrollment_id])
+        return rollup_counts(db, enrollment_id)
+    refresh_rollup_status(db, [enrollment_id])
+    return tuple(counts)
+
+
+def record_content_completion(
+    db: Session,
+    enrollment_id: int,
+    chapter_id: int,
+    content_id: int,
+    completed_at: datetime,
+) -> Tuple[Optional[datetime], int, int]:
+    """
+    Records that an enrollment completed a content, or re-marks it, and adjusts
+    the rollup on the first completion.
+
+    Returns:
+    Tuple[Optional[datetime], int, int]: When the content had been completed
+    before (None on the first completion), then the enrollment's remaining
+    content and pending question counts.
+    """
+    # The unique (enrollment_id, content_id) constraint decides whether this is the first completion
+    inserted = db.scalar(
+        dialect_insert(db.get_bind(), Progress.__table__)
+        .values(
+            enrollment_id=enrollment_id,
+            chapter_id=chapter_id,
+            content_id=content_id,
+            completed_at=completed_at,
+        )
+        .on_conflict_do_nothing(index_elements=["enrollment_id", "content_id"])
+        .returning(Progress.__table__.c.id)
+    )
+    if inserted is not None:
+        return (None, *apply_progress(db, enrollment_id, content_id))
+
+    progress = and_(Progress.enrollment_id == enrollment_id, Progress.content_id == content_id)
+    previous_completed_at = db.scalar(select(Progress.completed_at).where(progress))
+    db.execute(
+        update(Progress)
+        .where(progress)
+        .values(completed_at=completed_at)
+        .execution_options(synchronize_session=False)
+    )
+    return (previous_completed_at, *rollup_counts(db, enrollment_id))
+
+
+def issue_certificate(db: Session, user_id: int, course_id: int, issued_at: datetime) -> bool:
+    """Adds the user's certificate for the course unless it exists; returns whether it was added."""
+    result = db.execute(
+        dialect_insert(db.get_bind(), Certificate.__table__)
+        .values(user_id=user_id, course_id=course_id, issue_date=issued_at)
+        .on_conflict_do_nothing()
+    )
+    return result.rowcount == 1
+
+
+def apply_quiz_completion(db: Session, enrollment_id: int, count: int = 1):
+    """Accounts for the first correct answers to ``count`` of the course's questions."""
+    result = db.execute(
+        update(EnrollmentRollup)
+        .where(EnrollmentRollup.enrollment_id == enrollment_id)
+        .values(
+            pending_question_count=EnrollmentRollup.pending_question_count - count
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        rebuild_enrollment_rollups(db, enrollment_ids=[enrollment_id])
+        return
+    refresh_rollup_status(db, [enrollment_id])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(
+        description="Rebuild enrollment_rollups from progress and quiz completions."
+    )
+    parser.add_argument("--course-id", type=int, action="append", dest="course_ids")
+    parser.add_argument(
+        "--enrollment-id", type=int, action="append", dest="enrollment_ids"
+    )
+    args = parser.parse_args()
+
+    EnrollmentRollup.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        count = rebuild_enrollment_rollups(
+            db, enrollment_ids=args.enrollment_ids, course_ids=args.course_ids
+        )
+        db.commit()
+        print(f"Rebuilt {count} enrollment rollups")
+    finally:
+        db.close()
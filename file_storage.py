@@ -1,58 +1,115 @@
+"""
+Storage for uploaded files.
+
+In content-addressed mode (the default, ``LMS_FILE_STORAGE_CONTENT_ADDRESSED``)
+an upload is streamed through SHA-256 and its bytes are kept once, under
+``blobs/`` by hash, however many ``File`` rows share them. ``file_blobs`` counts
+the referencing rows and ``collect_garbage`` removes blobs nobody references,
+along with cached image variants (see ``image_variants``) of deleted files:
+
+    python file_storage.py gc [--grace-seconds N]
+"""
+import hashlib
 import os
+import tempfile
+import time
 import uuid
-from typing import Optional, Type
+from datetime import datetime, timedelta
+from typing import BinaryIO, Mapping, Optional, Type
 
 from fastapi import UploadFile, HTTPException
-from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, func, select, union_all, update
 from sqlalchemy.orm import Session
 
-from models import File
+from config import FILE_STORAGE_CONTENT_ADDRESSED, FILE_STORAGE_GC_GRACE_SECONDS, UPLOAD_SESSION_TTL_SECONDS
+from database import dialect_insert
+from file_streaming import RangeFileResponse
+from models import Chapter, Content, Course, ExternalCertification, File, FileBlob, UploadSession, User
+
+CHUNK_SIZE = 1024 * 1024
+
+ALLOWED_TYPES = {'application/vnd.ms-powerpoint.addin.macroEnabled.12',
+                 'application/vnd.ms-word.document.macroEnabled.12',
+                 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+                 'application/msword', 'application/vnd.openxmlformats-officedocument.presentationml.template',
+                 'application/vnd.ms-access',
+                 'application/vnd.openxmlformats-officedocument.spreadsheetml.template',
+                 'application/vnd.openxmlformats-officedocument.wordprocessingml.template',
+                 'application/vnd.ms-excel.addin.macroEnabled.12',
+                 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                 'application/vnd.openxmlformats-officedocument.presentationml.slideshow',
+                 'application/vnd.ms-powerpoint.slideshow.macroEnabled.12',
+                 'application/vnd.ms-word.template.macroEnabled.12',
+                 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+                 'application/vnd.ms-powerpoint.template.macroEnabled.12',
+                 'application/vnd.ms-excel.sheet.macroEnabled.12',
+                 'application/vnd.ms-powerpoint.presentation.macroEnabled.12', 'application/vnd.ms-powerpoint',
+                 'application/vnd.ms-excel', 'application/vnd.ms-excel.template.macroEnabled.12',
+                 'application/vnd.ms-excel.sheet.binary.macroEnabled.12',
+                 'video/mp4',
+                 'application/pdf',
+                 'application/msword',
+                 'audio/mpeg',
+                 'image/jpeg',
+                 'image/png',
+                 'image/gif'
+                 }
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def owned_file_ids(user_id: int):
+    """
+    IDs of the files ``user_id`` owns: their profile picture, their external
+    certificates and resumable uploads, and the thumbnails and contents of the
+    courses they created.
+    """
+    return union_all(
+        select(User.dp_file_id).where(User.id == user_id),
+        select(ExternalCertification.file_id).where(ExternalCertification.uploaded_by_id == user_id),
+        select(UploadSession.file_id).where(UploadSession.created_by == user_id),
+        select(Course.thumbnail_file_id).where(Course.created_by == user_id),
+        select(Content.file_id)
+        .join(Chapter, Chapter.id == Content.chapter_id)
+        .join(Course, Course.id == Chapter.course_id)
+        .where(Course.created_by == user_id),
+    )
 
 
 class FileStorage:
-    def __init__(self, directory: str = "file_storage"):
+    def __init__(self, directory: str = "file_storage", content_addressed: bool = FILE_STORAGE_CONTENT_ADDRESSED):
         self.directory = directory
+        self.content_addressed = content_addressed
+        self.blob_directory = os.path.join(directory, "blobs")
+        self.tmp_directory = os.path.join(directory, "tmp")
+        self.upload_directory = os.path.join(directory, "uploads")
+        self.variant_directory = os.path.join(directory, "variants")
         os.makedirs(directory, exist_ok=True)
+        os.makedirs(self.upload_directory, exist_ok=True)
+        os.makedirs(self.tmp_directory, exist_ok=True)
+        if content_addressed:
+            os.makedirs(self.blob_directory, exist_ok=True)
 
     def save_file(self, file: UploadFile, db: Session, type='Course content') -> File:
         content_type = file.content_type
-        allowed_types = {'application/vnd.ms-powerpoint.addin.macroEnabled.12',
-                         'application/vnd.ms-word.document.macroEnabled.12',
-                         'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-                         'application/msword', 'application/vnd.openxmlformats-officedocument.presentationml.template',
-                         'application/vnd.ms-access',
-                         'application/vnd.openxmlformats-officedocument.spreadsheetml.template',
-                         'application/vnd.openxmlformats-officedocument.wordprocessingml.template',
-                         'application/vnd.ms-excel.addin.macroEnabled.12',
-                         'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                         'application/vnd.openxmlformats-officedocument.presentationml.slideshow',
-                         'application/vnd.ms-powerpoint.slideshow.macroEnabled.12',
-                         'application/vnd.ms-word.template.macroEnabled.12',
-                         'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                         'application/vnd.ms-powerpoint.template.macroEnabled.12',
-                         'application/vnd.ms-excel.sheet.macroEnabled.12',
-                         'application/vnd.ms-powerpoint.presentation.macroEnabled.12', 'application/vnd.ms-powerpoint',
-                         'application/vnd.ms-excel', 'application/vnd.ms-excel.template.macroEnabled.12',
-                         'application/vnd.ms-excel.sheet.binary.macroEnabled.12',
-                         'video/mp4',
-                         'application/pdf',
-                         'application/msword',
-                         'audio/mpeg',
-                         'image/jpeg',
-                         'image/png',
-                         'image/gif'
-                         }
-
-        if content_type not in allowed_types:
+        if content_type not in ALLOWED_TYPES:
             raise ValueError("Unsupported file type.")
 
         file_id = str(uuid.uuid4())
         file_extension = file.filename.split('.')[-1]
-        file_path = os.path.join(self.directory, f"{file_id}.{file_extension}")
-
-        with open(file_path, "wb") as buffer:
-            for chunk in file.file:
-                buffer.write(chunk)
+        if self.content_addressed:
+            file_path = self.store_blob(file.file, file_extension, db).path
+        else:
+            file_path = os.path.join(self.directory, f"{file_id}.{file_extension}")
+            with open(file_path, "wb") as buffer:
+                for chunk in iter(lambda: file.file.read(CHUNK_SIZE), b""):
+                    buffer.write(chunk)
 
         file_metadata = File(
             FileID=file_id,
@@ -66,47 +123,268 @@ class FileStorage:
         db.refresh(file_metadata)
         return file_metadata
 
+    def save_existing_blob(self, sha256: str, filename: str, content_type: str, db: Session,
+                           owner_id: int, type='Course content') -> Optional[File]:
+        """
+        Creates a File for bytes that are already stored, without uploading them again.
+
+        Only blobs behind one of ``owner_id``'s files (see ``owned_file_ids``) can be
+        reused, so knowing a hash is not enough to obtain someone else's file.
+        Returns None when the user owns no blob with this hash; the client then
+        uploads the file normally.
+        """
+        if content_type not in ALLOWED_TYPES:
+            raise ValueError("Unsupported file type.")
+        blob = self._reference_existing_blob(db, sha256.lower(), owner_id)
+        if blob is None:
+            return None
+
+        file_metadata = File(
+            FileID=str(uuid.uuid4()),
+            FileName=filename,
+            FileType=content_type,
+            FilePath=blob.path,
+            type=type
+        )
+        db.add(file_metadata)
+        db.commit()
+        db.refresh(file_metadata)
+        return file_metadata
+
+    def save_spooled_file(self, spool_path: str, filename: str, content_type: str, db: Session,
+                          type='Course content', sha256: Optional[str] = None) -> File:
+        """``add_spooled_file`` and commit; the spool file is removed if it is rejected."""
+        try:
+            file_metadata = self.add_spooled_file(spool_path, filename, content_type, db, type=type, sha256=sha256)
+        except ValueError:
+            os.remove(spool_path)
+            raise
+        db.commit()
+        db.refresh(file_metadata)
+        return file_metadata
+
+    def blob_path(self, sha256: str, extension: str) -> str:
+        return os.path.join(self.blob_directory, sha256[:2], f"{sha256}.{extension}")
+
+    def store_blob(self, stream: BinaryIO, extension: str, db: Session) -> FileBlob:
+        """
+        Streams ``stream`` into the blob store and takes a reference on its blob, without committing.
+
+        The bytes are hashed while they are spooled to a temporary file, which
+        becomes the blob only if no copy of the content is stored yet.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.tmp_directory, delete=False) as buffer:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                size += len(chunk)
+                buffer.write(chunk)
+        return self._adopt_blob(db, buffer.name, digest.hexdigest(), size, extension)
+
+    def _adopt_blob(self, db: Session, spool_path: str, sha256: str, size: int, extension: str) -> FileBlob:
+        # Takes a reference on the blob and keeps the spooled copy only if the blob has none yet
+        insert_blob = dialect_insert(db.get_bind(), FileBlob.__table__).values(
+            sha256=sha256, path=self.blob_path(sha256, extension), size=size, ref_count=1
+        )
+        blob_path = db.execute(
+            insert_blob.on_conflict_do_update(
+                index_elements=[FileBlob.sha256],
+                set_={"ref_count": FileBlob.ref_count + 1, "updated_at": func.now()},
+            ).returning(FileBlob.path)
+        ).scalar_one()
+
+        if os.path.exists(blob_path):
+            os.remove(spool_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(spool_path, blob_path)
+        return FileBlob(sha256=sha256, path=blob_path, size=size)
+
+    def add_spooled_file(self, spool_path: str, filename: str, content_type: str, db: Session,
+                         type='Course content', sha256: Optional[str] = None) -> File:
+        """
+        Moves a completely received file into storage and adds its File row, without committing.
+
+        Args:
+        spool_path (str): The received file; it is moved (or removed, when its content is already stored).
+        sha256 (str): Digest of the file, when the caller already computed it.
+        """
+        if content_type not in ALLOWED_TYPES:
+            raise ValueError("Unsupported file type.")
+
+        file_id = str(uuid.uuid4())
+        file_extension = filename.split('.')[-1]
+        if self.content_addressed:
+            if sha256 is None:
+                sha256 = file_sha256(spool_path)
+            size = os.path.getsize(spool_path)
+            file_path = self._adopt_blob(db, spool_path, sha256, size, file_extension).path
+        else:
+            file_path = os.path.join(self.directory, f"{file_id}.{file_extension}")
+            os.replace(spool_path, file_path)
+
+        file_metadata = File(
+            FileID=file_id,
+            FileName=filename,
+            FileType=content_type,
+            FilePath=file_path,
+            type=type
+        )
+        db.add(file_metadata)
+        return file_metadata
+
+    def _reference_existing_blob(self, db: Session, sha256: str, owner_id: int) -> Optional[FileBlob]:
+        # Looked up first so a miss changes nothing in the caller's transaction
+        blob = db.execute(
+            select(FileBlob.path)
+            .join(File, File.FilePath == FileBlob.path)
+            .where(FileBlob.sha256 == sha256, File.FileID.in_(owned_file_ids(owner_id)))
+            .limit(1)
+        ).first()
+        if blob is None or not os.path.exists(blob.path):
+            return None
+        blob = db.execute(
+            update(FileBlob)
+            .where(FileBlob.sha256 == sha256)
+            .values(ref_count=FileBlob.ref_count + 1, updated_at=func.now())
+            .returning(FileBlob.sha256, FileBlob.path, FileBlob.size)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if blob is None:
+            return None
+        return FileBlob(sha256=blob.sha256, path=blob.path, size=blob.size)
+
+    def collect_garbage(self, db: Session, grace_seconds: int = FILE_STORAGE_GC_GRACE_SECONDS) -> int:
+        """
+        Removes blobs that no File references any more, and returns how many were removed.
+
+        Reference counts are first resynced from ``files``. Blobs, spooled uploads and
+        stray blob files younger than ``grace_seconds`` are kept, so uploads that are
+        still in flight are never collected. Expired resumable uploads are dropped too.
+        """
+        referencing = (
+            select(func.count())
+            .select_from(File)
+            .where(File.FilePath == FileBlob.path)
+            .correlate(FileBlob)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(FileBlob)
+            .values(ref_count=referencing)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        unreferenced = db.execute(
+            select(FileBlob.sha256, FileBlob.path).where(
+                FileBlob.ref_count <= 0, FileBlob.updated_at < cutoff
+            )
+        ).all()
+        removed = 0
+        for sha256, blob_path in unreferenced:
+            # The row stays locked until the file is gone, so a concurrent upload
+            # of the same bytes waits and then stores a fresh copy.
+            deleted = db.execute(
+                delete(FileBlob)
+                .where(FileBlob.sha256 == sha256, FileBlob.ref_count <= 0)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if deleted and os.path.exists(blob_path):
+                os.remove(blob_path)
+            db.commit()
+            removed += deleted
+
+        self.expire_upload_sessions(db)
+        self.collect_variants(db)
+        if not os.path.isdir(self.tmp_directory):
+            return removed
+        known_paths = set(db.scalars(select(FileBlob.path)))
+        expired = time.time() - grace_seconds
+        for root, _, names in os.walk(self.blob_directory):
+            for name in names:
+                path = os.path.join(root, name)
+                if path not in known_paths and os.path.getmtime(path) < expired:
+                    os.remove(path)
+        for name in os.listdir(self.tmp_directory):
+            path = os.path.join(self.tmp_directory, name)
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+        return removed
+
     def get_file_metadata(self, file_id: str, db: Session) -> Type[File]:
         file_metadata = db.query(File).filter(File.FileID == file_id).first()
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found.")
         return file_metadata
 
-    def download_file(self, file_path: str, start: int = 0, end: Optional[int] = None):
-        file_size = os.path.getsize(file_path)
-        if end is None:
-            end = file_size - 1
-
-        def iterfile():
-            with open(file_path, "rb") as file:
-                file.seek(start)
-                bytes_to_read = (end - start) + 1 if end else None
-                while bytes_to_read is None or bytes_to_read > 0:
-                    chunk = file.read(min(4096, bytes_to_read) if bytes_to_read else 4096)
-                    if not chunk:
-                        break
-                    if bytes_to_read:
-                        bytes_to_read -= len(chunk)
-                    yield chunk
-
-        return iterfile(), file_size
-
-    def get_streaming_response(self, file_id: str, db: Session, range_header: Optional[str]) -> StreamingResponse:
+    def variant_path(self, file_id: str, name: str) -> str:
+        return os.path.join(self.variant_directory, file_id[:2], f"{file_id}-{name}")
+
+    def collect_variants(self, db: Session) -> int:
+        """Removes cached variants of files that no longer exist."""
+        if not os.path.isdir(self.variant_directory):
+            return 0
+        file_ids = set(db.scalars(select(File.FileID)))
+        removed = 0
+        for root, _, names in os.walk(self.variant_directory):
+            for name in names:
+                if name.rsplit("-", 1)[0] not in file_ids:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        return removed
+
+    def upload_part_path(self, upload_id: str) -> str:
+        return os.path.join(self.upload_directory, f"{upload_id}.part")
+
+    def expire_upload_sessions(self, db: Session, ttl_seconds: int = UPLOAD_SESSION_TTL_SECONDS) -> int:
+        """Drops upload sessions idle for longer than ``ttl_seconds`` with their part files."""
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+        expired_ids = db.scalars(
+            delete(UploadSession)
+            .where(UploadSession.updated_at < cutoff)
+            .returning(UploadSession.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        live_parts = {f"{upload_id}.part" for upload_id in db.scalars(select(UploadSession.id))}
+        expired = time.time() - ttl_seconds
+        for name in os.listdir(self.upload_directory):
+            path = os.path.join(self.upload_directory, name)
+            if name not in live_parts and os.path.getmtime(path) < expired:
+                os.remove(path)
+        return len(expired_ids)
+
+    def get_streaming_response(self, file_id: str, db: Session, request_headers: Mapping[str, str]) -> RangeFileResponse:
+        """Serves a stored file with Range, If-Range, If-None-Match and If-Modified-Since support."""
         file_metadata = self.get_file_metadata(file_id, db)
         file_path = file_metadata.FilePath
+        etag = None
+        if os.path.dirname(os.path.dirname(file_path)) == self.blob_directory:
+            # Blobs are named by their SHA-256, which makes a stable strong validator
+            etag = os.path.basename(file_path).split('.')[0]
+        try:
+            return RangeFileResponse(file_path, request_headers, media_type=file_metadata.FileType, etag=etag)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Maintain the uploaded file store.")
+    parser.add_argument("command", choices=["gc"])
+    parser.add_argument("--grace-seconds", type=int, default=FILE_STORAGE_GC_GRACE_SECONDS)
+    args = parser.parse_args()
 
-        start, end = 0, None
-        if range_header:
-            range_header = range_header.strip().lower().replace("bytes=", "")
-            start, end = map(lambda x: int(x) if x else None, range_header.split("-"))
-
-        chunks, file_size = self.download_file(file_path, start=start, end=end)
-        end = file_size - 1 if end is None else end
-
-        headers = {
-            'Content-Range': f'bytes {start}-{end}/{file_size}',
-            'Accept-Ranges': 'bytes',
-            'Content-Length': str(end - start + 1),
-            'Content-Type': file_metadata.FileType
-        }
-        return StreamingResponse(chunks, headers=headers, status_code=206)
+    FileBlob.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        count = FileStorage(content_addressed=True).collect_garbage(db, args.grace_seconds)
+        print(f"Removed {count} unreferenced blobs")
+    finally:
+        db.close()
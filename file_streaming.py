@@ -0,0 +1,251 @@
+"""
+HTTP range streaming of stored files (course videos, decks).
+
+``RangeFileResponse`` answers with 200, 206 (one range, or several as
+``multipart/byteranges``), 304 for matching ``If-None-Match`` /
+``If-Modified-Since``, and 416 for unsatisfiable ranges. The body goes through
+the ASGI ``http.response.zerocopysend`` extension (``os.sendfile`` in the
+server) when the server offers it; otherwise it is read with ``os.pread`` in a
+worker thread, in chunks that grow from ``MIN_CHUNK_SIZE`` to ``MAX_CHUNK_SIZE``
+so playback starts quickly and long transfers make few round trips.
+"""
+import os
+import stat
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Mapping, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from metrics import FILE_BYTES_SENT
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+# More ranges than this in one request are answered with the whole file
+MAX_RANGES = 16
+
+ZERO_COPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parses a ``Range: bytes=...`` header into sorted, merged (start, end) pairs, end inclusive.
+
+    Handles ``a-b``, open-ended ``a-`` and suffix ``-n`` ranges. Returns None when
+    the header is absent, malformed or asks for too many ranges, in which case the
+    whole file is sent. Raises ``RangeNotSatisfiable`` when no range overlaps the file.
+    """
+    if not range_header:
+        return None
+    unit, _, specs = range_header.strip().partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or not (first or last):
+            return None
+        if (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if not first:
+            # Suffix range: the last ``last`` bytes
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            end = int(last) if last else size - 1
+            ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        raise RangeNotSatisfiable(range_header)
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since
+
+
+class RangeFileResponse(Response):
+    def __init__(
+        self,
+        path: str,
+        request_headers: Mapping[str, str],
+        media_type: Optional[str] = None,
+        etag: Optional[str] = None,
+        stat_result: Optional[os.stat_result] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ):
+        """
+        Args:
+        path (str): The file to send.
+        request_headers (Mapping[str, str]): Headers of the request, for Range and the conditionals.
+        media_type (str): Content-Type of the file.
+        etag (str): Strong validator, unquoted; defaults to one made of mtime and size.
+        headers (Mapping[str, str]): Extra response headers, e.g. Cache-Control.
+        """
+        self.path = path
+        self.media_type = media_type or "application/octet-stream"
+        self.background = None
+        stat_result = stat_result or os.stat(path)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise FileNotFoundError(path)
+        self.size = stat_result.st_size
+        self.etag = f'"{etag or f"{stat_result.st_mtime_ns:x}-{self.size:x}"}"'
+
+        self.ranges: Optional[List[Tuple[int, int]]] = None
+        self.boundary = None
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": self.etag,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            **{name.lower(): value for name, value in (headers or {}).items()},
+        }
+
+        if_none_match = request_headers.get("if-none-match")
+        if_modified_since = request_headers.get("if-modified-since")
+        if (if_none_match and _etag_matches(if_none_match, self.etag)) or (
+            not if_none_match
+            and if_modified_since
+            and _not_modified_since(if_modified_since, stat_result.st_mtime)
+        ):
+            self.status_code = 304
+            self._init(headers, content_length=None)
+            return
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and if_range and not self._if_range_holds(if_range, stat_result.st_mtime):
+            range_header = None
+
+        try:
+            self.ranges = parse_range_header(range_header, self.size)
+        except RangeNotSatisfiable:
+            self.status_code = 416
+            headers["content-range"] = f"bytes */{self.size}"
+            self._init(headers, content_length=0)
+            return
+
+        if self.ranges is None:
+            self.status_code = 200
+            headers["content-type"] = self.media_type
+            self._init(headers, content_length=self.size)
+        elif len(self.ranges) == 1:
+            start, end = self.ranges[0]
+            self.status_code = 206
+            headers["content-type"] = self.media_type
+            headers["content-range"] = f"bytes {start}-{end}/{self.size}"
+            self._init(headers, content_length=end - start + 1)
+        else:
+            self.status_code = 206
+            self.boundary = uuid.uuid4().hex
+            headers["content-type"] = f"multipart/byteranges; boundary={self.boundary}"
+            length = sum(
+                len(self._part_header(start, end)) + (end - start + 1) + 2
+                for start, end in self.ranges
+            )
+            self._init(headers, content_length=length + len(self._closing_boundary()))
+
+    def _if_range_holds(self, if_range: str, mtime: float) -> bool:
+        if_range = if_range.strip()
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            return if_range == self.etag
+        return _not_modified_since(if_range, mtime)
+
+    def _init(self, headers: dict, content_length: Optional[int]):
+        if content_length is not None:
+            headers["content-length"] = str(content_length)
+        self.raw_headers = [
+            (name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()
+        ]
+
+    def _part_header(self, start: int, end: int) -> bytes:
+        return (
+            f"--{self.boundary}\r\n"
+            f"Content-Type: {self.media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n"
+        ).encode("latin-1")
+
+    def _closing_boundary(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send(
+            {"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers}
+        )
+        if scope.get("method") == "HEAD" or self.status_code in (304, 416):
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zero_copy = ZERO_COPY_EXTENSION in scope.get("extensions", {})
+        ranges = self.ranges or [(0, self.size - 1)]
+        with open(self.path, "rb") as file:
+            for start, end in ranges:
+                if self.boundary:
+                    await send(
+                        {"type": "http.response.body", "body": self._part_header(start, end), "more_body": True}
+                    )
+                if zero_copy:
+                    await send(
+                        {
+                            "type": ZERO_COPY_EXTENSION,
+                            "file": file,
+                            "offset": start,
+                            "count": end - start + 1,
+                            "more_body": True,
+                        }
+                    )
+                    FILE_BYTES_SENT.labels("zerocopy").inc(end - start + 1)
+                else:
+                    await self._send_chunks(send, file.fileno(), start, end)
+                if self.boundary:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+            closing = self._closing_boundary() if self.boundary else b""
+            await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+    async def _send_chunks(self, send: Send, fd: int, start: int, end: int):
+        chunk_size = MIN_CHUNK_SIZE
+        offset = start
+        while offset <= end:
+            count = min(chunk_size, end - offset + 1)
+            chunk = await anyio.to_thread.run_sync(os.pread, fd, count, offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            FILE_BYTES_SENT.labels("read").inc(len(chunk))
+            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
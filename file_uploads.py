@@ -0,0 +1,297 @@
+"""
+Resumable, chunked uploads: ``create_upload`` -> ``append_chunk`` ... -> ``finalize_upload``.
+
+Chunks are appended to a part file with non-blocking writes at the offset the
+session has recorded, so a dropped connection resumes from the last stored
+byte instead of from zero. A request claims the session (status ``writing``)
+before it touches the part file, so concurrent PUTs never overwrite or truncate
+each other's bytes. The claim is a lease on ``updated_at``, renewed while a
+long chunk streams; one left behind by a killed worker is taken over after
+``LMS_UPLOAD_LOCK_TIMEOUT_SECONDS``, and the session resumes from the bytes
+actually on disk. Each chunk can carry its own SHA-256 and the whole
+file is checked against the digest given at creation. Finalizing moves the part
+file into ``FileStorage`` and creates the ``File`` row in the same commit that
+completes the session.
+"""
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import UPLOAD_LOCK_TIMEOUT_SECONDS, UPLOAD_MAX_CHUNK_SIZE, UPLOAD_MAX_SIZE
+from file_storage import ALLOWED_TYPES, CHUNK_SIZE, FileStorage
+from models import UploadSession
+from schemas import UploadSessionCreate
+
+
+def _conflict(upload: UploadSession, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=detail,
+        headers={"Upload-Offset": str(upload.received_size)},
+    )
+
+
+async def create_upload(
+    db: AsyncSession, storage: FileStorage, user_id: int, upload_data: UploadSessionCreate
+) -> UploadSession:
+    if upload_data.content_type not in ALLOWED_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported file type.")
+    if upload_data.size > UPLOAD_MAX_SIZE:
+        raise HTTPException(status_code=413, detail="File is too large.")
+
+    upload = UploadSession(
+        id=str(uuid.uuid4()),
+        created_by=user_id,
+        filename=upload_data.filename,
+        content_type=upload_data.content_type,
+        type=upload_data.type,
+        size=upload_data.size,
+        received_size=0,
+        sha256=upload_data.sha256.lower() if upload_data.sha256 else None,
+        status="open",
+    )
+    async with await anyio.open_file(storage.upload_part_path(upload.id), "wb"):
+        pass
+    db.add(upload)
+    await db.commit()
+    return upload
+
+
+async def get_upload(db: AsyncSession, upload_id: str, user_id: int) -> UploadSession:
+    upload = await db.get(UploadSession, upload_id, populate_existing=True)
+    if upload is None or upload.created_by != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found.")
+    return upload
+
+
+async def _truncate(path: str, size: int):
+    await anyio.to_thread.run_sync(os.truncate, path, size)
+
+
+def _claimable():
+    # Open sessions, and claims whose holder stopped renewing them (a killed worker)
+    stale = datetime.utcnow() - timedelta(seconds=UPLOAD_LOCK_TIMEOUT_SECONDS)
+    return or_(
+        UploadSession.status == "open",
+        and_(UploadSession.status.in_(("writing", "finalizing")), UploadSession.updated_at < stale),
+    )
+
+
+async def _claim(db: AsyncSession, upload_id: str, claim_status: str, *conditions) -> Optional[datetime]:
+    """
+    Moves a claimable session to ``claim_status``, and returns the lease: the
+    ``updated_at`` it set, which every later update of the holder matches on.
+    None when the session could not be claimed.
+    """
+    lease = datetime.utcnow()
+    claimed = await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload_id, _claimable(), *conditions)
+        .values(status=claim_status, updated_at=lease)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return lease if claimed.rowcount else None
+
+
+async def _release(db: AsyncSession, upload_id: str, claim_status: str, lease: datetime, **values) -> Optional[datetime]:
+    """
+    Updates the session while ``lease`` is still held: renews it by default, or
+    releases the claim when ``values`` set a new status. Returns the new lease,
+    or None when another request has taken the session over.
+    """
+    renewed = datetime.utcnow()
+    result = await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == upload_id,
+            UploadSession.status == claim_status,
+            UploadSession.updated_at == lease,
+        )
+        .values(updated_at=renewed, **values)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return renewed if result.rowcount else None
+
+
+def _stored_size(path: str) -> int:
+    if not os.path.exists(path):
+        open(path, "wb").close()
+        return 0
+    return os.path.getsize(path)
+
+
+async def _resync(
+    db: AsyncSession, upload_id: str, claim_status: str, lease: datetime, stored: int
+) -> HTTPException:
+    # The part file holds fewer bytes than recorded, e.g. a worker died while
+    # finalizing it: release the claim and resume from what is actually stored
+    await _release(db, upload_id, claim_status, lease, received_size=stored, status="open")
+    upload = await db.get(UploadSession, upload_id, populate_existing=True)
+    return _conflict(upload, f"Stored {stored} of {upload.size} bytes.")
+
+
+async def _lost_claim(db: AsyncSession, upload_id: str) -> HTTPException:
+    upload = await db.get(UploadSession, upload_id, populate_existing=True)
+    return _conflict(upload, "The upload was taken over by another request.")
+
+
+async def append_chunk(
+    db: AsyncSession,
+    storage: FileStorage,
+    upload: UploadSession,
+    offset: int,
+    chunks: AsyncIterator[bytes],
+    chunk_sha256: Optional[str] = None,
+) -> UploadSession:
+    """
+    Writes one chunk at ``offset``, which must be the number of bytes received so far.
+
+    Args:
+    chunks (AsyncIterator[bytes]): The request body.
+    chunk_sha256 (str): Expected digest of this chunk; a mismatch discards it.
+    """
+    if offset != upload.received_size:
+        raise _conflict(upload, f"Expected offset {upload.received_size}.")
+
+    # Only one request at a time may write, and only from the recorded offset
+    lease = await _claim(db, upload.id, "writing", UploadSession.received_size == offset)
+    if lease is None:
+        upload = await db.get(UploadSession, upload.id, populate_existing=True)
+        if upload.status == "writing":
+            raise _conflict(upload, "Another request is writing to this upload.")
+        if upload.status != "open":
+            raise _conflict(upload, "Upload is already being finalized.")
+        raise _conflict(upload, "Another request wrote this chunk.")
+
+    part_path = storage.upload_part_path(upload.id)
+    stored = await anyio.to_thread.run_sync(_stored_size, part_path)
+    if stored < offset:
+        raise await _resync(db, upload.id, "writing", lease, stored)
+    limit = min(UPLOAD_MAX_CHUNK_SIZE, upload.size - offset)
+    digest = hashlib.sha256()
+    written = 0
+    renewed_at = time.monotonic()
+    try:
+        # A worker that died mid-chunk may have left bytes past the recorded offset
+        await _truncate(part_path, offset)
+        async with await anyio.open_file(part_path, "r+b") as part:
+            await part.seek(offset)
+            async for chunk in chunks:
+                written += len(chunk)
+                if written > limit:
+                    raise HTTPException(
+                        status_code=413, detail="Chunk is larger than the rest of the file or the chunk limit."
+                    )
+                # Renewed before writing, so a request that stalled past the timeout
+                # never writes into a part file someone else has taken over
+                if time.monotonic() - renewed_at > UPLOAD_LOCK_TIMEOUT_SECONDS / 3:
+                    lease = await _release(db, upload.id, "writing", lease)
+                    if lease is None:
+                        raise await _lost_claim(db, upload.id)
+                    renewed_at = time.monotonic()
+                digest.update(chunk)
+                await part.write(chunk)
+        if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+            raise HTTPException(status_code=400, detail="Chunk checksum mismatch.")
+    except BaseException:
+        # Drop whatever part of the chunk made it to disk and release the claim;
+        # the client retries from ``offset``. Once the claim is lost the part file
+        # belongs to whoever took it over.
+        with anyio.CancelScope(shield=True):
+            await db.rollback()
+            if lease is not None:
+                lease = await _release(db, upload.id, "writing", lease)
+            if lease is not None:
+                await _truncate(part_path, offset)
+                await _release(db, upload.id, "writing", lease, status="open")
+        raise
+
+    if await _release(db, upload.id, "writing", lease, received_size=offset + written, status="open") is None:
+        raise await _lost_claim(db, upload.id)
+    return await db.get(UploadSession, upload.id, populate_existing=True)
+
+
+async def _hash_part(db: AsyncSession, upload_id: str, part_path: str, lease: datetime) -> Tuple[str, datetime]:
+    # Hashes a possibly multi-GB part file off the event loop, renewing the claim as it goes
+    digest = hashlib.sha256()
+    renewed_at = time.monotonic()
+    async with await anyio.open_file(part_path, "rb") as part:
+        while block := await part.read(CHUNK_SIZE):
+            await anyio.to_thread.run_sync(digest.update, block)
+            if time.monotonic() - renewed_at > UPLOAD_LOCK_TIMEOUT_SECONDS / 3:
+                lease = await _release(db, upload_id, "finalizing", lease)
+                if lease is None:
+                    raise await _lost_claim(db, upload_id)
+                renewed_at = time.monotonic()
+    return digest.hexdigest(), lease
+
+
+async def finalize_upload(
+    db: AsyncSession, storage: FileStorage, upload: UploadSession
+) -> UploadSession:
+    if upload.status == "completed":
+        return upload
+    if upload.received_size != upload.size:
+        raise _conflict(upload, f"Received {upload.received_size} of {upload.size} bytes.")
+
+    lease = await _claim(db, upload.id, "finalizing", UploadSession.received_size == UploadSession.size)
+    if lease is None:
+        upload = await db.get(UploadSession, upload.id, populate_existing=True)
+        if upload.status == "completed":
+            return upload
+        raise _conflict(upload, "Upload is being finalized.")
+
+    part_path = storage.upload_part_path(upload.id)
+    stored = await anyio.to_thread.run_sync(_stored_size, part_path)
+    if stored != upload.size:
+        raise await _resync(db, upload.id, "finalizing", lease, stored)
+    try:
+        sha256, lease = await _hash_part(db, upload.id, part_path, lease)
+        if upload.sha256 and sha256 != upload.sha256:
+            raise HTTPException(status_code=400, detail="File checksum mismatch.")
+        try:
+            file_metadata = await db.run_sync(
+                lambda session: storage.add_spooled_file(
+                    part_path, upload.filename, upload.content_type, session, type=upload.type, sha256=sha256
+                )
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        completed = await db.execute(
+            update(UploadSession)
+            .where(
+                UploadSession.id == upload.id,
+                UploadSession.status == "finalizing",
+                UploadSession.updated_at == lease,
+            )
+            .values(status="completed", file_id=file_metadata.FileID)
+            .execution_options(synchronize_session=False)
+        )
+        if completed.rowcount == 0:
+            raise await _lost_claim(db, upload.id)
+        await db.commit()
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await db.rollback()
+            if lease is not None:
+                await _release(db, upload.id, "finalizing", lease, status="open")
+        raise
+    return await db.get(UploadSession, upload.id, populate_existing=True)
+
+
+async def abort_upload(db: AsyncSession, storage: FileStorage, upload: UploadSession):
+    part_path = storage.upload_part_path(upload.id)
+    await db.delete(upload)
+    await db.commit()
+    if os.path.exists(part_path):
+        await anyio.to_thread.run_sync(os.remove, part_path)
@@ -0,0 +1,129 @@
+"""
+Resized, recompressed variants of stored images (course thumbnails, profile pictures).
+
+``GET /files/{file_id}/image?size=256`` answers with the image scaled down to
+fit a ``size`` x ``size`` box and re-encoded as WebP, when the client accepts
+it, or JPEG. Each variant is rendered once with Pillow and cached under
+``file_storage/variants/`` by file id, size and format. Stored files never
+change, so variants are served with a long, immutable Cache-Control. Requested
+sizes are rounded up to one of ``IMAGE_VARIANT_SIZES`` so the cache stays bounded.
+"""
+import os
+import tempfile
+import threading
+from typing import Mapping, Optional
+
+from fastapi import HTTPException
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy.orm import Session
+
+from config import IMAGE_VARIANT_MAX_AGE, IMAGE_VARIANT_QUALITY, IMAGE_VARIANT_SIZES
+from file_storage import FileStorage
+from file_streaming import RangeFileResponse
+from metrics import record_cache
+
+# Format name -> media type
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+SOURCE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+
+def variant_size(size: int) -> int:
+    """The smallest configured size at least as large as ``size``."""
+    for allowed in IMAGE_VARIANT_SIZES:
+        if size <= allowed:
+            return allowed
+    return IMAGE_VARIANT_SIZES[-1]
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    return "webp" if accept and "image/webp" in accept else "jpeg"
+
+
+def render_variant(source_path: str, target, size: int, format: str):
+    """Writes ``source_path`` scaled to fit ``size`` x ``size`` to ``target`` as ``format``."""
+    with Image.open(source_path) as source:
+        # JPEGs are decoded straight at the nearest larger scale, which skips
+        # most of the work for large photos.
+        source.draft(None, (size, size))
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        if format == "jpeg" and has_alpha:
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        if format == "jpeg":
+            image.save(target, "JPEG", quality=IMAGE_VARIANT_QUALITY, optimize=True, progressive=True)
+        else:
+            image.save(target, "WEBP", quality=IMAGE_VARIANT_QUALITY, method=4)
+
+
+class ImageVariants:
+    def __init__(self, storage: FileStorage):
+        self.storage = storage
+        os.makedirs(storage.variant_directory, exist_ok=True)
+        # Striped locks: concurrent requests for one variant render it once
+        self._locks = [threading.Lock() for _ in range(64)]
+
+    def get_variant(self, file_id: str, db: Session, size: int, format: str) -> str:
+        """
+        Returns the path of the cached variant, rendering it first if needed.
+
+        Args:
+        file_id (str): A stored image.
+        size (int): Longest edge wanted, rounded up to one of ``IMAGE_VARIANT_SIZES``.
+        format (str): One of ``FORMATS``.
+        """
+        path = self.storage.variant_path(file_id, f"{size}.{format}")
+        if os.path.exists(path):
+            record_cache("image_variant", True)
+            return path
+        record_cache("image_variant", False)
+
+        file_metadata = self.storage.get_file_metadata(file_id, db)
+        if file_metadata.FileType not in SOURCE_TYPES:
+            raise HTTPException(status_code=400, detail="File is not an image.")
+        with self._locks[hash(path) % len(self._locks)]:
+            if os.path.exists(path):
+                return path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.storage.tmp_directory, suffix=f".{format}")
+            try:
+                with os.fdopen(fd, "wb") as target:
+                    render_variant(file_metadata.FilePath, target, size, format)
+                os.replace(tmp_path, path)
+            except FileNotFoundError:
+                os.remove(tmp_path)
+                raise HTTPException(status_code=404, detail="File not found.")
+            except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+                os.remove(tmp_path)
+                raise HTTPException(status_code=400, detail="File is not a readable image.")
+        return path
+
+    def get_response(
+        self,
+        file_id: str,
+        db: Session,
+        request_headers: Mapping[str, str],
+        size: int,
+        format: Optional[str] = None,
+    ) -> RangeFileResponse:
+        """Serves a variant; without ``format`` it is WebP or JPEG depending on the Accept header."""
+        headers = {"cache-control": f"public, max-age={IMAGE_VARIANT_MAX_AGE}, immutable"}
+        if format is None:
+            format = negotiate_format(request_headers.get("accept"))
+            headers["vary"] = "Accept"
+        size = variant_size(size)
+        path = self.get_variant(file_id, db, size, format)
+        return RangeFileResponse(
+            path,
+            request_headers,
+            media_type=FORMATS[format],
+            etag=f"{file_id}-{size}.{format}",
+            headers=headers,
+        )
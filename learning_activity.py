@@ -0,0 +1,221 @@
+"""
+Monthly learning-activity fact table.
+
+``learning_activity_monthly`` holds one row per user and calendar month with the
+hours learnt (completed content plus approved external certifications) and the
+number of content completions. Rows are adjusted as progress is marked and
+certifications change state, so the dashboards read a handful of rows instead
+of aggregating the raw history. They can be rebuilt from the raw tables with:
+
+    python learning_activity.py [--user-id ID ...]
+
+None of the helpers here commit; callers own the transaction.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from learning_hours import APPROVED_CERTIFICATION_STATUSES
+from models import (
+    Content,
+    Enrollment,
+    ExternalCertification,
+    LearningActivityMonthly,
+    Progress,
+    User,
+)
+
+WRITE_BATCH_SIZE = 500
+
+
+def month_key(value) -> str:
+    """Formats a date or datetime as the "YYYY-MM" month key."""
+    return value.strftime("%Y-%m")
+
+
+def last_months(count: int = 12, today: Optional[date] = None) -> List[str]:
+    """Returns the month keys of the last ``count`` months, oldest first."""
+    today = today or date.today()
+    return [month_key(today - relativedelta(months=i)) for i in reversed(range(count))]
+
+
+def _month_of(bind, column):
+    if bind.dialect.name == "postgresql":
+        return func.to_char(column, "YYYY-MM")
+    return func.strftime("%Y-%m", column)
+
+
+def record_activity(db: Session, user_id: int, month: str, hours: float = 0, events: int = 0):
+    """Adds ``hours`` and ``events`` (either may be negative) to a user's month."""
+    table = LearningActivityMonthly.__table__
+    stmt = dialect_insert(db.get_bind(), table).values(
+        user_id=user_id, month=month, hours=hours, events=events
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.month],
+            set_={
+                "hours": table.c.hours + stmt.excluded.hours,
+                "events": table.c.events + stmt.excluded.events,
+                "updated_at": func.now(),
+            },
+        )
+    )
+
+
+def record_progress(
+    db: Session,
+    user_id: int,
+    hours: float,
+    completed_at: datetime,
+    previous_completed_at: Optional[datetime] = None,
+):
+    """
+    Accounts for a content completion at ``completed_at``.
+
+    Pass ``previous_completed_at`` when an existing completion was re-marked, so
+    it moves from its old month instead of being counted twice.
+    """
+    hours = hours or 0
+    if previous_completed_at is not None:
+        if month_key(previous_completed_at) == month_key(completed_at):
+            return
+        record_activity(db, user_id, month_key(previous_completed_at), -hours, -1)
+    record_activity(db, user_id, month_key(completed_at), hours, 1)
+
+
+def record_certification(db: Session, certification: ExternalCertification, sign: int = 1):
+    """
+    Adds (``sign=1``) or removes (``sign=-1``) an approved certification's hours.
+
+    Call with -1 before changing a certification and with 1 after; certifications
+    that are not approved are ignored either way.
+    """
+    if certification.status not in APPROVED_CERTIFICATION_STATUSES:
+        return
+    record_activity(
+        db,
+        certification.uploaded_by_id,
+        month_key(certification.date_of_completion),
+        sign * (certification.hours or 0),
+    )
+
+
+def rebuild_learning_activity(db: Session, user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recomputes the monthly rows from progress and approved certifications.
+
+    Args:
+    user_ids (Iterable[int]): Limit the rebuild to these users.
+
+    Returns:
+    int: The number of monthly rows written.
+    """
+    bind = db.get_bind()
+    user_ids = list(user_ids) if user_ids is not None else None
+
+    progress_month = _month_of(bind, Progress.completed_at)
+    progress_query = (
+        select(
+            Enrollment.user_id,
+            progress_month,
+            func.coalesce(func.sum(Content.expected_time_to_complete), 0),
+            func.count(Progress.id),
+        )
+        .join(Enrollment, Enrollment.id == Progress.enrollment_id)
+        .join(Content, Content.id == Progress.content_id)
+        .where(Progress.completed_at.is_not(None))
+        .group_by(Enrollment.user_id, progress_month)
+    )
+    certification_month = _month_of(bind, ExternalCertification.date_of_completion)
+    certification_query = (
+        select(
+            ExternalCertification.uploaded_by_id,
+            certification_month,
+            func.coalesce(func.sum(ExternalCertification.hours), 0),
+        )
+        .where(ExternalCertification.status.in_(APPROVED_CERTIFICATION_STATUSES))
+        .group_by(ExternalCertification.uploaded_by_id, certification_month)
+    )
+    if user_ids is not None:
+        progress_query = progress_query.where(Enrollment.user_id.in_(user_ids))
+        certification_query = certification_query.where(
+            ExternalCertification.uploaded_by_id.in_(user_ids)
+        )
+
+    totals: Dict[Tuple[int, str], List] = defaultdict(lambda: [0, 0])
+    for user_id, month, hours, events in db.execute(progress_query):
+        totals[(user_id, month)][0] += hours
+        totals[(user_id, month)][1] += events
+    for user_id, month, hours in db.execute(certification_query):
+        totals[(user_id, month)][0] += hours
+
+    clear = delete(LearningActivityMonthly)
+    if user_ids is not None:
+        clear = clear.where(LearningActivityMonthly.user_id.in_(user_ids))
+    db.execute(clear.execution_options(synchronize_session=False))
+
+    rows = [
+        {"user_id": user_id, "month": month, "hours": hours, "events": events}
+        for (user_id, month), (hours, events) in totals.items()
+    ]
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        db.execute(insert(LearningActivityMonthly), rows[start:start + WRITE_BATCH_SIZE])
+    return len(rows)
+
+
+def user_activity(db: Session, user_id: int, months: List[str]) -> Dict[str, Tuple[float, int]]:
+    """Returns ``{month: (hours, events)}`` for the months of ``months`` the user was active in."""
+    rows = db.execute(
+        select(
+            LearningActivityMonthly.month,
+            LearningActivityMonthly.hours,
+            LearningActivityMonthly.events,
+        ).where(
+            LearningActivityMonthly.user_id == user_id,
+            LearningActivityMonthly.month.in_(months),
+        )
+    )
+    return {month: (hours, events) for month, hours, events in rows}
+
+
+def team_hours(db: Session, counselor_id: int, months: List[str]) -> Dict[str, float]:
+    """Returns the hours of a counselor's whole team for each month of ``months``."""
+    rows = db.execute(
+        select(LearningActivityMonthly.month, func.sum(LearningActivityMonthly.hours))
+        .join(User, User.id == LearningActivityMonthly.user_id)
+        .where(
+            User.counselor_id == counselor_id,
+            LearningActivityMonthly.month.in_(months),
+        )
+        .group_by(LearningActivityMonthly.month)
+    )
+    hours = {month: 0.0 for month in months}
+    hours.update({month: float(total or 0) for month, total in rows})
+    return hours
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(
+        description="Rebuild learning_activity_monthly from progress and certifications."
+    )
+    parser.add_argument("--user-id", type=int, action="append", dest="user_ids")
+    args = parser.parse_args()
+
+    LearningActivityMonthly.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        count = rebuild_learning_activity(db, user_ids=args.user_ids)
+        db.commit()
+        print(f"Rebuilt {count} monthly learning-activity rows")
+    finally:
+        db.close()
@@ -0,0 +1,90 @@
+"""
+Learning-hour totals (overall, technical, non-technical) for one or many users.
+
+Course hours come from the enrollment rollups and external certification hours
+from approved uploads; both are folded into a single grouped query that runs on
+the caller's session.
+"""
+from typing import Dict, Iterable
+
+from sqlalchemy import case, func, select, union_all
+from sqlalchemy.orm import Session
+
+from models import Course, Enrollment, EnrollmentRollup, ExternalCertification
+from schemas import LearningHoursDisplay
+
+# The approve endpoint stores "approve"; older rows were written as "approved".
+APPROVED_CERTIFICATION_STATUSES = ("approve", "approved")
+
+
+class LearningHoursService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def for_users(self, user_ids: Iterable[int]) -> Dict[int, LearningHoursDisplay]:
+        user_ids = list(set(user_ids))
+        if not user_ids:
+            return {}
+
+        course_hours = (
+            select(
+                Enrollment.user_id.label("user_id"),
+                Course.category.label("category"),
+                EnrollmentRollup.completed_hours.label("hours"),
+            )
+            .join(Course, Course.id == Enrollment.course_id)
+            .join(EnrollmentRollup, EnrollmentRollup.enrollment_id == Enrollment.id)
+            .where(Enrollment.user_id.in_(user_ids))
+        )
+        certification_hours = select(
+            ExternalCertification.uploaded_by_id.label("user_id"),
+            ExternalCertification.category.label("category"),
+            ExternalCertification.hours.label("hours"),
+        ).where(
+            ExternalCertification.uploaded_by_id.in_(user_ids),
+            ExternalCertification.status.in_(APPROVED_CERTIFICATION_STATUSES),
+        )
+        hours = union_all(course_hours, certification_hours).subquery()
+
+        rows = self.db.execute(
+            select(
+                hours.c.user_id,
+                func.coalesce(func.sum(hours.c.hours), 0),
+                func.coalesce(
+                    func.sum(
+                        case((hours.c.category == "technical", hours.c.hours), else_=0)
+                    ),
+                    0,
+                ),
+                func.coalesce(
+                    func.sum(
+                        case(
+                            (hours.c.category == "nonTechnical", hours.c.hours),
+                            else_=0,
+                        )
+                    ),
+                    0,
+                ),
+            ).group_by(hours.c.user_id)
+        ).all()
+
+        result = {
+            user_id: LearningHoursDisplay(
+                user_id=user_id,
+                total_learning_hours=0,
+                total_tech_learning_hours=0,
+                total_non_tech_learning_hours=0,
+            )
+            for user_id in user_ids
+        }
+        for user_id, total, tech, non_tech in rows:
+            result[user_id] = LearningHoursDisplay(
+                user_id=user_id,
+                total_learning_hours=total,
+                total_tech_learning_hours=tech,
+                total_non_tech_learning_hours=non_tech,
+            )
+        return result
+
+    def for_user(self, user_id: int) -> LearningHoursDisplay:
+        return self.for_users([user_id])[user_id]
@@ -0,0 +1,141 @@
+"""
+Prometheus metrics, served by ``GET /metrics``.
+
+Covers per-route request counts, latency histograms and in-flight gauges
+(``MetricsMiddleware``), pool checkout waits, the bcrypt queue, bytes of stored
+files sent and cache lookups; a hit ratio is e.g.
+
+    sum(rate(lms_cache_requests_total{result="hit"}[5m])) by (cache)
+      / sum(rate(lms_cache_requests_total[5m])) by (cache)
+
+A single process keeps its samples in memory. Under gunicorn or
+``uvicorn --workers N``, point ``PROMETHEUS_MULTIPROC_DIR`` at an empty directory
+shared by the workers (and wiped before start): every process then writes its
+samples to its own memory-mapped files, so recording takes no cross-process
+lock, and a scrape of any worker adds all of them up. Gunicorn's ``child_exit``
+server hook should call ``child_exit`` below so dead workers drop out of the
+live gauges.
+"""
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+HTTP_REQUESTS = Counter(
+    "lms_http_requests_total", "HTTP requests, by route and status.", ["method", "route", "status"]
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "lms_http_request_duration_seconds",
+    "Time to the end of the response, by route.",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "lms_http_requests_in_progress",
+    "Requests being handled, by route.",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "lms_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection.",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "lms_db_pool_checked_out_connections",
+    "Connections currently checked out of the pool.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+
+PASSWORD_HASH_PENDING = Gauge(
+    "lms_password_hash_pending", "Bcrypt jobs queued or running.", multiprocess_mode="livesum"
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "lms_password_hash_rejected_total", "Bcrypt jobs turned away because the queue was full."
+)
+PASSWORD_HASH_QUEUE_WAIT = Histogram(
+    "lms_password_hash_queue_wait_seconds",
+    "Time bcrypt jobs waited for a worker process.",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+FILE_BYTES_SENT = Counter(
+    "lms_file_bytes_sent_total", "Bytes of stored files sent, by transfer method.", ["method"]
+)
+CACHE_REQUESTS = Counter(
+    "lms_cache_requests_total", "Cache lookups, by cache and result (hit or miss).", ["cache", "result"]
+)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def render_latest() -> bytes:
+    """The current samples in the Prometheus text format (``CONTENT_TYPE_LATEST``)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def child_exit(server, worker):
+    """Gunicorn ``child_exit`` hook for multiprocess mode."""
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def route_template(scope: Scope) -> str:
+    """The path template of the route ``scope`` goes to, so ids don't become label values."""
+    partial = None
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            in_progress.dec()
@@ -0,0 +1,281 @@
+"""
+Versioned schema migrations.
+
+``schema_migrations`` records the versions applied so far. ``upgrade`` applies
+the pending entries of ``MIGRATIONS`` in order, each together with its version
+row in one transaction that also holds the migration lock (an advisory lock on
+PostgreSQL, the write lock on SQLite), so workers starting at the same time
+apply every migration exactly once. Steps check what exists before changing it,
+which lets them run against databases created by the old import-time
+``create_all``.
+
+    python migrations.py upgrade    # apply pending migrations
+    python migrations.py status     # applied and pending versions
+    python migrations.py verify     # query plans of the hot queries without / with INDEX_PLAN
+
+Workers run ``upgrade`` on startup unless ``LMS_MIGRATE_ON_STARTUP=false``;
+importing ``app`` no longer touches the schema.
+
+``verify`` drops and recreates the ``INDEX_PLAN`` indexes inside a transaction
+it rolls back, so it reports the before and after plans of any database without
+changing it, and exits non-zero when a hot query still scans a whole table.
+"""
+import re
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import Select
+
+from learning_hours import APPROVED_CERTIFICATION_STATUSES
+from models import (
+    Base,
+    Chapter,
+    Content,
+    Enrollment,
+    ExternalCertification,
+    Progress,
+    Questions,
+    QuizAttemptCounter,
+    QuizCompletions,
+    SchemaMigration,
+    User,
+)
+from quiz_attempts import rebuild_attempt_counters
+
+# pg_advisory_xact_lock key shared by every process running upgrade()
+MIGRATION_LOCK_KEY = 0x4C4D53  # "LMS"
+
+# Secondary indexes on the foreign keys the routers filter and join on. They are
+# declared on the models too, so fresh databases get them from the baseline.
+# enrollments.user_id and progress.enrollment_id need none: they lead the
+# _user_course_uc and _enrollment_content_uc unique indexes.
+INDEX_PLAN = [
+    ("users", "ix_users_counselor_id"),
+    ("chapters", "ix_chapters_course_id"),
+    ("contents", "ix_contents_chapter_id"),
+    ("questions", "ix_questions_chapter_id"),
+    ("questions", "ix_questions_course_id"),
+    ("enrollments", "ix_enrollments_course_id"),
+    ("progress", "ix_progress_content_id"),
+    ("quiz_completions", "ix_quiz_completions_enrollment_question"),
+    ("external_certifications", "ix_external_certifications_uploaded_by_id"),
+]
+
+
+class Migration:
+    def __init__(self, version: int, name: str, upgrade: Callable[[Connection], None]):
+        """
+        Args:
+        version (int): Position in the history; never reuse or renumber one.
+        name (str): Short description stored in ``schema_migrations``.
+        upgrade (Callable): Applies the change with the connection it is given, without committing.
+        """
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+
+
+def planned_indexes() -> list:
+    """The ``Index`` objects named in ``INDEX_PLAN``."""
+    indexes = []
+    for table_name, index_name in INDEX_PLAN:
+        table = Base.metadata.tables[table_name]
+        indexes.append(next(index for index in table.indexes if index.name == index_name))
+    return indexes
+
+
+def _create_baseline(connection: Connection):
+    Base.metadata.create_all(bind=connection)
+
+
+def _create_planned_indexes(connection: Connection):
+    for index in planned_indexes():
+        index.create(bind=connection, checkfirst=True)
+
+
+def _add_quiz_attempt_numbers(connection: Connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("quiz_completions")}
+    if "attempt_no" not in columns:
+        connection.execute(text("ALTER TABLE quiz_completions ADD COLUMN attempt_no INTEGER"))
+    QuizAttemptCounter.__table__.create(bind=connection, checkfirst=True)
+    rebuild_attempt_counters(connection)
+    for index in QuizCompletions.__table__.indexes:
+        if index.name == "ux_quiz_completions_attempt_no":
+            index.create(bind=connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    Migration(1, "baseline schema", _create_baseline),
+    Migration(2, "indexes on hot foreign keys", _create_planned_indexes),
+    Migration(3, "persisted quiz attempt numbers and counters", _add_quiz_attempt_numbers),
+]
+
+
+@contextmanager
+def _locked_transaction(connection: Connection):
+    """A transaction that DDL takes part in, holding the migration lock."""
+    with connection.begin():
+        if connection.dialect.name == "sqlite":
+            # pysqlite would run DDL in autocommit mode; IMMEDIATE also takes the write lock up front
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        elif connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        yield
+
+
+def _applied_versions(connection: Connection) -> Dict[int, object]:
+    rows = connection.execute(select(SchemaMigration.version, SchemaMigration.applied_at))
+    return {version: applied_at for version, applied_at in rows}
+
+
+def upgrade(engine: Optional[Engine] = None) -> List[Migration]:
+    """
+    Applies the pending migrations.
+
+    Returns:
+    List[Migration]: The migrations this call applied; empty when the schema is current.
+    """
+    if engine is None:
+        from database import engine
+    if all(applied_at is not None for _, applied_at in status(engine)):
+        return []
+    applied = []
+    with engine.connect() as connection:
+        with _locked_transaction(connection):
+            SchemaMigration.__table__.create(bind=connection, checkfirst=True)
+        for migration in MIGRATIONS:
+            with _locked_transaction(connection):
+                # Checked again under the lock: another process may have just applied it
+                if migration.version in _applied_versions(connection):
+                    continue
+                migration.upgrade(connection)
+                connection.execute(
+                    insert(SchemaMigration).values(version=migration.version, name=migration.name)
+                )
+            applied.append(migration)
+    return applied
+
+
+def status(engine: Optional[Engine] = None) -> List[Tuple[Migration, object]]:
+    """Returns each migration with its ``applied_at``, or None while it is pending."""
+    if engine is None:
+        from database import engine
+    with engine.connect() as connection:
+        if not engine.dialect.has_table(connection, SchemaMigration.__tablename__):
+            return [(migration, None) for migration in MIGRATIONS]
+        versions = _applied_versions(connection)
+    return [(migration, versions.get(migration.version)) for migration in MIGRATIONS]
+
+
+def hot_queries() -> Dict[str, Select]:
+    """Representative forms of the statements the busiest routes send, keyed by where they come from."""
+    return {
+        "courses: enrolled / completed counts": select(func.count(Enrollment.id)).where(
+            Enrollment.course_id == 1, Enrollment.status == "Completed"
+        ),
+        "courses: chapters count": select(func.count(Chapter.id)).where(Chapter.course_id == 1),
+        "courses: expected time of a course": select(func.sum(Content.expected_time_to_complete))
+        .join(Chapter, Chapter.id == Content.chapter_id)
+        .where(Chapter.course_id == 1),
+        "enrollment: enrollments of a user": select(Enrollment.course_id).where(Enrollment.user_id == 1),
+        "enrollment: mark_as_done enrollment lookup": select(Enrollment.id)
+        .join(Chapter, Chapter.course_id == Enrollment.course_id)
+        .join(Content, Content.chapter_id == Chapter.id)
+        .where(Enrollment.user_id == 1, Content.id == 1),
+        "enrollment: progress of an enrollment": select(Progress.content_id).where(Progress.enrollment_id == 1),
+        "course tree: progress of a content": select(func.count(Progress.id)).where(Progress.content_id == 1),
+        "quiz: questions of a chapter": select(Questions.id).where(Questions.chapter_id == 1),
+        "quiz: questions of a course": select(Questions.id).where(Questions.course_id == 1),
+        "quiz: attempts at a question": select(func.count(QuizCompletions.id)).where(
+            QuizCompletions.enrollment_id == 1,
+            QuizCompletions.question_id == 1,
+            QuizCompletions.correct_answer == True,
+        ),
+        "stats: approved certification hours": select(func.sum(ExternalCertification.hours)).where(
+            ExternalCertification.uploaded_by_id == 1,
+            ExternalCertification.status.in_(APPROVED_CERTIFICATION_STATUSES),
+        ),
+        "um: team members of a counselor": select(User.id).where(User.counselor_id == 1),
+    }
+
+
+def explain(connection: Connection, statement: Select) -> List[str]:
+    """The plan ``connection``'s database picks for ``statement``, one line per step."""
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "sqlite":
+        return [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+    return [row[0].strip() for row in connection.exec_driver_sql(f"EXPLAIN {sql}")]
+
+
+_FULL_SCAN = re.compile(r"^(SCAN (TABLE )?\w+( AS \w+)?|Seq Scan on \w+.*)$")
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """The steps of ``plan`` that read a whole table."""
+    return [step for step in plan if _FULL_SCAN.match(step.lstrip("-> "))]
+
+
+def compare_plans(engine: Optional[Engine] = None) -> Dict[str, Tuple[List[str], List[str]]]:
+    """
+    Explains ``hot_queries`` without and with the ``INDEX_PLAN`` indexes, whether
+    or not they exist yet, and rolls the index changes back.
+
+    Returns:
+    Dict[str, Tuple[List[str], List[str]]]: The before and after plans per query.
+    """
+    if engine is None:
+        from database import engine
+    queries = hot_queries()
+    indexes = planned_indexes()
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            if connection.dialect.name == "sqlite":
+                connection.exec_driver_sql("BEGIN")
+            for index in indexes:
+                index.drop(bind=connection, checkfirst=True)
+            before = {name: explain(connection, query) for name, query in queries.items()}
+            for index in indexes:
+                index.create(bind=connection)
+            after = {name: explain(connection, query) for name, query in queries.items()}
+        finally:
+            transaction.rollback()
+    return {name: (before[name], after[name]) for name in queries}
+
+
+def print_plans(plans: Dict[str, Tuple[List[str], List[str]]]) -> int:
+    """Prints the plans side by side and returns how many queries still scan a whole table."""
+    still_scanning = 0
+    for name, (before, after) in plans.items():
+        scans = full_scans(after)
+        still_scanning += bool(scans)
+        verdict = "FULL SCAN" if scans else ("unchanged" if before == after else "improved")
+        print(f"{name} [{verdict}]")
+        for step in before:
+            print(f"    before: {step}")
+        for step in after:
+            print(f"    after:  {step}")
+    return still_scanning
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Apply or inspect versioned schema migrations.")
+    parser.add_argument("command", choices=["upgrade", "status", "verify"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        migrations = upgrade()
+        for migration in migrations:
+            print(f"applied {migration.version:>4}  {migration.name}")
+        if not migrations:
+            print("schema is up to date")
+    elif args.command == "status":
+        for migration, applied_at in status():
+            print(f"{migration.version:>4}  {migration.name:46} {applied_at or 'pending'}")
+    else:
+        sys.exit(1 if print_plans(compare_plans()) else 0)
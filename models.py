@@ -10,16 +10,14 @@ from sqlalchemy import (
     Index,
     extract,
     Boolean,
-    case,
     cast,
     Float,
     Join,
     UniqueConstraint,
 )
 from sqlalchemy import select, func
-from sqlalchemy.orm import column_property, backref
+from sqlalchemy.orm import column_property, backref, object_session
 from sqlalchemy.orm import relationship, declarative_base
-from sqlalchemy.sql import and_
 from database import SessionLocal
 from datetime import datetime
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -158,99 +156,56 @@ class User(Base):
     def certificates_count(self):
         return len(self.certificates)
 
-    # Properties for total learning hours, tech, and non-tech learning hours
+    # Properties for total learning hours, tech, and non-tech learning hours.
+    # All three come from one LearningHoursService query on the object's own session.
+    @property
+    def learning_hours(self):
+        if "_learning_hours" not in self.__dict__:
+            self.__dict__["_learning_hours"] = self.get_learning_hours(
+                self.id, object_session(self)
+            )
+        return self.__dict__["_learning_hours"]
+
     @property
     def total_learning_hours(self):
-        return self.get_total_learning_hours(self.id)
+        return self.learning_hours.total_learning_hours
 
     @property
     def total_tech_learning_hours(self):
-        return self.get_total_tech_learning_hours(self.id)
+        return self.learning_hours.total_tech_learning_hours
 
     @property
     def total_non_tech_learning_hours(self):
-        return self.get_total_non_tech_learning_hours(self.id)
+        return self.learning_hours.total_non_tech_learning_hours
 
     @staticmethod
-    def get_total_learning_hours(user_id):
-        session = SessionLocal()
-
-        # Query 1: Sum of completed_hours from Enrollment
-        completed_hours_query = session.query(
-            func.coalesce(func.sum(Enrollment.completed_hours), 0)
-        ).filter(Enrollment.user_id == user_id).scalar()
+    def get_learning_hours(user_id, session=None):
+        from learning_hours import LearningHoursService
 
-        # Query 2: Sum of hours from ExternalCertification (only approved ones)
-        certification_hours_query = session.query(
-            func.coalesce(func.sum(ExternalCertification.hours), 0)
-        ).filter(
-            ExternalCertification.uploaded_by_id == user_id,
-            ExternalCertification.status == 'approved'
-        ).scalar()
-
-        # Combine the results
-        total_learning_hours = completed_hours_query + certification_hours_query
-
-        session.close()  # Make sure to close the session
-        return total_learning_hours
-
-    @staticmethod
-    def get_total_tech_learning_hours(user_id):
+        if session is not None:
+            return LearningHoursService(session).for_user(user_id)
         session = SessionLocal()
-
-        # Query 1: Sum of completed_hours for technical courses from Enrollment
-        tech_completed_hours_query = session.query(
-            func.coalesce(func.sum(Enrollment.completed_hours), 0)
-        ).join(Course).filter(
-            Enrollment.user_id == user_id,
-            Course.category == 'technical'
-        ).scalar()
-
-        # Query 2: Sum of hours from ExternalCertification (technical, approved ones)
-        tech_certification_hours_query = session.query(
-            func.coalesce(func.sum(ExternalCertification.hours), 0)
-        ).filter(
-            ExternalCertification.uploaded_by_id == user_id,
-            ExternalCertification.category == 'technical',
-            ExternalCertification.status.in_(['approve', 'approved'])
-        ).scalar()
-
-        # Combine the results
-        total_tech_learning_hours = tech_completed_hours_query + tech_certification_hours_query
-
-        session.close()  # Make sure to close the session
-        return total_tech_learning_hours
+        try:
+            return LearningHoursService(session).for_user(user_id)
+        finally:
+            session.close()  # Make sure to close the session
 
     @staticmethod
-    def get_total_non_tech_learning_hours(user_id):
-        session = SessionLocal()
-
-        # Query 1: Sum of completed_hours for non-technical courses from Enrollment
-        non_tech_completed_hours_query = session.query(
-            func.coalesce(func.sum(Enrollment.completed_hours), 0)
-        ).join(Course).filter(
-            Enrollment.user_id == user_id,
-            Course.category == 'nonTechnical'
-        ).scalar()
+    def get_total_learning_hours(user_id, session=None):
+        return User.get_learning_hours(user_id, session).total_learning_hours
 
-        print(non_tech_completed_hours_query,'non_tech_completed_hours_query')
-
-        # Query 2: Sum of hours from ExternalCertification (non-technical, approved ones)
-        non_tech_certification_hours_query = session.query(
-            func.coalesce(func.sum(ExternalCertification.hours), 0)
-        ).filter(
-            ExternalCertification.uploaded_by_id == user_id,
-            ExternalCertification.category == 'nonTechnical',
-            ExternalCertification.status.in_(['approve', 'approved'])
-        ).scalar()
-        print(non_tech_certification_hours_query,'non_tech_certification_hours_query')
-        # Combine the results
-        total_non_tech_learning_hours = non_tech_completed_hours_query + non_tech_certification_hours_query
+    @staticmethod
+    def get_total_tech_learning_hours(user_id, session=None):
+        return User.get_learning_hours(user_id, session).total_tech_learning_hours
 
-        session.close()  # Make sure to close the session
-        return total_non_tech_learning_hours
+    @staticmethod
+    def get_total_non_tech_learning_hours(user_id, session=None):
+        return User.get_learning_hours(user_id, session).total_non_tech_learning_hours
 
-    __table_args__ = (Index("idx_user_email", "email"),)
+    __table_args__ = (
+        Index("idx_user_email", "email"),
+        Index("ix_users_counselor_id", "counselor_id"),
+    )
 
 
 class File(Base):
@@ -262,6 +217,36 @@ class File(Base):
     type = Column(String, nullable=False)  # Course content, DP, thumbnail
 
 
+class FileBlob(Base):
+    """One stored copy of an uploaded file's bytes, shared by every File row with the same content."""
+
+    __tablename__ = "file_blobs"
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False, unique=True)  # File.FilePath of every referencing row
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class UploadSession(Base):
+    """A resumable upload in progress; its bytes are spooled to a part file until finalized."""
+
+    __tablename__ = "upload_sessions"
+    id = Column(String, primary_key=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    type = Column(String, nullable=False, default="Course content")
+    size = Column(Integer, nullable=False)
+    received_size = Column(Integer, nullable=False, default=0)
+    sha256 = Column(String(64))  # expected digest of the whole file, when the client sent one
+    status = Column(String, nullable=False, default="open")  # open, writing, finalizing, completed
+    file_id = Column(String, ForeignKey("files.FileID"))
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
 class Chapter(Base):
     __tablename__ = "chapters"
     id = Column(Integer, primary_key=True)
@@ -273,6 +258,8 @@ class Chapter(Base):
     contents = relationship("Content", back_populates="chapter")
     questions = relationship("Questions", back_populates="chapter")
 
+    __table_args__ = (Index("ix_chapters_course_id", "course_id"),)
+
 
 class Questions(Base):
     __tablename__ = "questions"
@@ -292,6 +279,11 @@ class Questions(Base):
     course = relationship("Course", back_populates="questions")
     chapter = relationship("Chapter", back_populates="questions")
 
+    __table_args__ = (
+        Index("ix_questions_chapter_id", "chapter_id"),
+        Index("ix_questions_course_id", "course_id"),
+    )
+
 
 class Content(Base):
     __tablename__ = "contents"
@@ -306,6 +298,9 @@ class Content(Base):
     chapter = relationship("Chapter", back_populates="contents")
     file = relationship("File")  # Direct relationship to the File table
 
+    # Covers the expected-time sums per chapter without reading the rows
+    __table_args__ = (Index("ix_contents_chapter_id", "chapter_id", "expected_time_to_complete"),)
+
 
 class Enrollment(Base):
     __tablename__ = "enrollments"
@@ -326,87 +321,60 @@ class Enrollment(Base):
     course = relationship("Course", back_populates="enrollments")
     progress = relationship("Progress", uselist=False, back_populates="enrollment")
 
-    __table_args__ = (UniqueConstraint("user_id", "course_id", name="_user_course_uc"),)
+    # user_id lookups use the unique constraint, which it leads
+    __table_args__ = (
+        UniqueConstraint("user_id", "course_id", name="_user_course_uc"),
+        Index("ix_enrollments_course_id", "course_id"),
+    )
 
     @property
     def calculated_completion_percentage(self):
-        session = SessionLocal()  # Assuming Session is imported and configured properly
-        return self.calculate_progress_percentage_(self.id, session)
+        session = object_session(self)
+        if session is not None:
+            return self.calculate_progress_percentage_(self.id, session)
+        session = SessionLocal()
+        try:
+            return self.calculate_progress_percentage_(self.id, session)
+        finally:
+            session.close()
 
     @staticmethod
     def calculate_progress_percentage_(enrollment_id, session):
+        return Enrollment.calculate_progress_percentages([enrollment_id], session)[
+            enrollment_id
+        ]
+
+    @staticmethod
+    def calculate_progress_percentages(enrollment_ids, session):
         """
-        Calculates the progress percentage for a given enrollment based on the number of contents completed.
-        Handles cases where there might be no content, chapters, or progress records.
+        Calculates the progress percentage of several enrollments at once, based on
+        the share of their course's contents that have been completed.
 
         Args:
-        enrollment_id (int): The ID of the enrollment.
+        enrollment_ids (Iterable[int]): The IDs of the enrollments.
         session (Session): The SQLAlchemy session for database interaction.
 
         Returns:
-        float: The progress percentage of the enrollment, or 0.0 if insufficient data exists.
+        Dict[int, float]: The progress percentage per enrollment ID; 0.0 for
+        enrollments that are missing or whose course has no contents.
         """
-        # Retrieve the enrollment and associated course details
-        enrollment = session.query(Enrollment).filter_by(id=enrollment_id).one_or_none()
-        if not enrollment:
-            # print("Enrollment not found.")
-            return 0.0  # Handle case where enrollment doesn't exist
-
-        course_id = enrollment.course_id
-        print("course_id", course_id)
-
-        # Check for the existence of chapters before counting content
-        chapters_exist = session.query(Chapter).filter_by(course_id=course_id).first()
-        if not chapters_exist:
-            # print("No chapters available for this course.")
-            return 0.0  # Return 0% if no chapters are available
-
-        # Get the total number of contents in the course
-        total_contents = (
-            session.query(func.count(Content.id))
-            .join(Chapter)
-            .filter(Chapter.course_id == course_id)
-            .scalar()
+        enrollment_ids = list(set(enrollment_ids))
+        percentages = {enrollment_id: 0.0 for enrollment_id in enrollment_ids}
+        if not enrollment_ids:
+            return percentages
+
+        rows = session.execute(
+            select(
+                EnrollmentRollup.enrollment_id,
+                EnrollmentRollup.completed_content_count,
+                EnrollmentRollup.remaining_content_count,
+            ).where(EnrollmentRollup.enrollment_id.in_(enrollment_ids))
         )
-        print("total_contents", total_contents)
-
-        if total_contents == 0:
-            # print("No contents available in the course.")
-            return 0.0  # Return 0% if no contents are available
-
-        # Check if there's any progress recorded
-        if not enrollment.progress or not enrollment.progress.content_id:
-            # print("No progress recorded for this enrollment.")
-            return 0.0  # Return 0% if no progress is found
-
-        # Count the number of contents completed
-        content_id = enrollment.progress.content_id
-        last_content = session.query(Content).filter_by(id=content_id).one_or_none()
-        if not last_content:
-            # print("Last content not found.")
-            return 0.0  # Handle case where last content doesn't exist
-
-        chapter_id = last_content.chapter_id
-        # print("chapter_id", chapter_id)
-
-        completed_contents = (
-            session.query(func.count(Content.id))
-            .join(Chapter)
-            .filter(
-                and_(
-                    Chapter.course_id == course_id,
-                    Content.id <= content_id,
-                    Chapter.id <= chapter_id,
-                )
-            )
-            .scalar()
-        )
-        # print("completed_contents", completed_contents)
-
-        # Calculate progress percentage
-        progress_percentage = (completed_contents / total_contents) * 100
-        # print("progress_percentage", progress_percentage)
-        return progress_percentage
+        for enrollment_id, completed, remaining in rows:
+            total_contents = completed + remaining
+            if total_contents:
+                percentages[enrollment_id] = (completed / total_contents) * 100
+        return percentages
 
 
 class Progress(Base):
@@ -423,9 +391,31 @@ class Progress(Base):
 
     __table_args__ = (
         UniqueConstraint("enrollment_id", "content_id", name="_enrollment_content_uc"),
+        Index("ix_progress_content_id", "content_id"),
     )
 
 
+class EnrollmentRollup(Base):
+    __tablename__ = "enrollment_rollups"
+    enrollment_id = Column(Integer, ForeignKey("enrollments.id"), primary_key=True)
+    expected_time_to_complete = Column(Integer, nullable=False, default=0)
+    completed_hours = Column(Integer, nullable=False, default=0)
+    completed_content_count = Column(Integer, nullable=False, default=0)
+    remaining_content_count = Column(Integer, nullable=False, default=0)
+    pending_question_count = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default="Pending")
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class LearningActivityMonthly(Base):
+    __tablename__ = "learning_activity_monthly"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    month = Column(String(7), primary_key=True)  # "YYYY-MM"
+    hours = Column(Float, nullable=False, default=0)
+    events = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
 class Certificate(Base):
     __tablename__ = "certificates"
     id = Column(Integer, primary_key=True)
@@ -606,6 +596,8 @@ class ExternalCertification(Base):
         "User", foreign_keys=[approved_by], back_populates="approved_certifications"
     )
 
+    __table_args__ = (Index("ix_external_certifications_uploaded_by_id", "uploaded_by_id", "status"),)
+
     @property
     def sample_property(self):
         return len(self.uploaded_by.uploaded_certifications)
@@ -619,18 +611,32 @@ class QuizCompletions(Base):
     source = Column(String, nullable=False)
     enrollment_id = Column(Integer, ForeignKey("enrollments.id"), nullable=False)
     attempt_datetime = Column(DateTime, default=datetime.now)
+    attempt_no = Column(Integer)  # 1-based per enrollment and question, see quiz_attempts.py
+
+    __table_args__ = (
+        Index("ix_quiz_completions_enrollment_question", "enrollment_id", "question_id", "correct_answer"),
+        Index("ux_quiz_completions_attempt_no", "enrollment_id", "question_id", "attempt_no", unique=True),
+    )
 
     def calculate_attempt_no(self, db):
-        """Calculate the attempt number before inserting a new record."""
-        return (
-                db.query(func.count(QuizCompletions.id))
-                .filter(
-                    QuizCompletions.question_id == self.question_id,
-                    QuizCompletions.enrollment_id == self.enrollment_id,
-                )
-                .scalar()
-                + 1
+        """The attempt number the next attempt at this question gets."""
+        attempts = db.scalar(
+            select(QuizAttemptCounter.attempt_count).where(
+                QuizAttemptCounter.enrollment_id == self.enrollment_id,
+                QuizAttemptCounter.question_id == self.question_id,
+            )
         )
+        return (attempts or 0) + 1
+
+
+class QuizAttemptCounter(Base):
+    __tablename__ = "quiz_attempt_counters"
+    enrollment_id = Column(Integer, ForeignKey("enrollments.id"), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    attempt_count = Column(Integer, nullable=False, default=0)
+    correct_count = Column(Integer, nullable=False, default=0)
+    first_correct_attempt_no = Column(Integer)  # None until answered correctly
+    last_attempt_at = Column(DateTime)
 
 
 class AppStatus(Base):
@@ -640,6 +646,13 @@ class AppStatus(Base):
     update_datetime = Column(DateTime, default=datetime.now)
 
 
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)  # see migrations.MIGRATIONS
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=func.now())
+
+
 Chapter.expected_time_to_complete = column_property(
     select(func.coalesce(func.sum(Content.expected_time_to_complete), 0))
     .where(Content.chapter_id == Chapter.id)
@@ -653,81 +666,51 @@ Course.expected_time_to_complete = column_property(
     .correlate_except(Chapter)
     .label("expected_time_to_complete")
 )
+
+
+def _rollup_value(column, default):
+    # Enrollment figures are read from the materialized enrollment_rollups row
+    # (see enrollment_rollups.py) instead of being recomputed from progress.
+    return func.coalesce(
+        select(column)
+        .where(EnrollmentRollup.enrollment_id == Enrollment.id)
+        .correlate_except(EnrollmentRollup)
+        .scalar_subquery(),
+        default,
+    )
+
+
 Enrollment.expected_time_to_complete = column_property(
-    select(func.coalesce(Course.expected_time_to_complete, 0))
-    .where(Course.id == Enrollment.course_id)
-    .correlate_except(Course)
-    .label("expected_time_to_complete")
+    _rollup_value(EnrollmentRollup.expected_time_to_complete, 0).label(
+        "expected_time_to_complete"
+    )
 )
-
 Enrollment.completed_hours = column_property(
-    select(func.coalesce(func.sum(Content.expected_time_to_complete), 0))
-    .where(
-        Progress.enrollment_id == Enrollment.id, Content.id == Progress.content_id
-    )  # Ensuring it's for the current enrollment
-    .correlate_except(Content, Progress)
-    .label("completed_hours")
+    _rollup_value(EnrollmentRollup.completed_hours, 0).label("completed_hours")
 )
-
-# Calculate the completion percentage
 Enrollment.completion_percentage = column_property(
     select(
-        cast(
-            100
-            * func.coalesce(Enrollment.completed_hours, 0)
-            / func.coalesce(Enrollment.expected_time_to_complete, 0),
-            Float,
-        )
+        100
+        * cast(EnrollmentRollup.completed_hours, Float)
+        / func.nullif(EnrollmentRollup.expected_time_to_complete, 0)
     )
-    .correlate_except(Course)
+    .where(EnrollmentRollup.enrollment_id == Enrollment.id)
+    .correlate_except(EnrollmentRollup)
+    .scalar_subquery()
     .label("completion_percentage")
 )
 Enrollment.pending_question_count = column_property(
-    select(func.count(Questions.id))
-    .select_from(Questions)
-    .join(Course)
-    .outerjoin(
-        QuizCompletions,
-        and_(
-            QuizCompletions.question_id == Questions.id,
-            QuizCompletions.enrollment_id == Enrollment.id,
-            QuizCompletions.correct_answer == True,
-        ),
-    )
-    .filter(
-        Course.id == Enrollment.course_id,
-        QuizCompletions.id.is_(None),  # No completion record for this question
+    _rollup_value(EnrollmentRollup.pending_question_count, 0).label(
+        "pending_question_count"
     )
-    .correlate_except(QuizCompletions)
-    .scalar_subquery()
 )
-
 Enrollment.status = column_property(
-    case(
-        (and_(Enrollment.completed_hours > 0,
-              Enrollment.completed_hours < Enrollment.expected_time_to_complete), "Active"),
-        (and_(Enrollment.completed_hours == Enrollment.expected_time_to_complete,
-              Enrollment.pending_question_count == 0), "Completed"),
-        else_="Pending"
-    ).label("status")
+    _rollup_value(EnrollmentRollup.status, "Pending").label("status")
 )
 Enrollment.pending_chapter_count = column_property(
-    select(func.count(Chapter.id))
-    .select_from(Chapter)
-    .join(Content)
-    .outerjoin(
-        Progress,
-        and_(
-            Progress.content_id == Content.id,
-            Progress.enrollment_id == Enrollment.id,
-        ),
+    _rollup_value(EnrollmentRollup.remaining_content_count, 0).label(
+        "pending_chapter_count"
     )
-    .filter(
-        Chapter.course_id == Enrollment.course_id,
-        Progress.completed_at.is_(None),
-    )
-    .correlate_except(Progress)
-    .scalar_subquery()
 )
 
 #
@@ -0,0 +1,145 @@
+"""
+Bcrypt hashing and verification on a bounded pool of worker processes.
+
+Each bcrypt call costs a few hundred milliseconds of CPU. Running them in worker
+processes keeps that work off the event loop and away from the GIL, and the
+pending-job bound turns a login burst into fast 503s instead of a backlog that
+stalls every other endpoint. Set ``LMS_PASSWORD_HASH_WORKERS=0`` to hash inline
+(scripts, tests).
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from config import PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_WORKERS
+from metrics import PASSWORD_HASH_PENDING, PASSWORD_HASH_QUEUE_WAIT, PASSWORD_HASH_REJECTED
+
+# The one CryptContext of the application; worker processes build their own copy on import.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(password: str):
+    started_at = time.time()
+    return pwd_context.hash(password), started_at, time.time()
+
+
+def _verify(plain_password: str, hashed_password: str):
+    started_at = time.time()
+    return pwd_context.verify(plain_password, hashed_password), started_at, time.time()
+
+
+class PasswordService:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.pending = 0
+        self.peak_pending = 0
+        self.total_queue_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            PASSWORD_HASH_REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent sign-ins, please retry",
+                headers={"Retry-After": "1"},
+            )
+        submitted_at = time.time()
+        with self._lock:
+            self.submitted += 1
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        PASSWORD_HASH_PENDING.inc()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._finish(None, submitted_at)
+            raise
+        future.add_done_callback(lambda done: self._finish(done, submitted_at))
+        return future
+
+    def _finish(self, future, submitted_at: float):
+        timings = None
+        if future is not None and not future.cancelled() and future.exception() is None:
+            _, started_at, finished_at = future.result()
+            timings = (started_at - submitted_at, finished_at - started_at)
+        with self._lock:
+            self.pending -= 1
+            if timings is not None:
+                self.completed += 1
+                self.total_queue_seconds += max(timings[0], 0.0)
+                self.total_run_seconds += timings[1]
+        PASSWORD_HASH_PENDING.dec()
+        if timings is not None:
+            PASSWORD_HASH_QUEUE_WAIT.observe(max(timings[0], 0.0))
+        self._slots.release()
+
+    def hash(self, password: str) -> str:
+        if self.workers <= 0:
+            return pwd_context.hash(password)
+        return self._submit(_hash, password).result()[0]
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        if self.workers <= 0:
+            return pwd_context.verify(plain_password, hashed_password)
+        return self._submit(_verify, plain_password, hashed_password).result()[0]
+
+    async def hash_async(self, password: str) -> str:
+        if self.workers <= 0:
+            return pwd_context.hash(password)
+        result = await asyncio.wrap_future(self._submit(_hash, password))
+        return result[0]
+
+    async def verify_async(self, plain_password: str, hashed_password: str) -> bool:
+        if self.workers <= 0:
+            return pwd_context.verify(plain_password, hashed_password)
+        result = await asyncio.wrap_future(
+            self._submit(_verify, plain_password, hashed_password)
+        )
+        return result[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "peak_pending": self.peak_pending,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "total_queue_seconds": self.total_queue_seconds,
+                "total_run_seconds": self.total_run_seconds,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_service = PasswordService(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
@@ -0,0 +1,63 @@
+"""
+Process-local cache of authenticated users, keyed by the token subject (email).
+
+``auth.get_current_user`` reads through it, so a valid token resolves to a
+``UserPrincipal`` snapshot without a database round-trip. User writes
+(``crud.update_user``, ``crud.delete_user``, password resets) invalidate the
+entry; the TTL bounds staleness for anything else, including other workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS
+from metrics import record_cache
+from schemas import UserPrincipal
+
+
+class PrincipalCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, subject: str) -> Optional[UserPrincipal]:
+        principal = self._lookup(subject)
+        record_cache("principal", principal is not None)
+        return principal
+
+    def _lookup(self, subject: str) -> Optional[UserPrincipal]:
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[subject]
+                return None
+            self._entries.move_to_end(subject)
+            return principal
+
+    def put(self, subject: str, principal: UserPrincipal):
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[subject] = (principal, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *subjects: Optional[str]):
+        with self._lock:
+            for subject in subjects:
+                if subject is not None:
+                    self._entries.pop(subject, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS)
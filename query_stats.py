@@ -0,0 +1,141 @@
+"""
+Per-request SQL statement counts, database time and N+1 detection.
+
+With ``LMS_QUERY_STATS`` on, ``instrument_engine`` hooks the engines'
+cursor-execute events and ``QueryStatsMiddleware`` gives every HTTP request its
+own ``QueryStats`` through a context variable, which follows the request into
+threadpool workers and the async engine. Each response then carries
+
+    X-DB-Query-Count, X-DB-Time-Ms and, when a statement ran at least
+    LMS_QUERY_STATS_REPEAT_THRESHOLD times, X-DB-Repeated-Statements
+
+and one JSON line is logged to the ``query_stats`` logger: INFO normally,
+WARNING when repeated statements point at a lazy load in a loop. Statements run
+after the response has started (streamed bodies) are in the log line only.
+With the setting off nothing is hooked or added.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import QUERY_STATS_REPEAT_THRESHOLD
+
+logger = logging.getLogger("query_stats")
+
+# Longest statement text kept in a log line
+MAX_STATEMENT_LENGTH = 500
+
+
+class QueryStats:
+    """Statements run on behalf of one request, by SQL text with parameters left out."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.statements: Dict[str, int] = {}
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+
+    def repeated(self, threshold: int = QUERY_STATS_REPEAT_THRESHOLD) -> List[dict]:
+        """Statements that ran at least ``threshold`` times, most frequent first."""
+        return [
+            {"statement": statement[:MAX_STATEMENT_LENGTH], "count": count}
+            for statement, count in sorted(self.statements.items(), key=lambda item: -item[1])
+            if count >= threshold
+        ]
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None:
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    started = conn.info.get("query_started_at")
+    if started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+
+def instrument_engine(sync_engine):
+    """Counts the statements ``sync_engine`` runs into the current request's ``QueryStats``."""
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Collects the statements run inside the block, for scripts and benchmarks."""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class QueryStatsMiddleware:
+    def __init__(self, app: ASGIApp, repeat_threshold: int = QUERY_STATS_REPEAT_THRESHOLD):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_stats(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Query-Count"] = str(stats.count)
+                headers["X-DB-Time-Ms"] = f"{stats.total_seconds * 1000:.1f}"
+                repeated = stats.repeated(self.repeat_threshold)
+                if repeated:
+                    headers["X-DB-Repeated-Statements"] = str(len(repeated))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current_stats.reset(token)
+            self._log(scope, status_code, stats, time.perf_counter() - started)
+
+    def _log(self, scope: Scope, status_code: int, stats: QueryStats, seconds: float):
+        repeated = stats.repeated(self.repeat_threshold)
+        level = logging.WARNING if repeated else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        record = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status_code,
+            "duration_ms": round(seconds * 1000, 1),
+            "queries": stats.count,
+            "db_time_ms": round(stats.total_seconds * 1000, 1),
+        }
+        if repeated:
+            record["repeated_statements"] = repeated
+        logger.log(level, json.dumps(record))
@@ -0,0 +1,216 @@
+"""
+Persisted quiz attempt numbering.
+
+Every ``quiz_completions`` row stores its ``attempt_no`` (1-based per enrollment
+and question), and ``quiz_attempt_counters`` keeps one row per enrollment and
+question with the number of attempts and correct answers, the attempt first
+answered correctly and when the last one happened. ``record_attempts`` bumps
+the counters with a single upsert and numbers the new completions from what it
+returns, so numbering never counts earlier attempts, and concurrent submissions
+to the same question serialize on the counter row. Counters and numbers can be
+rebuilt from ``quiz_completions`` with:
+
+    python quiz_attempts.py [--enrollment-id ID ...]
+
+None of the helpers here commit; callers own the transaction.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import case, delete, func, insert, select, true, update
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import QuizAttemptCounter, QuizCompletions
+
+
+def record_attempts(
+    db: Session,
+    enrollment_id: int,
+    answers: Sequence[Tuple[int, bool]],
+    source: str,
+    attempted_at: Optional[datetime] = None,
+) -> Tuple[List[dict], Set[int]]:
+    """
+    Inserts one quiz completion per graded answer, numbered after the
+    enrollment's earlier attempts at the same question.
+
+    Args:
+    enrollment_id (int): The enrollment answering.
+    answers (Sequence[Tuple[int, bool]]): (question ID, answered correctly) pairs, in the order given.
+    source (str): Stored on every completion.
+    attempted_at (datetime): Stored on every completion; defaults to now.
+
+    Returns:
+    Tuple[List[dict], Set[int]]: The inserted completions in the order of ``answers``,
+    and the IDs of the questions that had been answered correctly before this call.
+    """
+    attempted_at = attempted_at or datetime.now()
+    counts: Dict[int, dict] = {}
+    for question_id, is_correct in answers:
+        count = counts.setdefault(
+            question_id,
+            dict(
+                enrollment_id=enrollment_id,
+                question_id=question_id,
+                attempt_count=0,
+                correct_count=0,
+                first_correct_attempt_no=None,
+                last_attempt_at=attempted_at,
+            ),
+        )
+        count["attempt_count"] += 1
+        if is_correct:
+            count["correct_count"] += 1
+            if count["first_correct_attempt_no"] is None:
+                count["first_correct_attempt_no"] = count["attempt_count"]
+
+    table = QuizAttemptCounter.__table__
+    # Sorted so concurrent submissions lock the counter rows in the same order
+    upsert = dialect_insert(db.get_bind(), table).values([counts[key] for key in sorted(counts)])
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[table.c.enrollment_id, table.c.question_id],
+        set_=dict(
+            attempt_count=table.c.attempt_count + upsert.excluded.attempt_count,
+            correct_count=table.c.correct_count + upsert.excluded.correct_count,
+            # The batch counted from 1; move it past the attempts already recorded
+            first_correct_attempt_no=func.coalesce(
+                table.c.first_correct_attempt_no,
+                table.c.attempt_count + upsert.excluded.first_correct_attempt_no,
+            ),
+            last_attempt_at=upsert.excluded.last_attempt_at,
+        ),
+    ).returning(table.c.question_id, table.c.attempt_count, table.c.first_correct_attempt_no)
+
+    next_attempt_no, answered_before = {}, set()
+    for question_id, attempt_count, first_correct_attempt_no in db.execute(upsert):
+        previous_attempts = attempt_count - counts[question_id]["attempt_count"]
+        next_attempt_no[question_id] = previous_attempts + 1
+        if first_correct_attempt_no is not None and first_correct_attempt_no <= previous_attempts:
+            answered_before.add(question_id)
+
+    completions = []
+    for question_id, is_correct in answers:
+        completions.append(
+            dict(
+                question_id=question_id,
+                correct_answer=is_correct,
+                source=source,
+                enrollment_id=enrollment_id,
+                attempt_datetime=attempted_at,
+                attempt_no=next_attempt_no[question_id],
+            )
+        )
+        next_attempt_no[question_id] += 1
+
+    inserted = db.execute(
+        insert(QuizCompletions).returning(
+            QuizCompletions.id, QuizCompletions.question_id, QuizCompletions.attempt_no
+        ),
+        completions,
+    )
+    ids = {(question_id, attempt_no): id_ for id_, question_id, attempt_no in inserted}
+    for completion in completions:
+        completion["id"] = ids[completion["question_id"], completion["attempt_no"]]
+    return completions, answered_before
+
+
+def rebuild_attempt_counters(db: Session, enrollment_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Renumbers quiz completions by attempt time and recomputes their counters.
+
+    Args:
+    enrollment_ids (Iterable[int]): Limit the rebuild to these enrollments.
+
+    Returns:
+    int: The number of counter rows written.
+    """
+    if enrollment_ids is None:
+        scope = true()
+    else:
+        scope = QuizCompletions.enrollment_id.in_(list(enrollment_ids))
+
+    numbered = (
+        select(
+            QuizCompletions.id,
+            func.row_number()
+            .over(
+                partition_by=(QuizCompletions.enrollment_id, QuizCompletions.question_id),
+                order_by=(QuizCompletions.attempt_datetime, QuizCompletions.id),
+            )
+            .label("attempt_no"),
+        )
+        .where(scope)
+        .subquery()
+    )
+    # Cleared first so no row collides with an old number on the unique index
+    db.execute(
+        update(QuizCompletions)
+        .where(scope)
+        .values(attempt_no=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(QuizCompletions)
+        .where(QuizCompletions.id == numbered.c.id)
+        .values(attempt_no=numbered.c.attempt_no)
+        .execution_options(synchronize_session=False)
+    )
+
+    counter_scope = true()
+    if enrollment_ids is not None:
+        counter_scope = QuizAttemptCounter.enrollment_id.in_(list(enrollment_ids))
+    db.execute(
+        delete(QuizAttemptCounter)
+        .where(counter_scope)
+        .execution_options(synchronize_session=False)
+    )
+    is_correct = QuizCompletions.correct_answer == True
+    counts = (
+        select(
+            QuizCompletions.enrollment_id,
+            QuizCompletions.question_id,
+            func.count(QuizCompletions.id),
+            func.sum(case((is_correct, 1), else_=0)),
+            func.min(case((is_correct, QuizCompletions.attempt_no))),
+            func.max(QuizCompletions.attempt_datetime),
+        )
+        .where(scope)
+        .group_by(QuizCompletions.enrollment_id, QuizCompletions.question_id)
+    )
+    result = db.execute(
+        insert(QuizAttemptCounter).from_select(
+            [
+                "enrollment_id",
+                "question_id",
+                "attempt_count",
+                "correct_count",
+                "first_correct_attempt_no",
+                "last_attempt_at",
+            ],
+            counts,
+        )
+    )
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal
+    from migrations import upgrade
+
+    parser = argparse.ArgumentParser(
+        description="Renumber quiz attempts and rebuild quiz_attempt_counters from quiz_completions."
+    )
+    parser.add_argument("--enrollment-id", type=int, action="append", dest="enrollment_ids")
+    args = parser.parse_args()
+
+    upgrade()
+    db = SessionLocal()
+    try:
+        count = rebuild_attempt_counters(db, enrollment_ids=args.enrollment_ids)
+        db.commit()
+        print(f"Rebuilt {count} quiz attempt counters")
+    finally:
+        db.close()
@@ -4,12 +4,14 @@ from typing import Annotated, Union
 from fastapi import APIRouter, Depends, Response, status
 from fastapi import HTTPException, Header
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 import auth
 import crud
 import schemas
-from dependencies import get_db
+from dependencies import get_async_db, get_db
 from models import User, AppStatus
 from schemas import Token, UserDisplay
 
@@ -17,12 +19,12 @@ app = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @app.post("/token", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
         response: Response,
         form_data: OAuth2PasswordRequestForm = Depends(),
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
 ):
-    user = auth.authenticate_user(
+    user = await auth.authenticate_user_async(
         db, email=form_data.username, password=form_data.password
     )
     if not user:
@@ -35,7 +37,7 @@ def login_for_access_token(
     access_token = auth.create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
     )
-    app_status = db.query(AppStatus).first()
+    app_status = await db.scalar(select(AppStatus).limit(1))
 
     return Token(
         **{
@@ -1,16 +1,29 @@
 import json
 from datetime import datetime
-from typing import List
-
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Path, Form
-from sqlalchemy import exists
-from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Path, Form, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy.sql import func, and_, or_
 
 # Import local modules
 from auth import get_current_user
+from base64_uploads import (
+    BASE64_CONTENT_FORM_BODY,
+    BASE64_FILE_BODY,
+    missing_form_fields,
+    receive_base64_file,
+    receive_form_base64,
+)
+from course_catalog import DEFAULT_SORT, OPTIONAL_FIELDS, SORTS, CourseCatalog, InvalidCursor
+from course_tree import CourseTreeEditor, InvalidTreeUpdate
 from crud import enroll_users
-from dependencies import get_db
+from dependencies import get_async_db, get_db
+from enrollment_rollups import refresh_course_rollups
 from file_storage import FileStorage
 from models import (
     Course,
@@ -18,11 +31,13 @@ from models import (
     User,
     Content,
     Enrollment,
-    Questions,
     Certificate,
     QuizCompletions,
 )
 from schemas import (
+    Base64FileInfo,
+    CourseBatchCreate,
+    CourseCatalogItem,
     CourseCreate,
     CourseFullDisplay,
     ChapterCreate,
@@ -34,61 +49,96 @@ from schemas import (
     CertificateDisplay,
     EnrolledCourseDisplay,
     ListCoursesDisplay,
+    UserPrincipal,
 )
 
 app = APIRouter(tags=["course"])
 
 
+def course_display_options():
+    """Eager loads for CourseFullDisplay, which async sessions cannot lazy load."""
+    return (
+        selectinload(Course.creator).selectinload(User.counselor),
+        selectinload(Course.approver).selectinload(User.counselor),
+        selectinload(Course.chapters).selectinload(Chapter.contents),
+        selectinload(Course.chapters).selectinload(Chapter.questions),
+        selectinload(Course.questions),
+    )
+
+
 # ------------------- Course Operations -------------------
 
 
 @app.post("/courses/", response_model=CourseFullDisplay)
 async def create_course(
     course_data: CourseCreate,  # Assume JSON data is submitted
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     if current_user.role_name == "Employee":
         raise HTTPException(
             status_code=403, detail="Only instructors can create courses"
         )
 
-    if course_data.service_line_id is None:
-        course_data.service_line_id = current_user.service_line_id
-
-    new_course = Course(
-        **course_data.dict(exclude={"chapters"}), created_by=current_user.id
-    )
-    db.add(new_course)
-    db.commit()
-    db.refresh(new_course)
-
-    for chapter_data in course_data.chapters:
-        new_chapter = Chapter(
-            **chapter_data.dict(exclude={"quizzes"}),  # Exclude contents entirely
-            course_id=new_course.id,
+    # The whole tree goes in as one transaction, a bulk insert per table
+    course_ids = await db.run_sync(
+        lambda session: CourseTreeEditor(session).create(
+            [course_data], current_user.id, current_user.service_line_id
         )
-        db.add(new_chapter)
-        db.commit()
-        db.refresh(new_chapter)
-
-        for quiz_data in chapter_data.quizzes:
-            new_question = Questions(chapter_id=new_chapter.id, **quiz_data.dict())
-            db.add(new_question)
-            db.commit()
+    )
+    await db.commit()
 
-    course = db.query(Course).filter(Course.id == new_course.id).first()
+    course = await db.scalar(
+        select(Course)
+        .options(*course_display_options())
+        .where(Course.id == course_ids[0])
+    )
     course_display = CourseFullDisplay.from_orm(course)
     course_display.is_enrolled = False
     return course_display
 
 
+@app.post("/courses/batch/", response_model=List[CourseFullDisplay])
+async def create_courses(
+    batch: CourseBatchCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    """Creates many courses at once (content library imports); all of them or none."""
+    if current_user.role_name == "Employee":
+        raise HTTPException(
+            status_code=403, detail="Only instructors can create courses"
+        )
+
+    course_ids = await db.run_sync(
+        lambda session: CourseTreeEditor(session).create(
+            batch.courses, current_user.id, current_user.service_line_id
+        )
+    )
+    await db.commit()
+
+    courses = {
+        course.id: course
+        for course in await db.scalars(
+            select(Course)
+            .options(*course_display_options())
+            .where(Course.id.in_(course_ids))
+        )
+    }
+    result = []
+    for course_id in course_ids:
+        course_display = CourseFullDisplay.from_orm(courses[course_id])
+        course_display.is_enrolled = False
+        result.append(course_display)
+    return result
+
+
 # @app.put("/courses/{course_id}/", response_model=CourseFullDisplay)
 # async def update_course(
 #         course_id: int,
 #         updated_course_data: CourseCreate,  # Assume JSON data for the entire course including chapters and quizzes
 #         db: Session = Depends(get_db),
-#         current_user: User = Depends(get_current_user),
+#         current_user: UserPrincipal = Depends(get_current_user),
 # ):
 #     # Retrieve the existing course
 #     course = db.query(Course).filter(Course.id == course_id).first()
@@ -127,7 +177,7 @@ async def create_course(
 
 @app.get("/courses/", response_model=List[CourseSortDisplay])
 def get_courses(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)
 ):
     # Use a subquery to check if the user is enrolled in each course
     subquery = (
@@ -153,29 +203,77 @@ def get_courses(
     return result
 
 
+@app.get(
+    "/courses/catalog/",
+    response_model=List[CourseCatalogItem],
+    response_model_exclude_unset=True,
+)
+def get_course_catalog(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor returned in X-Next-Cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    sort: str = Query(DEFAULT_SORT, description=", ".join(SORTS)),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated optional fields: " + ", ".join(OPTIONAL_FIELDS)
+    ),
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    service_line_id: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    tags: Optional[List[str]] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort: {sort}")
+    requested_fields = {name.strip() for name in (fields or "").split(",") if name.strip()}
+    unknown_fields = requested_fields - set(OPTIONAL_FIELDS)
+    if unknown_fields:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown_fields))}"
+        )
+
+    try:
+        items, next_cursor = CourseCatalog(db).page(
+            current_user.id,
+            cursor=cursor,
+            limit=limit,
+            sort=sort,
+            fields=requested_fields,
+            status=status,
+            category=category,
+            service_line_id=service_line_id,
+            difficulty_level=difficulty,
+            tags=tags,
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+
 # Retrieve courses the current user is enrolled in (Pending status)
 @app.get("/courses/enrolled/", response_model=List[EnrolledCourseDisplay])
 def get_courses(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)
 ):
     # Retrieve courses with "Pending" status
     enrolled_courses = (
-        db.query(Course)
+        db.query(Course, Enrollment)
         .join(Enrollment, Enrollment.course_id == Course.id)
         .filter(Enrollment.user_id == current_user.id)
         .filter(Enrollment.status == "Pending")
-        .options(joinedload(Course.enrollments))
         .all()
     )
 
     # Prepare the response by enriching the course data with enrollment-specific properties
     response = []
-    for course in enrolled_courses:
-        for enrollment in course.enrollments:
-            course_display = EnrolledCourseDisplay.from_orm(course)
-            course_display.completed_hours = enrollment.completed_hours
-            course_display.completion_percentage = enrollment.completion_percentage
-            response.append(course_display)
+    for course, enrollment in enrolled_courses:
+        course_display = EnrolledCourseDisplay.from_orm(course)
+        course_display.completed_hours = enrollment.completed_hours
+        course_display.completion_percentage = enrollment.completion_percentage
+        response.append(course_display)
 
     return response
 
@@ -183,35 +281,33 @@ def get_courses(
 # Retrieve active courses with user's progress (Active status)
 @app.get("/courses/active/", response_model=List[ListCoursesDisplay])
 def get_courses(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)
 ):
     # Retrieve courses with "Active" status
     enrolled_courses = (
-        db.query(Course)
+        db.query(Course, Enrollment)
         .join(Enrollment, Enrollment.course_id == Course.id)
         .filter(Enrollment.user_id == current_user.id)
         .filter(Enrollment.status == "Active")
-        .options(joinedload(Course.enrollments))
         .all()
     )
 
     # Prepare the response by enriching the course data with enrollment-specific properties
     response = []
-    for course in enrolled_courses:
-        for enrollment in course.enrollments:
-            course_display = ListCoursesDisplay.from_orm(course)
-            course_display.completed_hours = enrollment.completed_hours
-            course_display.completion_percentage = enrollment.completion_percentage
-            course_display.total_questions = len(course.questions)
-            course_display.completed_questions = (
-                db.query(func.count(QuizCompletions.id))
-                .filter(
-                    QuizCompletions.enrollment_id == enrollment.id,
-                    QuizCompletions.correct_answer == True,
-                )
-                .scalar()
+    for course, enrollment in enrolled_courses:
+        course_display = ListCoursesDisplay.from_orm(course)
+        course_display.completed_hours = enrollment.completed_hours
+        course_display.completion_percentage = enrollment.completion_percentage
+        course_display.total_questions = len(course.questions)
+        course_display.completed_questions = (
+            db.query(func.count(QuizCompletions.id))
+            .filter(
+                QuizCompletions.enrollment_id == enrollment.id,
+                QuizCompletions.correct_answer == True,
             )
-            response.append(course_display)
+            .scalar()
+        )
+        response.append(course_display)
 
     return response
 
@@ -219,35 +315,33 @@ def get_courses(
 # Retrieve completed courses (Completed status)
 @app.get("/courses/completed/", response_model=List[ListCoursesDisplay])
 def get_courses(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)
 ):
     # Retrieve courses with "Completed" status
     enrolled_courses = (
-        db.query(Course)
+        db.query(Course, Enrollment)
         .join(Enrollment, Enrollment.course_id == Course.id)
         .filter(Enrollment.user_id == current_user.id)
         .filter(Enrollment.status == "Completed")
-        .options(joinedload(Course.enrollments))
         .all()
     )
 
     # Prepare the response by enriching the course data with enrollment-specific properties
     response = []
-    for course in enrolled_courses:
-        for enrollment in course.enrollments:
-            course_display = ListCoursesDisplay.from_orm(course)
-            course_display.completed_hours = enrollment.completed_hours
-            course_display.completion_percentage = enrollment.completion_percentage
-            course_display.total_questions = len(course.questions)
-            course_display.completed_questions = (
-                db.query(func.count(QuizCompletions.id))
-                .filter(
-                    QuizCompletions.enrollment_id == enrollment.id,
-                    QuizCompletions.correct_answer == True,
-                )
-                .scalar()
+    for course, enrollment in enrolled_courses:
+        course_display = ListCoursesDisplay.from_orm(course)
+        course_display.completed_hours = enrollment.completed_hours
+        course_display.completion_percentage = enrollment.completion_percentage
+        course_display.total_questions = len(course.questions)
+        course_display.completed_questions = (
+            db.query(func.count(QuizCompletions.id))
+            .filter(
+                QuizCompletions.enrollment_id == enrollment.id,
+                QuizCompletions.correct_answer == True,
             )
-            response.append(course_display)
+            .scalar()
+        )
+        response.append(course_display)
 
     return response
 
@@ -257,7 +351,7 @@ def get_courses(
 # def get_course(
 #         course_id: int,
 #         db: Session = Depends(get_db),
-#         current_user: User = Depends(get_current_user),
+#         current_user: UserPrincipal = Depends(get_current_user),
 # ):
 #     course = db.query(Course).filter(Course.id == course_id).first()
 #     if not course:
@@ -270,7 +364,7 @@ def update_course(
     course_id: int,
     course_data: CourseUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     if current_user.role_name == "Employee":
         raise HTTPException(status_code=403, detail="Employees cannot update courses")
@@ -284,175 +378,21 @@ def update_course(
             status_code=403, detail="Instructors can only update their own courses"
         )
 
-    # Update course properties
-    for var, value in vars(course_data).items():
-        if var == "chapters" or var == "questions":
-            continue
-        elif value is not None:
-            setattr(course, var, value)
+    # One transaction for the whole save: either every change lands or none does
+    try:
+        diff = CourseTreeEditor(db).update(course, course_data, current_user.id)
+    except InvalidTreeUpdate as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
 
+    # Content and question changes shift every enrollment's totals
+    if not diff.is_empty():
+        refresh_course_rollups(db, course_id)
     db.commit()
 
-    # Update course-level questions
-    if course_data.questions:
-        existing_question_ids = {question.id for question in course.questions}
-        updated_question_ids = {
-            question.id for question in course_data.questions if question.id
-        }
-
-        # Delete questions that are no longer present in the update request
-        questions_to_delete = existing_question_ids - updated_question_ids
-        for question_id in questions_to_delete:
-            question = db.query(Questions).filter(Questions.id == question_id).first()
-            if question:
-                db.delete(question)
-                db.commit()
-
-        # Create or update questions
-        for q in course_data.questions:
-            if q.id:
-                # Update existing question
-                question = db.query(Questions).filter(Questions.id == q.id).first()
-                if question:
-                    for var, value in vars(q).items():
-                        if var == "id":
-                            continue
-                        elif value is not None:
-                            setattr(question, var, value)
-                    db.commit()
-            else:
-                # Create new question
-                new_question = Questions(
-                    **q.dict(exclude={"id", "course_id"}),
-                    course_id=course_id,
-                    added_by=current_user.id,
-                )
-                db.add(new_question)
-                db.commit()
-                db.refresh(new_question)
-                q.id = new_question.id
-
-    if course_data.chapters:
-        existing_chapter_ids = {chapter.id for chapter in course.chapters}
-        updated_chapter_ids = {
-            chapter.id for chapter in course_data.chapters if chapter.id
-        }
-
-        # Delete chapters that are no longer present in the update request
-        chapters_to_delete = existing_chapter_ids - updated_chapter_ids
-        for chapter_id in chapters_to_delete:
-            chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
-            if chapter:
-                for content in chapter.contents:
-                    db.delete(content)
-                for question in chapter.questions:
-                    db.delete(question)
-                db.delete(chapter)
-                db.commit()
-
-        # Create or update chapters
-        for c in course_data.chapters:
-            if c.id:
-                # Update existing chapter
-                chapter = db.query(Chapter).filter(Chapter.id == c.id).first()
-                if chapter:
-                    for var, value in vars(c).items():
-                        if var == "id" or var == "contents" or var == "questions":
-                            continue
-                        elif value is not None:
-                            setattr(chapter, var, value)
-                    db.commit()
-            else:
-                # Create new chapter
-                new_chapter = Chapter(
-                    **c.dict(exclude={"id", "contents", "questions"}),
-                    course_id=course_id,
-                )
-                db.add(new_chapter)
-                db.commit()
-                db.refresh(new_chapter)
-                c.id = new_chapter.id
-
-            # Handle contents
-            existing_content_ids = {content.id for content in chapter.contents}
-            updated_content_ids = {content.id for content in c.contents if content.id}
-
-            # Delete contents that are no longer present in the update request
-            contents_to_delete = existing_content_ids - updated_content_ids
-            for content_id in contents_to_delete:
-                content = db.query(Content).filter(Content.id == content_id).first()
-                if content:
-                    db.delete(content)
-                    db.commit()
-
-            # Create or update contents
-            for content_data in c.contents:
-                if content_data.id:
-                    # Update existing content
-                    content = (
-                        db.query(Content).filter(Content.id == content_data.id).first()
-                    )
-                    if content:
-                        for var, value in vars(content_data).items():
-                            if var == "id":
-                                continue
-                            elif value is not None:
-                                setattr(content, var, value)
-                        db.commit()
-                else:
-                    # Create new content
-                    new_content = Content(
-                        **content_data.dict(exclude={"id", "chapter_id"}),
-                        chapter_id=c.id,
-                    )
-                    db.add(new_content)
-                    db.commit()
-                    db.refresh(new_content)
-                    content_data.id = new_content.id
-
-            # Handle chapter questions
-            existing_question_ids = {question.id for question in chapter.questions}
-            updated_question_ids = {
-                question.id for question in c.questions if question.id
-            }
-
-            # Delete questions that are no longer present in the update request
-            questions_to_delete = existing_question_ids - updated_question_ids
-            for question_id in questions_to_delete:
-                question = (
-                    db.query(Questions).filter(Questions.id == question_id).first()
-                )
-                if question:
-                    db.delete(question)
-                    db.commit()
-
-            # Create or update questions
-            for question_data in c.questions:
-                if question_data.id:
-                    # Update existing question
-                    question = (
-                        db.query(Questions)
-                        .filter(Questions.id == question_data.id)
-                        .first()
-                    )
-                    if question:
-                        for var, value in vars(question_data).items():
-                            if var == "id":
-                                continue
-                            elif value is not None:
-                                setattr(question, var, value)
-                        db.commit()
-                else:
-                    # Create new question
-                    new_question = Questions(
-                        **question_data.dict(exclude={"id"}), chapter_id=c.id
-                    )
-                    db.add(new_question)
-                    db.commit()
-                    db.refresh(new_question)
-                    question_data.id = new_question.id
-
-    db.refresh(course)
+    course = db.scalars(
+        select(Course).where(Course.id == course_id).options(*course_display_options())
+    ).one()
     return CourseFullDisplay.from_orm(course)
 
 
@@ -460,7 +400,7 @@ def update_course(
 def update_question(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     # DELETE course by id only if there is no Enrollments, delete all  Chapters, delete all content
     # Check for any existing enrollments for the course
@@ -499,7 +439,7 @@ def update_question(
 def create_chapter(
     chapter: ChapterCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     course = db.query(Course).filter(Course.id == chapter.course_id).first()
     if not course or course.created_by != current_user.id:
@@ -547,7 +487,9 @@ async def create_content(
         file_storage = FileStorage()
 
         try:
-            file_metadata = file_storage.save_file(file, db, type="Course content")
+            file_metadata = await run_in_threadpool(
+                file_storage.save_file, file, db, type="Course content"
+            )
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
@@ -563,73 +505,92 @@ async def create_content(
         db.refresh(new_content)
         responses.append(new_content)
 
+    refresh_course_rollups(db, chapter.course_id)
+    db.commit()
     return responses
 
 
-@app.post("/chapters/{chapter_id}/content_/", response_model=List[ContentDisplay])
+@app.post(
+    "/chapters/{chapter_id}/content_/",
+    response_model=List[ContentDisplay],
+    openapi_extra=BASE64_CONTENT_FORM_BODY,
+)
 async def create_content(
     chapter_id: int,
-    titles_json: str = Form(...),  # Receive JSON-encoded titles as a string
-    expected_time_to_complete: str = Form(...),
-    files: List[str] = Form(...),  # List of Base64-encoded file data
-    filenames: List[str] = Form(...),  # List of filenames
-    content_types: List[str] = Form(...),  # List of content types
+    request: Request,
     db: Session = Depends(get_db),
 ):
     chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
 
+    # Every file is decoded into a spool file as the form streams in
+    file_storage = FileStorage()
     try:
-        titles = json.loads(titles_json)  # Deserialize JSON string into a Python list
-        expected_time_to_complete = json.loads(expected_time_to_complete)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON format for titles.")
-
-    if len(files) != len(titles):
-        raise HTTPException(
-            status_code=400, detail="The number of titles and files must match."
+        form, spools = await receive_form_base64(
+            request, file_storage.tmp_directory, file_field="files"
         )
-    if len(files) != len(expected_time_to_complete):
-        raise HTTPException(
-            status_code=400,
-            detail="The number of titles and expected_times must match.",
-        )
-    file_storage = FileStorage()
-    responses = []
-    for idx in range(len(files)):
-        file_data = files[idx]
-        filename = filenames[idx]
-        content_type = content_types[idx]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    try:
+        missing = missing_form_fields(
+            form, ["titles_json", "expected_time_to_complete", "filenames", "content_types"]
+        )
+        if not spools:
+            missing += missing_form_fields(form, ["files"])
+        if missing:
+            raise RequestValidationError(missing)
+        filenames = form["filenames"]
+        content_types = form["content_types"]
 
         try:
-            # Decode Base64
-            file_bytes = base64.b64decode(file_data)
-        except base64.binascii.Error:
-            raise HTTPException(status_code=400, detail=f"Invalid Base64 encoding for file at index {idx}.")
-
-        # Create BytesIO object
-        file_io = BytesIO(file_bytes)
-        file_io.seek(0)
-
-        # Create a fake UploadFile
-        upload_file = UploadFile(
-            filename=filename,
-            content_type=content_type,
-            file=file_io
-        )
+            titles = json.loads(form["titles_json"][0])  # Deserialize JSON string into a Python list
+            expected_time_to_complete = json.loads(form["expected_time_to_complete"][0])
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid JSON format for titles.")
+
+        if len(spools) != len(titles):
+            raise HTTPException(
+                status_code=400, detail="The number of titles and files must match."
+            )
+        if len(spools) != len(expected_time_to_complete):
+            raise HTTPException(
+                status_code=400,
+                detail="The number of titles and expected_times must match.",
+            )
+        if len(spools) != len(filenames) or len(spools) != len(content_types):
+            raise HTTPException(
+                status_code=400,
+                detail="The number of files, filenames and content types must match.",
+            )
+    except (HTTPException, RequestValidationError):
+        for spool in spools:
+            await spool.discard()
+        raise
 
+    responses = []
+    for idx, spool in enumerate(spools):
         try:
-            file_metadata = file_storage.save_file(upload_file, db, type="Course content")
+            file_metadata = await run_in_threadpool(
+                file_storage.save_spooled_file,
+                spool.path,
+                filenames[idx],
+                content_types[idx],
+                db,
+                type="Course content",
+                sha256=spool.sha256,
+            )
         except ValueError as e:
+            for pending in spools[idx + 1:]:
+                await pending.discard()
             raise HTTPException(status_code=400, detail=str(e))
 
         new_content = Content(
             chapter_id=chapter_id,
             title=titles[idx],  # Use the corresponding title from the deserialized list
             expected_time_to_complete=expected_time_to_complete[idx],
-            content_type=content_type,
+            content_type=content_types[idx],
             file_id=file_metadata.FileID,
         )
         db.add(new_content)
@@ -637,6 +598,8 @@ async def create_content(
         db.refresh(new_content)
         responses.append(new_content)
 
+    refresh_course_rollups(db, chapter.course_id)
+    db.commit()
     return responses
 
 
@@ -647,20 +610,22 @@ async def create_content(
 @app.post("/enroll/self/", status_code=201)
 async def enroll_self(
     request: EnrollmentRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     if len(request.user_ids) != 1 or request.user_ids[0] != current_user.id:
         raise HTTPException(status_code=403, detail="You can only enroll yourself.")
 
-    return enroll_users(request.course_id, request.user_ids, db)
+    return await db.run_sync(
+        lambda session: enroll_users(request.course_id, request.user_ids, session)
+    )
 
 
 @app.patch("/courses/{course_id}/approve")
 def approve_course(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     if current_user.role_name in ["Employee", "Instructor"]:
         raise HTTPException(status_code=403, detail="Only admins can approve courses")
@@ -681,7 +646,7 @@ def approve_course(
 def approve_course(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     if current_user.role_name in ["Employee", "Instructor"]:
         raise HTTPException(status_code=403, detail="Only admins can approve courses")
@@ -732,39 +697,38 @@ async def upload_course_thumbnail(
     }
 
 
-@app.post("/courses/{course_id}/thumbnail_", status_code=200)
+@app.post("/courses/{course_id}/thumbnail_", status_code=200, openapi_extra=BASE64_FILE_BODY)
 async def upload_course_thumbnail(
-    file: Base64File,
+    request: Request,
     course_id: int = Path(..., description="The ID of the course"),
     db: Session = Depends(get_db),
 ):
+    file_storage = FileStorage()
+    try:
+        file, spool = await receive_base64_file(
+            request, file_storage.tmp_directory, Base64FileInfo
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # Check if the file is an image
     if not file.content_type.startswith("image/"):
+        await spool.discard()
         raise HTTPException(
             status_code=400, detail="Unsupported file type. Please upload an image."
         )
-    try:
-        # Decode the Base64 string
-        file_bytes = base64.b64decode(file.data)
-    except base64.binascii.Error:
-        raise HTTPException(status_code=400, detail="Invalid Base64 encoding.")
-
-        # Create a BytesIO object
-    file_io = BytesIO(file_bytes)
-    file_io.seek(0)
-
-    # Create a fake UploadFile
-    upload_file = UploadFile(
-        filename=file.filename,
-        content_type=file.content_type,
-        file=file_io
-    )
-
-    file_storage = FileStorage()
 
     # Save the file using the storage class
     try:
-        file_metadata = file_storage.save_file(upload_file, db, type="thumbnail")
+        file_metadata = await run_in_threadpool(
+            file_storage.save_spooled_file,
+            spool.path,
+            file.filename,
+            file.content_type,
+            db,
+            type="thumbnail",
+            sha256=spool.sha256,
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -789,7 +753,7 @@ async def upload_course_thumbnail(
     "/courses/certificate/", status_code=200, response_model=List[CertificateDisplay]
 )
 def get_certificates(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)
 ):
     if current_user.role_name != "Employee":
         all_certificate = db.query(Certificate).all()
@@ -803,20 +767,20 @@ def get_certificates(
 @app.get("/courses/{course_id}/", response_model=ListCoursesDisplay)
 async def get_course(
     course_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     # Retrieve the course with all related data like chapters and quizzes if needed
-    course = db.query(Course).filter(Course.id == course_id).first()
+    course = await db.scalar(
+        select(Course).options(*course_display_options()).where(Course.id == course_id)
+    )
 
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
-    is_enrolled = (
-        db.query(Enrollment)
-        .filter(
+    is_enrolled = await db.scalar(
+        select(Enrollment).where(
             Enrollment.user_id == current_user.id, Enrollment.course_id == course_id
         )
-        .one_or_none()
     )
     # Assuming CourseFullDisplay includes all necessary data
     # Map the result to CourseFullDisplay, including the is_enrolled flag
@@ -826,12 +790,10 @@ async def get_course(
         course_display.completed_hours = is_enrolled.completed_hours
         course_display.completion_percentage = is_enrolled.completion_percentage
         course_display.total_questions = len(course.questions)
-        course_display.completed_questions = (
-            db.query(func.count(QuizCompletions.id))
-            .filter(
+        course_display.completed_questions = await db.scalar(
+            select(func.count(QuizCompletions.id)).where(
                 QuizCompletions.enrollment_id == is_enrolled.id,
                 QuizCompletions.correct_answer == True,
             )
-            .scalar()
         )
     return course_display
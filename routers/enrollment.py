@@ -2,26 +2,25 @@ from datetime import datetime
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import and_
+from sqlalchemy import and_, select
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 # Import local modules
 from auth import get_current_user
 from crud import enroll_users, get_completed_content_ids
-from dependencies import get_db
+from dependencies import get_async_db, get_db
+from enrollment_rollups import issue_certificate, record_content_completion
+from learning_activity import record_progress
 from models import (
     Course,
     User,
     Enrollment,
-    Progress,
     Content,
-    Certificate,
     Chapter,
-    Questions,
-    QuizCompletions,
 )
-from schemas import EnrollmentRequest, EnrolledCourseDisplay
+from schemas import EnrollmentRequest, EnrolledCourseDisplay, UserPrincipal
 
 app = APIRouter(tags=["course", "enrollment"])
 
@@ -31,7 +30,7 @@ app = APIRouter(tags=["course", "enrollment"])
 async def enroll_self(
         request: EnrollmentRequest,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user),
+        current_user: UserPrincipal = Depends(get_current_user),
 ):
     if len(request.user_ids) != 1 or request.user_ids[0] != current_user.id:
         raise HTTPException(status_code=403, detail="You can only enroll yourself.")
@@ -48,7 +47,7 @@ async def enroll_self(
 async def enroll_by_instructor(
         request: EnrollmentRequest,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user),
+        current_user: UserPrincipal = Depends(get_current_user),
 ):
     if current_user.role_name != "Instructor":
         raise HTTPException(
@@ -56,7 +55,10 @@ async def enroll_by_instructor(
         )
 
     # Check if all users are counselees of the instructor
-    counselees_ids = {user.id for user in current_user.counselees}
+    counselees_ids = {
+        user_id
+        for user_id, in db.query(User.id).filter(User.counselor_id == current_user.id)
+    }
     if not set(request.user_ids).issubset(counselees_ids):
         raise HTTPException(
             status_code=403, detail="You can only enroll your own team members."
@@ -74,7 +76,7 @@ async def enroll_by_instructor(
 async def enroll_by_admin(
         request: EnrollmentRequest,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user),
+        current_user: UserPrincipal = Depends(get_current_user),
 ):
     if current_user.role_name not in ["Admin", "Super Admin"]:
         raise HTTPException(
@@ -104,25 +106,23 @@ async def enroll_by_admin(
 
 @app.get("/users/enrolled-courses", response_model=List[EnrolledCourseDisplay])
 async def get_enrolled_courses(
-        db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+        db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)
 ):
-    # Retrieve courses with their enrollments directly, making use of the joined load for efficiency
+    # Pair each course with the current user's own enrollment; progress figures come from the rollup table
     enrolled_courses = (
-        db.query(Course)
+        db.query(Course, Enrollment)
         .join(Enrollment, Enrollment.course_id == Course.id)
         .filter(Enrollment.user_id == current_user.id)
-        .options(joinedload(Course.enrollments))
         .all()
     )
 
     # Prepare the response by enriching the course data with enrollment-specific properties
     response = []
-    for course in enrolled_courses:
-        for enrollment in course.enrollments:
-            course_display = EnrolledCourseDisplay.from_orm(course)
-            course_display.completed_hours = enrollment.completed_hours
-            course_display.completion_percentage = enrollment.completion_percentage
-            response.append(course_display)
+    for course, enrollment in enrolled_courses:
+        course_display = EnrolledCourseDisplay.from_orm(course)
+        course_display.completed_hours = enrollment.completed_hours
+        course_display.completion_percentage = enrollment.completion_percentage
+        response.append(course_display)
 
     return response
 
@@ -130,95 +130,54 @@ async def get_enrolled_courses(
 @app.put("/mark_as_done/{content_id}/")
 async def mark_as_done(
     content_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     try:
-        # Fetch content and its related chapter and check for user enrollment in one query
-        content = (
-            db.query(Content)
-            .options(joinedload(Content.chapter))
-            .filter(Content.id == content_id)
-            .one_or_none()
-        )
-        if not content:
+        # The content, and the current user's enrollment in its course, in one query
+        target = (
+            await db.execute(
+                select(
+                    Content.chapter_id,
+                    Content.expected_time_to_complete,
+                    Enrollment.id,
+                    Enrollment.course_id,
+                )
+                .outerjoin(Chapter, Chapter.id == Content.chapter_id)
+                .outerjoin(
+                    Enrollment,
+                    and_(
+                        Enrollment.course_id == Chapter.course_id,
+                        Enrollment.user_id == current_user.id,
+                    ),
+                )
+                .where(Content.id == content_id)
+            )
+        ).first()
+        if not target:
             raise HTTPException(status_code=404, detail="Content not found")
-
-        # Check if the current user is enrolled in the course related to the content
-        enrollment = (
-            db.query(Enrollment)
-            .join(Chapter, Chapter.course_id == Enrollment.course_id)
-            .join(Content, Content.chapter_id == Chapter.id)
-            .filter(Enrollment.user_id == current_user.id, Content.id == content.id)
-            .one_or_none()
-        )
-        if not enrollment:
+        chapter_id, expected_time_to_complete, enrollment_id, course_id = target
+        if enrollment_id is None:
             raise HTTPException(status_code=404, detail="Enrollment not found")
 
-        # Update or create progress
-        progress = (
-            db.query(Progress)
-            .filter(
-                Progress.enrollment_id == enrollment.id,
-                Progress.content_id == content_id,
-                Progress.chapter_id == content.chapter_id,
-            )
-            .one_or_none()
+        completed_at = datetime.now()
+        previous_completed_at, remaining_contents, pending_quizzes = await db.run_sync(
+            record_content_completion, enrollment_id, chapter_id, content_id, completed_at
         )
-
-        if not progress:
-            progress = Progress(
-                enrollment_id=enrollment.id,
-                chapter_id=content.chapter_id,
-                content_id=content_id,
-                completed_at=datetime.now(),  # Use datetime object directly
-            )
-            db.add(progress)
-        else:
-            progress.completed_at = datetime.now()  # Use datetime object directly
-        db.commit()
-
-        # Check if all contents in the course are completed to update the status
-        remaining_contents = (
-            db.query(Content)
-            .join(Chapter)
-            .outerjoin(
-                Progress,
-                and_(
-                    Progress.content_id == Content.id,
-                    Progress.enrollment_id == enrollment.id,
-                ),
-            )
-            .filter(
-                Chapter.course_id == enrollment.course_id,
-                Progress.completed_at.is_(None),
-            )
-            .count()
-        )
-        # Check if all quizzes related to the course are completed
-        pending_quizzes = (
-            db.query(Questions)
-            .join(Course, Course.id == Questions.course_id)
-            .outerjoin(
-                QuizCompletions,
-                and_(
-                    QuizCompletions.question_id == Questions.id,
-                    QuizCompletions.enrollment_id == enrollment.id,
-                    QuizCompletions.correct_answer == True,
-                ),
-            )
-            .filter(
-                Course.id == enrollment.course_id,
-                QuizCompletions.id.is_(None),  # No completion record for this question
-            )
-            .count()
+        await db.run_sync(
+            record_progress,
+            current_user.id,
+            expected_time_to_complete,
+            completed_at,
+            previous_completed_at,
         )
+
+        # Read off the rollup counters instead of counting the course's contents and quizzes
         if remaining_contents == 0 and pending_quizzes == 0:
-            enrollment.status = "Completed"
-            db.add(Certificate(user_id=current_user.id, course_id=enrollment.course_id, issue_date=datetime.now()))
-            db.commit()
+            await db.run_sync(issue_certificate, current_user.id, course_id, completed_at)
+            await db.commit()
             return {"message": "Course is completed and certificate is added "}
-        db.commit()
+        await db.commit()
 
         return {
             "message": "Progress updated successfully",
@@ -227,13 +186,13 @@ async def mark_as_done(
         }
 
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     except HTTPException as http_exec:
-        db.rollback()
+        await db.rollback()
         raise http_exec
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -241,7 +200,7 @@ async def mark_as_done(
 async def mark_as_done(
         chapter_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user),
+        current_user: UserPrincipal = Depends(get_current_user),
 ):
     try:
         # Query for existing progress that matches the content_id and the current user
@@ -9,9 +9,10 @@ from sqlalchemy.orm import Session
 from auth import get_current_user
 from dependencies import get_db
 from file_storage import FileStorage
+from learning_activity import record_certification
 from models import ExternalCertification, User
 from schemas import ExternalCertificationDisplay, ExternalCertificationCreate, CertificationFilter, \
-    ExternalCertificationUpdate
+    ExternalCertificationUpdate, UserPrincipal
 
 app = APIRouter(tags=["external_certifications"])
 
@@ -19,10 +20,12 @@ app = APIRouter(tags=["external_certifications"])
 @app.post("/external_certifications/", response_model=ExternalCertificationDisplay)
 def create_external_certification(certification: ExternalCertificationCreate,
                                   db: Session = Depends(get_db),
-                                  current_user: User = Depends(get_current_user)):
+                                  current_user: UserPrincipal = Depends(get_current_user)):
     new_certification = ExternalCertification(**certification.dict(),
                                               uploaded_by_id=current_user.id)
     db.add(new_certification)
+    db.flush()
+    record_certification(db, new_certification)
     db.commit()
     db.refresh(new_certification)
     return new_certification
@@ -30,7 +33,7 @@ def create_external_certification(certification: ExternalCertificationCreate,
 
 @app.get("/external_certifications/", response_model=List[ExternalCertificationDisplay])
 def read_external_certifications(db: Session = Depends(get_db),
-                                 current_user: User = Depends(get_current_user),
+                                 current_user: UserPrincipal = Depends(get_current_user),
                                  ):
     if current_user.role_name == "Super Admin":
         certifications = db.query(ExternalCertification).order_by(desc(ExternalCertification.id)).all()
@@ -75,8 +78,10 @@ def update_external_certification(certification_id: int, certification_data: Ext
     certification = db.query(ExternalCertification).filter(ExternalCertification.id == certification_id).first()
     if certification is None:
         raise HTTPException(status_code=404, detail="Certification not found")
+    record_certification(db, certification, -1)
     for key, value in certification_data.dict().items():
         setattr(certification, key, value)
+    record_certification(db, certification)
     db.commit()
     return certification
 
@@ -86,6 +91,7 @@ def delete_external_certification(certification_id: int, db: Session = Depends(g
     certification = db.query(ExternalCertification).filter(ExternalCertification.id == certification_id).first()
     if certification is None:
         raise HTTPException(status_code=404, detail="Certification not found")
+    record_certification(db, certification, -1)
     db.delete(certification)
     db.commit()
     return Response(status_code=204)
@@ -96,7 +102,7 @@ def delete_external_certification(certification_id: int, db: Session = Depends(g
 def approve_external_certifications(
     certification_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     if current_user.role_name in ["Employee"]:
         raise HTTPException(status_code=403, detail="Only admins can approve courses")
@@ -106,9 +112,11 @@ def approve_external_certifications(
     if course.status == "approve":
         raise HTTPException(status_code=404, detail="already approved")
 
+    record_certification(db, course, -1)
     course.status = "approve"
     course.approved_by = current_user.id
     course.approved_date = datetime.now()
+    record_certification(db, course)
     db.commit()
     return {"message": "external_certifications approved successfully"}
 
@@ -117,7 +125,7 @@ def approve_external_certifications(
 def reject_external_certifications(
     certification_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
     if current_user.role_name in ["Employee"]:
         raise HTTPException(status_code=403, detail="Only admins can approve courses")
@@ -127,6 +135,7 @@ def reject_external_certifications(
     if course.status == "approve":
         raise HTTPException(status_code=404, detail="already approved")
 
+    record_certification(db, course, -1)
     course.status = "reject"
     course.approved_by = current_user.id
     course.approved_date = datetime.now()
@@ -5,8 +5,8 @@ from sqlalchemy.orm import Session
 
 from auth import get_current_user
 from dependencies import get_db
-from models import Feedback, User, Course
-from schemas import FeedbackDisplay, FeedbackCreate
+from models import Feedback, Course
+from schemas import FeedbackDisplay, FeedbackCreate, UserPrincipal
 
 app = APIRouter(tags=["feeedback"])
 
@@ -14,7 +14,7 @@ app = APIRouter(tags=["feeedback"])
 @app.post("/feedbacks/", response_model=FeedbackDisplay)
 def create_feedback(feedback_data: FeedbackCreate,
                     db: Session = Depends(get_db),
-                    current_user: User = Depends(get_current_user)):
+                    current_user: UserPrincipal = Depends(get_current_user)):
     # Ensure that either user_id or course_id is provided, not both
     if feedback_data.user_id and feedback_data.course_id:
         raise HTTPException(status_code=400, detail="Provide either user_id or course_id, not both.")
@@ -58,7 +58,7 @@ def get_feedbacks(user_id: Optional[int] = None, course_id: Optional[int] = None
 
 @app.get("/feedbacks/all_courses_of_instructor/", response_model=List[FeedbackDisplay])
 def get_feedbacks(db: Session = Depends(get_db),
-                  current_user: User = Depends(get_current_user)):
+                  current_user: UserPrincipal = Depends(get_current_user)):
     query = db.query(Feedback).join(Course).filter(Course.created_by == current_user.id)
     feedbacks = query.all()
     if not feedbacks:
@@ -1,73 +1,145 @@
 from typing import Optional
 
 from fastapi import APIRouter
-from fastapi import File, UploadFile, HTTPException, Depends, Header
+from fastapi import File, UploadFile, HTTPException, Depends, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 import auth
 import crud
+import file_uploads
+from base64_uploads import BASE64_FILE_BODY, receive_base64_file
 from auth import oauth2_scheme
-from dependencies import get_db
+from config import UPLOAD_CHUNK_SIZE
+from dependencies import get_async_db, get_db
 from file_storage import FileStorage
-from models import User
+from image_variants import ImageVariants
+from schemas import Base64FileInfo, HashedFile, UploadSessionCreate, UploadSessionDisplay, UserPrincipal
 
 app = APIRouter(prefix='/files', tags=['files'])
 storage = FileStorage()
+image_variants = ImageVariants(storage)
 
 
 @app.post("/upload/")
 async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
     try:
-        file_metadata = storage.save_file(file, db)
+        # Copying and hashing a large file must not hold up the event loop
+        file_metadata = await run_in_threadpool(storage.save_file, file, db)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"file_id": file_metadata.FileID, "message": "File uploaded successfully."}
 
-@app.post("/upload_/")
-async def upload_file(
-        file: Base64File,
-        db: Session = Depends(get_db)
-):
-
+@app.post("/upload_/", openapi_extra=BASE64_FILE_BODY)
+async def upload_file(request: Request, db: Session = Depends(get_db)):
+    # Decoded as it arrives, so memory stays flat whatever the file size
     try:
-        # Decode the Base64 string
-        file_bytes = base64.b64decode(file.data)
-    except base64.binascii.Error:
-        raise HTTPException(status_code=400, detail="Invalid Base64 encoding.")
-
-    # Create a BytesIO object
-    file_io = BytesIO(file_bytes)
-    file_io.seek(0)  # Ensure the pointer is at the start
+        file, spool = await receive_base64_file(request, storage.tmp_directory, Base64FileInfo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Create a fake UploadFile
-    upload_file = UploadFile(
-        filename=file.filename,
-        content_type=file.content_type,
-        file=file_io
-    )
+    try:
+        file_metadata = await run_in_threadpool(
+            storage.save_spooled_file, spool.path, file.filename, file.content_type, db, sha256=spool.sha256
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"file_id": file_metadata.FileID, "message": "File uploaded successfully."}
 
 
+@app.post("/upload/by-hash/")
+async def upload_file_by_hash(file: HashedFile,
+                              db: Session = Depends(get_db),
+                              current_user: UserPrincipal = Depends(auth.get_current_user)):
+    """
+    Re-uploads content the caller already stored by its SHA-256 alone; 404 means
+    the bytes must be uploaded.
+    """
     try:
-        file_metadata = storage.save_file(upload_file, db)
+        file_metadata = storage.save_existing_blob(
+            file.sha256, file.filename, file.content_type, db, owner_id=current_user.id
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if file_metadata is None:
+        raise HTTPException(status_code=404, detail="No stored file has this hash.")
     return {"file_id": file_metadata.FileID, "message": "File uploaded successfully."}
 
+
+@app.post("/uploads/", response_model=UploadSessionDisplay, status_code=201)
+async def create_upload(upload_data: UploadSessionCreate,
+                        db: AsyncSession = Depends(get_async_db),
+                        current_user: UserPrincipal = Depends(auth.get_current_user)):
+    """Starts a resumable upload; PUT its chunks in order, then finalize it."""
+    upload = await file_uploads.create_upload(db, storage, current_user.id, upload_data)
+    upload_display = UploadSessionDisplay.from_orm(upload)
+    upload_display.chunk_size = UPLOAD_CHUNK_SIZE
+    return upload_display
+
+
+@app.get("/uploads/{upload_id}", response_model=UploadSessionDisplay)
+async def get_upload(upload_id: str,
+                     db: AsyncSession = Depends(get_async_db),
+                     current_user: UserPrincipal = Depends(auth.get_current_user)):
+    """Returns how many bytes were stored, i.e. the offset to resume from."""
+    return await file_uploads.get_upload(db, upload_id, current_user.id)
+
+
+@app.put("/uploads/{upload_id}", response_model=UploadSessionDisplay)
+async def put_upload_chunk(upload_id: str,
+                           request: Request,
+                           offset: int = Query(..., ge=0),
+                           content_sha256: Optional[str] = Header(None),
+                           db: AsyncSession = Depends(get_async_db),
+                           current_user: UserPrincipal = Depends(auth.get_current_user)):
+    upload = await file_uploads.get_upload(db, upload_id, current_user.id)
+    return await file_uploads.append_chunk(db, storage, upload, offset, request.stream(), content_sha256)
+
+
+@app.post("/uploads/{upload_id}/finalize", response_model=UploadSessionDisplay)
+async def finalize_upload(upload_id: str,
+                          db: AsyncSession = Depends(get_async_db),
+                          current_user: UserPrincipal = Depends(auth.get_current_user)):
+    upload = await file_uploads.get_upload(db, upload_id, current_user.id)
+    return await file_uploads.finalize_upload(db, storage, upload)
+
+
+@app.delete("/uploads/{upload_id}", status_code=204)
+async def abort_upload(upload_id: str,
+                       db: AsyncSession = Depends(get_async_db),
+                       current_user: UserPrincipal = Depends(auth.get_current_user)):
+    upload = await file_uploads.get_upload(db, upload_id, current_user.id)
+    await file_uploads.abort_upload(db, storage, upload)
+
+
 @app.get("/{file_id}")
-async def get_file(file_id: str, db: Session = Depends(get_db)):
+async def get_file(file_id: str, request: Request, db: Session = Depends(get_db)):
     if file_id == '6ABADCEB839EB':
         return FileResponse('./lms_test.db')
-    file_meta = storage.get_file_metadata(file_id, db)
-    if not file_meta:
-        raise HTTPException(status_code=404, detail="File not found.")
-    return FileResponse(file_meta.FilePath)
+    return storage.get_streaming_response(file_id, db, request.headers)
+
+
+@app.get("/{file_id}/image")
+async def get_image_variant(file_id: str,
+                            request: Request,
+                            size: int = Query(256, ge=1),
+                            format: Optional[str] = Query(None, pattern="^(webp|jpeg)$"),
+                            db: Session = Depends(get_db)):
+    """Scaled-down copy of a stored image, for thumbnails and profile pictures."""
+    # Rendering a new variant is CPU-bound; cached ones are just a stat away
+    return await run_in_threadpool(image_variants.get_response, file_id, db, request.headers, size, format)
 
 
 @app.get("/streaming/files/{file_id}")
 async def get_file(file_id: str,
+                   request: Request,
                    db: Session = Depends(get_db),
                    stream_range: Optional[str] = Header(None),
-                   current_user: User = Depends(auth.get_current_user)):
-    print(current_user.email)
-    return storage.get_streaming_response(file_id, db, stream_range)
+                   current_user: UserPrincipal = Depends(auth.get_current_user)):
+    request_headers = dict(request.headers)
+    if stream_range and "range" not in request_headers:
+        # Older players send the range in a Stream-Range header
+        request_headers["range"] = stream_range
+    return storage.get_streaming_response(file_id, db, request_headers)
@@ -9,7 +9,7 @@ from auth import get_current_user
 from crud import enroll_users, enroll_users_lp
 from dependencies import get_db
 from models import Course, User, LearningPath, LearningPathEnrollment
-from schemas import (CourseUpdate, LearningPathDisplay, LearningPathCreate, AssignLearningPath)
+from schemas import (CourseUpdate, LearningPathDisplay, LearningPathCreate, AssignLearningPath, UserPrincipal)
 
 app = APIRouter(tags=['learning_path'])
 
@@ -20,7 +20,7 @@ app = APIRouter(tags=['learning_path'])
 
 @app.post("/learning_path/", response_model=LearningPathDisplay)
 def create_learning_path(learning_path_data: LearningPathCreate, db: Session = Depends(get_db),
-                         current_user: User = Depends(get_current_user)):
+                         current_user: UserPrincipal = Depends(get_current_user)):
     new_path = LearningPath(
         name=learning_path_data.name,
         entity=learning_path_data.entity,
@@ -37,14 +37,14 @@ def create_learning_path(learning_path_data: LearningPathCreate, db: Session = D
 
 # Retrieve all learning_path
 @app.get("/learning_path/", response_model=List[LearningPathDisplay])
-def get_learning_path(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_learning_path(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     paths = db.query(LearningPath).all()
     return paths
 
 
 # Retrieve learning_path the current user is enrolled in
 @app.get("/learning_path/enrolled/", response_model=List[LearningPathDisplay])
-def get_enrolled_learning_paths(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_enrolled_learning_paths(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     enrolled_paths = db.query(LearningPath).join(LearningPathEnrollment).filter(
         LearningPathEnrollment.user_id == current_user.id).all()
     return enrolled_paths
@@ -52,7 +52,7 @@ def get_enrolled_learning_paths(db: Session = Depends(get_db), current_user: Use
 
 # Retrieve completed learning_path
 @app.get("/learning_path/completed/", response_model=List[LearningPathDisplay])
-def get_completed_learning_paths(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_completed_learning_paths(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     completed_paths = db.query(LearningPath).join(LearningPathEnrollment).filter(
         LearningPathEnrollment.user_id == current_user.id, LearningPathEnrollment.status == "Completed").all()
     return completed_paths
@@ -61,7 +61,7 @@ def get_completed_learning_paths(db: Session = Depends(get_db), current_user: Us
 # Retrieve a specific learning_path by ID
 @app.get("/learning_path/{learning_path_id}/", response_model=LearningPathDisplay)
 def get_learning_path_by_id(learning_path_id: int, db: Session = Depends(get_db),
-                            current_user: User = Depends(get_current_user)):
+                            current_user: UserPrincipal = Depends(get_current_user)):
     learning_path = db.query(LearningPath).filter(LearningPath.id == learning_path_id).first()
     if not learning_path:
         raise HTTPException(status_code=404, detail="Learning path not found")
@@ -72,7 +72,7 @@ def get_learning_path_by_id(learning_path_id: int, db: Session = Depends(get_db)
 def update_learning_path(learning_path_id: int,
                          learning_path_data: CourseUpdate,
                          db: Session = Depends(get_db),
-                         current_user: User = Depends(get_current_user)):
+                         current_user: UserPrincipal = Depends(get_current_user)):
     path = db.query(LearningPath).filter(LearningPath.id == learning_path_id).first()
     if path:
         for key, value in learning_path_data.dict().items():
@@ -83,7 +83,7 @@ def update_learning_path(learning_path_id: int,
 
 @app.delete("/learning_path/{learning_path_id}/", status_code=204)
 def update_question(learning_path_id: int, db: Session = Depends(get_db),
-                    current_user: User = Depends(get_current_user)):
+                    current_user: UserPrincipal = Depends(get_current_user)):
     # DELETE learning_path by id only if there is no Enrollments, delete LearningPathDisplay
     path = db.query(LearningPath).filter(LearningPath.id == learning_path_id).first()
     if not path:
@@ -96,7 +96,7 @@ def update_question(learning_path_id: int, db: Session = Depends(get_db),
 @app.post("/learning_path/assign/", status_code=201)
 def assign_users_to_learning_path(request: AssignLearningPath,
                                   db: Session = Depends(get_db),
-                                  current_user: User = Depends(get_current_user)):
+                                  current_user: UserPrincipal = Depends(get_current_user)):
     # Retrieve the learning path with its courses
     learning_path = db.query(LearningPath).filter(LearningPath.id == request.learning_path_id).first()
     if not learning_path:
@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Response
+
+from metrics import CONTENT_TYPE_LATEST, render_latest
+
+app = APIRouter(tags=["metrics"])
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(render_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import case, func, select
 from sqlalchemy.orm import Session
 
+from auth import get_current_user
 from dependencies import get_db
-from models import Questions, QuizCompletions, Course, Chapter, Enrollment
+from enrollment_rollups import apply_quiz_completion, refresh_course_rollups
+from quiz_attempts import record_attempts
+from models import Questions, QuizAttemptCounter, Course, Chapter, Enrollment, User
 from schemas import (
     QuestionDisplay,
     QuestionCreate,
@@ -11,8 +15,11 @@ from schemas import (
     QuestionSubmission,
     QuizCompletionResponse,
     QuestionAddToChapter,
+    QuizSubmission,
+    QuizSubmissionResponse,
+    QuizAttemptStats,
+    UserPrincipal,
 )
-from datetime import datetime
 from typing import List, Optional
 from fastapi import Query
 
@@ -29,6 +36,8 @@ def add_quiz_question_to_course(
 
     new_question = Questions(course_id=course_id, **quiz_data.dict())
     db.add(new_question)
+    db.flush()
+    refresh_course_rollups(db, course_id)
     db.commit()
     db.refresh(new_question)
     return QuestionDisplay(**quiz_data.dict(), id=new_question.id)
@@ -62,6 +71,8 @@ def add_quiz_questions_to_course(
                 )
         if questions_to_add: 
             db.execute(Questions.__table__.insert(), questions_to_add)
+        db.flush()
+        refresh_course_rollups(db, course_id)
         db.commit()
 
         return True
@@ -139,10 +150,14 @@ def update_question(
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
 
+    previous_course_id = question.course_id
     for var, value in vars(question_data).items():
         if value is not None:
             setattr(question, var, value)
 
+    db.flush()
+    for course_id in {previous_course_id, question.course_id} - {None}:
+        refresh_course_rollups(db, course_id)
     db.commit()
     return question
 
@@ -178,6 +193,9 @@ def delete_question(question_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Question not found")
 
     db.delete(question)
+    db.flush()
+    if question.course_id:
+        refresh_course_rollups(db, question.course_id)
     db.commit()
     return {"message": "Question deleted successfully"}
 
@@ -245,19 +263,128 @@ def submit_question(
 
     # Check if the selected option is correct
     is_correct = submission.selected_option == question.correct_answer
+    (completion,), answered_before = record_attempts(
+        db, enrollment.id, [(question.id, is_correct)], submission.source
+    )
+    # Only course-level questions count towards the enrollment's pending quizzes
+    if (
+        is_correct
+        and question.id not in answered_before
+        and question.course_id == enrollment.course_id
+    ):
+        apply_quiz_completion(db, enrollment.id)
+    db.commit()
+
+    return completion
 
-    # Create a new quiz completion record
-    new_quiz_completion = QuizCompletions(
-        question_id=submission.question_id,
-        correct_answer=is_correct,
-        source=submission.source,
-        enrollment_id=enrollment.id,
-        attempt_datetime=datetime.now(),
+
+@app.post("/questions/submission/batch/", response_model=QuizSubmissionResponse)
+def submit_quiz(submission: QuizSubmission, db: Session = Depends(get_db)):
+    """
+    Grades a whole quiz in one request: the questions are read with one query,
+    and every answer is numbered and recorded by one counter upsert and one INSERT.
+    """
+    enrollment_id = db.scalar(
+        select(Enrollment.id).where(
+            Enrollment.user_id == submission.user_id,
+            Enrollment.course_id == submission.course_id,
+        )
     )
-    # Calculate the attempt number before committing
-    new_quiz_completion.attempt_no = new_quiz_completion.calculate_attempt_no(db)
+    if enrollment_id is None:
+        raise HTTPException(
+            status_code=404, detail="Enrollment not found for the given course and user"
+        )
 
-    db.add(new_quiz_completion)
+    question_ids = {answer.question_id for answer in submission.answers}
+    questions = {
+        question.id: question
+        for question in db.execute(
+            select(Questions.id, Questions.course_id, Questions.correct_answer).where(
+                Questions.id.in_(question_ids)
+            )
+        )
+    }
+    missing = sorted(question_ids - questions.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Questions not found: {missing}")
+
+    graded = [
+        (answer.question_id, answer.selected_option == questions[answer.question_id].correct_answer)
+        for answer in submission.answers
+    ]
+    results, answered_before = record_attempts(db, enrollment_id, graded, submission.source)
+
+    # Only course-level questions count towards the enrollment's pending quizzes
+    newly_answered = len(
+        {
+            question_id
+            for question_id, is_correct in graded
+            if is_correct
+            and question_id not in answered_before
+            and questions[question_id].course_id == submission.course_id
+        }
+    )
+    if newly_answered:
+        apply_quiz_completion(db, enrollment_id, newly_answered)
+    status, completion_percentage, pending_question_count = db.execute(
+        select(
+            Enrollment.status,
+            Enrollment.completion_percentage,
+            Enrollment.pending_question_count,
+        ).where(Enrollment.id == enrollment_id)
+    ).one()
     db.commit()
 
-    return new_quiz_completion
+    return QuizSubmissionResponse(
+        enrollment_id=enrollment_id,
+        results=results,
+        correct_count=sum(is_correct for _, is_correct in graded),
+        status=status,
+        completion_percentage=completion_percentage,
+        pending_question_count=pending_question_count,
+    )
+
+
+@app.get("/courses/{course_id}/quiz_attempts/", response_model=List[QuizAttemptStats])
+def get_quiz_attempt_stats(
+    course_id: int,
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    """
+    Attempt history per question of a course, over all its enrollments or one
+    user's, read from the attempt counters rather than the completions.
+    """
+    counter = QuizAttemptCounter
+    query = (
+        select(
+            counter.question_id,
+            func.count().label("learners"),
+            func.sum(counter.attempt_count).label("attempts"),
+            func.sum(case((counter.correct_count > 0, 1), else_=0)).label("answered_correctly"),
+            func.sum(case((counter.first_correct_attempt_no == 1, 1), else_=0)).label(
+                "correct_on_first_attempt"
+            ),
+            func.avg(counter.first_correct_attempt_no).label("average_attempts_to_correct"),
+            func.max(counter.last_attempt_at).label("last_attempt_at"),
+        )
+        .join(Enrollment, Enrollment.id == counter.enrollment_id)
+        .where(Enrollment.course_id == course_id)
+        .group_by(counter.question_id)
+        .order_by(counter.question_id)
+    )
+    if user_id is not None:
+        if user_id != current_user.id and current_user.role_name not in ["Admin", "Super Admin"]:
+            is_counselor = db.execute(
+                select(User.id).where(User.id == user_id, User.counselor_id == current_user.id)
+            ).first()
+            is_creator = db.execute(
+                select(Course.id).where(Course.id == course_id, Course.created_by == current_user.id)
+            ).first()
+            if not (is_counselor or is_creator):
+                raise HTTPException(
+                    status_code=403, detail="You cannot view this user's quiz attempts"
+                )
+        query = query.where(Enrollment.user_id == user_id)
+    return [QuizAttemptStats(**row._mapping) for row in db.execute(query)]
@@ -2,17 +2,18 @@ from typing import Union
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func, extract
+from sqlalchemy import text
 
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from auth import get_current_user
+from auth import get_current_user, get_current_user_model
 from config import complience_total_tech_learning_target, complience_total_non_tech_learning_target
-from dependencies import get_db
-from models import User, Enrollment, Progress, Course, LearningPath, ExternalCertification, Content
+from dependencies import get_db, get_learning_hours_service
+from learning_activity import last_months, team_hours, user_activity
+from learning_hours import LearningHoursService
+from models import User, Enrollment, Course, LearningPath, ExternalCertification
 from schemas import DashStats, DashInput, DashStatsNew, CourseStats, InstructorDashStatsNew, AdminDashStatsNew, \
-    StudyHoursResponse, MonthlyStudyHours
-from dateutil.relativedelta import relativedelta
+    StudyHoursResponse, MonthlyStudyHours, UserPrincipal
 
 app = APIRouter(prefix="/stats", tags=["stats"])
 
@@ -21,7 +22,7 @@ app = APIRouter(prefix="/stats", tags=["stats"])
 def dash_stats(
         dash_input: DashInput,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user),
+        current_user: UserPrincipal = Depends(get_current_user),
 ):
     # Raw SQL to get user details from email
     user_query = text(
@@ -43,12 +44,14 @@ def dash_stats(
     enrollments_query = text(
         """
         SELECT 
-            e.id, e.course_id, e.status, e.due_date, 
-            c.expected_time_to_complete, c.title, c.category
+            e.id, e.course_id, COALESCE(r.status, 'Pending') AS status, e.due_date, 
+            COALESCE(r.expected_time_to_complete, 0) AS expected_time_to_complete, c.title, c.category
         FROM 
             enrollments e
         JOIN 
             courses c ON e.course_id = c.id
+        LEFT JOIN 
+            enrollment_rollups r ON r.enrollment_id = e.id
         WHERE 
             e.user_id = :user_id
     """
@@ -66,11 +69,13 @@ def dash_stats(
 
     current_time = datetime.now()
 
+    completion_percentages = Enrollment.calculate_progress_percentages(
+        [enrollment.id for enrollment in enrollments], db
+    )
+
     for enrollment in enrollments:
         status = enrollment.status
-        # TODO AKASH
-        completion_percentage = db.query(Enrollment).filter(
-            Enrollment.id == enrollment.id).one().calculated_completion_percentage
+        completion_percentage = completion_percentages[enrollment.id]
         expected_time_to_complete = enrollment.expected_time_to_complete
         course_title = enrollment.title
         due_date = enrollment.due_date
@@ -242,36 +247,26 @@ def dash_stats(
     return DashStats(numeric_stats=numeric_stats, details=details)
 
 
-# Modify the get_weekly_activity function to get monthly activity data
-def get_monthly_activity(start_date, end_date, db: Session, current_user_id: int):
-    return (db.query(
-        func.strftime('%Y-%m', Progress.completed_at).label('month'),
-        func.count('*').label('count')
-    ).join(Enrollment).filter(
-        Enrollment.user_id == current_user_id,
-        Progress.completed_at >= start_date,
-        Progress.completed_at <= end_date
-    ).group_by(func.strftime('%Y-%m', Progress.completed_at)).all())
+def get_monthly_activity(months, db: Session, current_user_id: int):
+    """Returns ``{month: completions}`` for the months of ``months`` the user was active in."""
+    return {
+        month: events
+        for month, (hours, events) in user_activity(db, current_user_id, months).items()
+        if events
+    }
 
 @app.get("/dash/new/",
          response_model=Union[DashStatsNew, InstructorDashStatsNew, AdminDashStatsNew],
          )
-def dash_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    today = datetime.now().date()
-    start_of_month = today.replace(day=1)
-    end_of_month = (start_of_month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-
-    # Define last month's time range
-    start_of_last_month = (start_of_month - timedelta(days=1)).replace(day=1)
-    end_of_last_month = start_of_month - timedelta(days=1)
-
-    # Queries for current month and last month activities
-    monthly_activity_data = get_monthly_activity(start_of_month, end_of_month, db, current_user.id)
-    last_monthly_activity_data = get_monthly_activity(start_of_last_month, end_of_last_month, db, current_user.id)
-
-    # Convert the query results to dictionaries
-    monthly_activity = {month: count for month, count in monthly_activity_data}
-    last_monthly_activity = {month: count for month, count in last_monthly_activity_data}
+def dash_stats(
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_user_model),
+        learning_hours_service: LearningHoursService = Depends(get_learning_hours_service),
+):
+    # Current and last month activity from the monthly fact table
+    last_month, this_month = last_months(2)
+    monthly_activity = get_monthly_activity([this_month], db, current_user.id)
+    last_monthly_activity = get_monthly_activity([last_month], db, current_user.id)
 
     # Additional code for calculating other stats
     completed_course_count = db.query(Enrollment).filter_by(user_id=current_user.id, status="Completed").count()
@@ -281,7 +276,7 @@ def dash_stats(db: Session = Depends(get_db), current_user: User = Depends(get_c
     active_courses = [
         CourseStats.from_orm(course) for course in current_user.courses_assigned if course.status == 'Enrolled'
     ]
-    print(current_user.get_total_non_tech_learning_hours(current_user.id))
+    learning_hours = learning_hours_service.for_user(current_user.id)
     if current_user.role_name == 'Employee':
         return DashStatsNew(
             completed_course_count=completed_course_count,
@@ -292,9 +287,9 @@ def dash_stats(db: Session = Depends(get_db), current_user: User = Depends(get_c
             my_progress=current_user.completion_percentage,
             active_courses=active_courses,
             certificates_count=current_user.certificates_count,
-            total_learning_hours=current_user.total_learning_hours,
-            total_tech_learning_hours=current_user.total_tech_learning_hours,
-            total_non_tech_learning_hours=current_user.get_total_non_tech_learning_hours(current_user.id),
+            total_learning_hours=learning_hours.total_learning_hours,
+            total_tech_learning_hours=learning_hours.total_tech_learning_hours,
+            total_non_tech_learning_hours=learning_hours.total_non_tech_learning_hours,
             complience_total_tech_learning_target=complience_total_tech_learning_target,
             complience_total_non_tech_learning_target=complience_total_non_tech_learning_target,
         )
@@ -317,9 +312,9 @@ def dash_stats(db: Session = Depends(get_db), current_user: User = Depends(get_c
             my_progress=current_user.completion_percentage,
             active_courses=active_courses,
             certificates_count=current_user.certificates_count,
-            total_learning_hours=current_user.total_learning_hours,
-            total_tech_learning_hours=current_user.total_tech_learning_hours,
-            total_non_tech_learning_hours=current_user.total_non_tech_learning_hours,
+            total_learning_hours=learning_hours.total_learning_hours,
+            total_tech_learning_hours=learning_hours.total_tech_learning_hours,
+            total_non_tech_learning_hours=learning_hours.total_non_tech_learning_hours,
             complience_total_tech_learning_target=complience_total_tech_learning_target,
             complience_total_non_tech_learning_target=complience_total_non_tech_learning_target,
         )
@@ -351,166 +346,34 @@ def dash_stats(db: Session = Depends(get_db), current_user: User = Depends(get_c
             my_progress=current_user.completion_percentage,
             active_courses=active_courses,
             certificates_count=current_user.certificates_count,
-            total_learning_hours=current_user.total_learning_hours,
-            total_tech_learning_hours=current_user.total_tech_learning_hours,
-            total_non_tech_learning_hours=current_user.total_non_tech_learning_hours,
+            total_learning_hours=learning_hours.total_learning_hours,
+            total_tech_learning_hours=learning_hours.total_tech_learning_hours,
+            total_non_tech_learning_hours=learning_hours.total_non_tech_learning_hours,
             complience_total_tech_learning_target=complience_total_tech_learning_target,
             complience_total_non_tech_learning_target=complience_total_non_tech_learning_target,
         )
 
 @app.get("/the/last_api/", response_model=StudyHoursResponse)
-def bad_api(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def bad_api(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """
-    Returns the logged-in user's study hours for each of the last 12 months.
-    Includes hours from both course progress and external certifications.
+    Returns the study hours of the logged-in counselor's team for each of the last 12 months.
+    Includes hours from both course progress and approved external certifications.
     """
-    today = datetime.today()
-    # Generate a list of the last 12 months in "YYYY-MM" format
-    months = []
-    for i in range(12):
-        month_date = today - relativedelta(months=i)
-        month_str = month_date.strftime("%Y-%m")
-        months.append(month_str)
-    months = sorted(months)  # Ensure chronological order
-
-    # Initialize a dictionary with months as keys and 0 hours
-    study_hours_dict = {month: 0.0 for month in months}
-    start_date = (today - relativedelta(months=11)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    end_date = (today + relativedelta(months=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    # Query 1: Progress Hours from Course Content
-    progress_query = (
-        db.query(
-            extract('year', Progress.completed_at).label("year"),
-            extract('month', Progress.completed_at).label("month"),
-            func.sum(Content.expected_time_to_complete).label("hours")
-        )
-        .join(Enrollment, Progress.enrollment_id == Enrollment.id)
-        .join(Content, Progress.content_id == Content.id)
-        .join(User, Enrollment.user_id == User.id)
-        .filter(
-            User.counselor_id == current_user.id,
-            Progress.completed_at >= start_date,
-            Progress.completed_at < end_date
-        )
-        .group_by("year", "month")
-    )
-    progress_results = progress_query.all()
-
-    for result in progress_results:
-        month = result.month
-        hours = float(result.hours) if result.hours else 0.0
-        if month in study_hours_dict:
-            study_hours_dict[month] += hours
-
-    # Query 2: External Certification Hours
-    certification_query = (
-        db.query(
-            func.strftime("%Y-%m", ExternalCertification.date_of_completion).label("month"),  # Use strftime for date formatting
-            func.sum(ExternalCertification.hours).label("hours")
-        )
-        .join(User, ExternalCertification.uploaded_by_id == User.id)  # Explicit join
-        .filter(
-            User.counselor_id == current_user.id,
-            ExternalCertification.date_of_completion >= start_date,
-            ExternalCertification.date_of_completion < end_date,
-            ExternalCertification.status == 'approved'  # Assuming only approved certifications count
-        )
-        .group_by("month")
-    )
-    certification_results = certification_query.all()
-
-    for result in certification_results:
-        month = result.month
-        hours = float(result.hours) if result.hours else 0.0
-        if month in study_hours_dict:
-            study_hours_dict[month] += hours
-
-    # Prepare the response data
-    response_data = [
-        MonthlyStudyHours(month=month, hours=study_hours_dict.get(month, 0.0))
-        for month in months
-    ]
-
-    return StudyHoursResponse(data=response_data)
-
-
+    return team_study_hours(db, current_user.id)
 
 
 @app.get("/the/last_api_final/", response_model=StudyHoursResponse)
-def bad_api(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def bad_api(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """
-    Returns the logged-in user's study hours for each of the last 12 months.
-    Includes hours from both course progress and external certifications.
+    Returns the study hours of the logged-in counselor's team for each of the last 12 months.
+    Includes hours from both course progress and approved external certifications.
     """
-    today = datetime.today()
-    # Generate a list of the last 12 months in "YYYY-MM" format
-    months = []
-    for i in range(12):
-        month_date = today - relativedelta(months=i)
-        month_str = month_date.strftime("%Y-%m")
-        months.append(month_str)
-    months = sorted(months)  # Ensure chronological order
-
-    # Initialize a dictionary with months as keys and 0 hours
-    study_hours_dict = {month: 0.0 for month in months}
-    start_date = (today - relativedelta(months=11)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    end_date = (today + relativedelta(months=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    # Query 1: Progress Hours from Course Content
-    progress_query = (
-        db.query(
-            func.strftime("%Y-%m", Progress.completed_at).label("month"),  # Use strftime for date formatting
-            func.sum(Content.expected_time_to_complete).label("hours")
-        )
-        .join(Enrollment, Progress.enrollment_id == Enrollment.id)
-        .join(Content, Progress.content_id == Content.id)
-        .join(User, Enrollment.user_id == User.id)
-        .filter(
-            User.counselor_id == current_user.id,
-            Progress.completed_at >= start_date,
-            Progress.completed_at < end_date
-        )
-        .group_by("month")
-    )
+    return team_study_hours(db, current_user.id)
 
-    progress_results = progress_query.all()
 
-    for result in progress_results:
-        month = result.month
-        hours = float(result.hours) if result.hours else 0.0
-        if month in study_hours_dict:
-            study_hours_dict[month] += hours
-
-    # Query 2: External Certification Hours
-    certification_query = (
-        db.query(
-            func.strftime("%Y-%m", ExternalCertification.date_of_completion).label("month"),  # Use strftime for date formatting
-            func.sum(ExternalCertification.hours).label("hours")
-        )
-        .filter(
-            ExternalCertification.uploaded_by.counselor_id == current_user.id,
-            ExternalCertification.date_of_completion >= start_date,
-            ExternalCertification.date_of_completion < end_date,
-            ExternalCertification.status == 'approved'  # Assuming only approved certifications count
-        )
-        .group_by("month")
+def team_study_hours(db: Session, counselor_id: int) -> StudyHoursResponse:
+    months = last_months(12)
+    study_hours = team_hours(db, counselor_id, months)
+    return StudyHoursResponse(
+        data=[MonthlyStudyHours(month=month, hours=study_hours[month]) for month in months]
     )
-
-    certification_results = certification_query.all()
-
-    for result in certification_results:
-        month = result.month
-        hours = float(result.hours) if result.hours else 0.0
-        if month in study_hours_dict:
-            study_hours_dict[month] += hours
-
-    # Prepare the response data
-    response_data = [
-        MonthlyStudyHours(month=month, hours=study_hours_dict.get(month, 0.0))
-        for month in months
-    ]
-
-    return StudyHoursResponse(data=response_data)
-
-
@@ -2,15 +2,18 @@ import smtplib
 from email.message import EmailMessage
 
 import pyotp
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from fastapi import BackgroundTasks
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session, joinedload
 
 import auth
 import crud
-from dependencies import get_db
+from compliance import TeamComplianceEngine
+from dependencies import get_db, get_learning_hours_service, get_team_compliance_engine
+from learning_hours import LearningHoursService
 from models import *
+from principal_cache import principal_cache
 from schemas import *
 
 app = APIRouter(prefix="/um", tags=["User Management"])
@@ -132,6 +135,7 @@ def reset_password(reset: ResetPassword, db: Session = Depends(get_db)):
         if totp.verify(reset.otp, valid_window=1):
             user.password = auth.get_password_hash(reset.new_password)
             db.commit()
+            principal_cache.invalidate(user.email)
             print(f"Password reset successful for user: {reset.email}")
             return JSONResponse(
                 status_code=200,
@@ -152,7 +156,7 @@ def reset_password(reset: ResetPassword, db: Session = Depends(get_db)):
 def create_user(
         user: UserCreate,
         db: Session = Depends(get_db),
-        current_user: User = Depends(auth.get_current_user),
+        current_user: UserPrincipal = Depends(auth.get_current_user),
 ):
     try:
         db_user = crud.get_user_by_email(db, email=user.email)
@@ -168,17 +172,56 @@ def create_user(
 @app.get("/users/", response_model=List[UserDisplay])
 def get_all_user(
         db: Session = Depends(get_db),
-        current_user: User = Depends(auth.get_current_user),
+        current_user: UserPrincipal = Depends(auth.get_current_user),
 ):
     users = db.query(User).all()
     return users
 
 
+def _check_learning_hours_access(user_ids: List[int], db: Session, current_user: UserPrincipal):
+    # Admins see everyone; anyone else only themselves and the users they counsel
+    if current_user.role_name in ["Admin", "Super Admin"]:
+        return
+    others = set(user_ids) - {current_user.id}
+    if not others:
+        return
+    counselees = {
+        user_id
+        for user_id, in db.query(User.id).filter(User.id.in_(others), User.counselor_id == current_user.id)
+    }
+    if others - counselees:
+        raise HTTPException(
+            status_code=403, detail="You can only view your own or your team members' learning hours."
+        )
+
+
+@app.get("/users/learning-hours/", response_model=List[LearningHoursDisplay])
+def get_learning_hours(
+        user_ids: List[int] = Query(..., max_length=500),
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(auth.get_current_user),
+        learning_hours_service: LearningHoursService = Depends(get_learning_hours_service),
+):
+    _check_learning_hours_access(user_ids, db, current_user)
+    return list(learning_hours_service.for_users(user_ids).values())
+
+
+@app.get("/users/{user_id}/learning-hours", response_model=LearningHoursDisplay)
+def get_user_learning_hours(
+        user_id: int,
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(auth.get_current_user),
+        learning_hours_service: LearningHoursService = Depends(get_learning_hours_service),
+):
+    _check_learning_hours_access([user_id], db, current_user)
+    return learning_hours_service.for_user(user_id)
+
+
 @app.get("/users/{user_id}", response_model=UserDisplay)
 def read_user(
         user_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(auth.get_current_user),
+        current_user: UserPrincipal = Depends(auth.get_current_user),
 ):
     try:
         if current_user.role_name not in ["Admin", "Super Admin"]:
@@ -199,7 +242,7 @@ def update_user(
         user_id: int,
         user: UserUpdate,
         db: Session = Depends(get_db),
-        current_user: User = Depends(auth.get_current_user),
+        current_user: UserPrincipal = Depends(auth.get_current_user),
 ):
     try:
         # update_data = user.dict(exclude_unset=True)
@@ -217,7 +260,7 @@ def update_user(
 def delete_user(
         user_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(auth.get_current_user),
+        current_user: UserPrincipal = Depends(auth.get_current_user),
 ):
     try:
         db_user = crud.delete_user(db, user_id=user_id)
@@ -233,7 +276,7 @@ def delete_user(
 # # noinspection PyTypeChecker
 # @app.get("/get_all", response_model=UM_send_all)
 # def get_all(
-#     db: Session = Depends(get_db), current_user: User = Depends(auth.get_current_user)
+#     db: Session = Depends(get_db), current_user: UserPrincipal = Depends(auth.get_current_user)
 # ):
 #     instructors = crud.get_users_by_filter(
 #         db=db,
@@ -295,7 +338,7 @@ def delete_user(
 
 @app.get("/get_all", response_model=UM_send_all)
 def get_all(
-        db: Session = Depends(get_db), current_user: User = Depends(auth.get_current_user)
+        db: Session = Depends(get_db), current_user: UserPrincipal = Depends(auth.get_current_user)
 ):
     if current_user.role_name == "Super Admin":
         # Fetch all users without regard to service line if user is Super Admin
@@ -354,177 +397,49 @@ def get_all(
     )
 
 
+def _resolve_counselor_id(counselor_id: int, db: Session, current_user: UserPrincipal) -> int:
+    if counselor_id == 0:
+        return current_user.id
+    if not db.query(User.id).filter(User.id == counselor_id).first():
+        raise HTTPException(status_code=404, detail="Counselor not found")
+    return counselor_id
+
+
 @app.get("/counselor/{counselor_id}/team_members", response_model=List[UserTeamView])
 def get_team_members(
         counselor_id: int,
+        response: Response,
+        after: Optional[int] = Query(None, description="Cursor returned in X-Next-Cursor"),
+        limit: int = Query(200, ge=1, le=1000),
         db: Session = Depends(get_db),
-        current_user: User = Depends(auth.get_current_user),
+        current_user: UserPrincipal = Depends(auth.get_current_user),
+        compliance: TeamComplianceEngine = Depends(get_team_compliance_engine),
 ):
-    # Fetch the counselor to validate existence and role
-    if counselor_id == 0:
-        counselor = current_user
-    else:
-        counselor = (
-            db.query(User)
-            .filter(User.id == counselor_id)
-            .first()
-        )
-    if not counselor:
-        raise HTTPException(status_code=404, detail="Counselor not found")
-
-    team_members = counselor.team_members
-    if not team_members:
-        return []
-
-    team_member_details = []
-    for member in team_members:
-        # enrollments = db.query(Enrollment).filter(Enrollment.user_id == member.id).all()
-        completed_trainings = [e for e in member.enrollments if e.status == "Completed"]
-        pending_trainings = [e for e in member.enrollments if e.status == "Enrolled"]
-
-        mandatory_overdue = sum(
-            1
-            for e in member.enrollments
-            if e.course.category == "Mandatory"
-            and e.status != "Completed"
-            and e.due_date < datetime.now()
-        )
-
-        completed_hours = sum(
-            e.course.expected_time_to_complete for e in completed_trainings
-        )
-        technical_hours = sum(
-            e.course.expected_time_to_complete
-            for e in completed_trainings
-            if e.course.category == "technical"
-        )
-        non_technical_hours = sum(
-            e.course.expected_time_to_complete
-            for e in completed_trainings
-            if e.course.category == "nonTechnical"
-        )
-
-        compliance_status = (
-            "Compliant"
-            if technical_hours >= 50 and non_technical_hours >= 15
-            else "Non-Compliant"
-        )
-
-        team_member_details.append(
-            UserTeamView(
-                id=member.id,
-                first_name=member.first_name,
-                last_name=member.last_name,
-                email=member.email,
-                role_name=member.role_name,
-                employee_id=member.employee_id,
-                designation=member.designation,
-                service_line_id=member.service_line_id,
-                external_role_name=member.external_role_name,
-                entity=member.entity,
-                number_of_trainings_completed=len(completed_trainings),
-                hours_of_training_completed=completed_hours,
-                hours_of_non_technical_training_completed=non_technical_hours,
-                hours_of_technical_training_completed=technical_hours,
-                hours_of_technical_training_target=50,
-                hours_of_non_technical_training_target=15,
-                number_of_trainings_pending=len(pending_trainings),
-                number_of_mandatory_trainings_overdue=mandatory_overdue,
-                compliance_status=compliance_status,
-                reminder_needed=mandatory_overdue > 0,
-            )
-        )
-
+    counselor_id = _resolve_counselor_id(counselor_id, db, current_user)
+    team_member_details, next_cursor = compliance.team_page(
+        counselor_id, after_id=after, limit=limit
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
     return team_member_details
 
 
 @app.get("/counselor/{counselor_id}/unassigened/", response_model=List[UserTeamView])
 def get_team_members(
         counselor_id: int,
+        response: Response,
+        after: Optional[int] = Query(None, description="Cursor returned in X-Next-Cursor"),
+        limit: int = Query(200, ge=1, le=1000),
         db: Session = Depends(get_db),
-        current_user: User = Depends(auth.get_current_user),
+        current_user: UserPrincipal = Depends(auth.get_current_user),
+        compliance: TeamComplianceEngine = Depends(get_team_compliance_engine),
 ):
-    # Fetch the counselor to validate existence and role
-    if counselor_id == 0:
-        counselor = current_user
-    else:
-        counselor = (
-            db.query(User)
-            .filter(User.id == counselor_id)
-            .first()
-        )
-    if not counselor:
-        raise HTTPException(status_code=404, detail="Counselor not found")
-
-    team_members = counselor.team_members
-    if not team_members:
-        return []
-
-    team_member_details = []
-    for member in team_members:
-        hours_of_technical_training_target = 50
-        hours_of_non_technical_training_target = 15
-        if member.total_tech_enrolled_hours > hours_of_technical_training_target and member.total_non_tech_enrolled_hours > hours_of_non_technical_training_target:
-            continue
-        # enrollments = db.query(Enrollment).filter(Enrollment.user_id == member.id).all()
-        completed_trainings = [e for e in member.enrollments if e.status == "Completed"]
-        pending_trainings = [e for e in member.enrollments if e.status == "Enrolled"]
-
-        mandatory_overdue = sum(
-            1
-            for e in member.enrollments
-            if e.course.category == "Mandatory"
-            and e.status != "Completed"
-            and e.due_date < datetime.now()
-        )
-
-        completed_hours = sum(
-            e.course.expected_time_to_complete for e in completed_trainings
-        )
-        technical_hours = sum(
-            e.course.expected_time_to_complete
-            for e in completed_trainings
-            if e.course.category == "technical"
-        )
-        non_technical_hours = sum(
-            e.course.expected_time_to_complete
-            for e in completed_trainings
-            if e.course.category == "nonTechnical"
-        )
-
-        compliance_status = (
-            "Compliant"
-            if technical_hours >= 50 and non_technical_hours >= 15
-            else "Non-Compliant"
-        )
-
-        team_member_details.append(
-            UserTeamView(
-                id=member.id,
-                first_name=member.first_name,
-                last_name=member.last_name,
-                email=member.email,
-                role_name=member.role_name,
-                employee_id=member.employee_id,
-                designation=member.designation,
-                service_line_id=member.service_line_id,
-                external_role_name=member.external_role_name,
-                entity=member.entity,
-                number_of_trainings_completed=len(completed_trainings),
-                hours_of_training_completed=completed_hours,
-                hours_of_non_technical_training_completed=non_technical_hours,
-                hours_of_technical_training_completed=technical_hours,
-                hours_of_technical_training_target=50,
-                hours_of_non_technical_training_target=15,
-                number_of_trainings_pending=len(pending_trainings),
-                number_of_mandatory_trainings_overdue=mandatory_overdue,
-                total_tech_enrolled_hours=User.total_tech_enrolled_hours,
-                total_non_tech_enrolled_hours=User.total_non_tech_enrolled_hours,
-                compliance_status=compliance_status,
-                reminder_needed=mandatory_overdue > 0,
-            )
-        )
-
+    counselor_id = _resolve_counselor_id(counselor_id, db, current_user)
+    team_member_details, next_cursor = compliance.team_page(
+        counselor_id, after_id=after, limit=limit, unassigned_only=True
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
     return team_member_details
 
 # @app.post("/users/{user_id}/profile_pic", status_code=200)
@@ -13,12 +13,40 @@ class BaseModel_(BaseModel):
     class Config:
         from_attributes = True
 
-class Base64File(BaseModel):
+class Base64FileInfo(BaseModel):
     filename: str
     content_type: str
+
+
+class Base64File(Base64FileInfo):
     data: str  # Base64-encoded string
 
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    content_type: str
+    size: int = Field(..., ge=0)
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")
+    type: str = "Course content"
+
+
+class UploadSessionDisplay(BaseModel_):
+    id: str
+    filename: str
+    content_type: str
+    size: int
+    received_size: int
+    status: str
+    file_id: Optional[str] = None
+    chunk_size: Optional[int] = None
+
+
+class HashedFile(BaseModel):
+    filename: str
+    content_type: str
+    sha256: str = Field(..., pattern="^[0-9a-fA-F]{64}$")
+
+
 class UserBase(BaseModel_):
     dp_file_id: Optional[str] = None
     first_name: str
@@ -48,6 +76,27 @@ class UserDisplay(UserBase):
         from_attributes = True
 
 
+class UserPrincipal(BaseModel_):
+    """Immutable snapshot of the authenticated user, cached across requests."""
+
+    id: int
+    email: str
+    first_name: str
+    last_name: str
+    role_name: Optional[str]
+    employee_id: Optional[str]
+    designation: Optional[str]
+    service_line_id: Optional[str]
+    external_role_name: Optional[str]
+    entity: Optional[Any]
+    counselor_id: Optional[int]
+    dp_file_id: Optional[str]
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
+
 class InstructorDisplay(UserBase):
     id: int
     counselor: Optional[UserBase]
@@ -173,6 +222,12 @@ class ChapterCreate(ChapterBase):
     pass
 
 
+class CourseChapterCreate(BaseModel_):
+    title: str
+    description: str
+    quizzes: List[QuestionCreate] = Field(default_factory=list)
+
+
 class ChapterDisplay(ChapterCreate):
     id: int
     expected_time_to_complete: Optional[Union[int, float]] = 0
@@ -195,7 +250,11 @@ class CourseBase(BaseModel_):
 
 class CourseCreate(CourseBase):
     description: str
-    chapters: List[ChapterCreate] = Field(default_factory=list)
+    chapters: List[CourseChapterCreate] = Field(default_factory=list)
+
+
+class CourseBatchCreate(BaseModel_):
+    courses: List[CourseCreate] = Field(..., min_length=1, max_length=500)
 
 
 class CourseSortDisplay(CourseBase):
@@ -214,6 +273,32 @@ class CourseSortDisplay(CourseBase):
     creator: Optional[UserDisplay]
 
 
+class CourseCatalogItem(BaseModel_):
+    id: int
+    title: str
+    category: Optional[str]
+    status: Optional[str]
+    service_line_id: Optional[str]
+    difficulty_level: Optional[str]
+    tags: Optional[str]
+    entity: Optional[str]
+    thumbnail_file_id: Optional[str]
+    ratings: Optional[float]
+    creation_date: Optional[datetime]
+    approved_date: Optional[datetime]
+    created_by: Optional[int]
+    is_enrolled: bool = False
+    # Sparse fields, only present when requested
+    description: Optional[str] = None
+    chapters_count: Optional[int] = None
+    enrolled_students_count: Optional[int] = None
+    completed_students_count: Optional[int] = None
+    feedback_count: Optional[int] = None
+    average_rating: Optional[float] = None
+    expected_time_to_complete: Optional[Union[int, float]] = None
+    creator: Optional[UserSortDisplay] = None
+
+
 class CourseFullDisplay(CourseSortDisplay):
     description: Optional[str]
     approver: Optional[UserDisplay]
@@ -284,7 +369,7 @@ class CourseStats(BaseModel):
     category: str
 
 
-class DashStats(BaseModel):
+class WeeklyDashStats(BaseModel):
     completed_courses_count: int
     active_courses_count: int
     pending_courses_count: int
@@ -309,6 +394,13 @@ class DashStatsNew(BaseModel_):
     active_courses: List[CourseStats]
     certificates_count: int
 
+class LearningHoursDisplay(BaseModel_):
+    user_id: int
+    total_learning_hours: float
+    total_tech_learning_hours: float
+    total_non_tech_learning_hours: float
+
+
 class MonthlyStudyHours(BaseModel):
     month: str  # Format: "YYYY-MM"
     hours: float
@@ -629,6 +721,37 @@ class QuizCompletionResponse(BaseModel_):
     attempt_datetime: datetime
 
 
+class QuizAnswer(BaseModel):
+    question_id: int
+    selected_option: str
+
+
+class QuizSubmission(BaseModel):
+    user_id: int
+    course_id: int
+    source: str
+    answers: List[QuizAnswer] = Field(..., min_length=1, max_length=500)
+
+
+class QuizSubmissionResponse(BaseModel):
+    enrollment_id: int
+    results: List[QuizCompletionResponse]
+    correct_count: int
+    status: str
+    completion_percentage: Optional[float] = None
+    pending_question_count: int
+
+
+class QuizAttemptStats(BaseModel):
+    question_id: int
+    learners: int
+    attempts: int
+    answered_correctly: int
+    correct_on_first_attempt: int
+    average_attempts_to_correct: Optional[float] = None
+    last_attempt_at: Optional[datetime] = None
+
+
 class StatusUpdate(BaseModel_):
     status_update: bool
 
@@ -0,0 +1,187 @@
+"""
+Reference data every deployment needs: service lines, designations, external
+roles, roles, the app status row and the super admin.
+
+``seed_reference_data`` reads the existing keys with one query per table and
+inserts only the missing rows, in one ``INSERT ... ON CONFLICT DO NOTHING`` per
+table, so a seeded database costs a handful of reads and workers seeding at the
+same time don't trip over each other. ``backfill_derived_tables`` builds the
+enrollment rollups and monthly learning activity rows that are still missing.
+
+Run both once per deployment:
+
+    python seed.py
+
+and start the workers with ``LMS_SEED_ON_STARTUP=false``; by default each
+worker seeds on startup instead.
+"""
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, dialect_insert
+from enrollment_rollups import rebuild_enrollment_rollups
+from learning_activity import rebuild_learning_activity
+from models import AppStatus, Designations, ExternalRoles, LearningActivityMonthly, Role, ServiceLine, User
+from password_service import password_service
+
+SERVICE_LINES = [
+    "Business Risk",
+    "Assurance",
+    "Stat Audit",
+    "Accounting Advisory",
+    "Tech Risk",
+    "HR",
+    "Operations",
+    "Pursuits",
+    "IT Operations",
+    "Content Writer",
+    "Website Operation Specialist",
+    "Financial Due Diligence",
+    "Brands, Marketing and Communications",
+    "Software Development",
+    "Data Science",
+]
+DESIGNATIONS = [
+    "Co-Founder - Assurance and Advisory Leader",
+    "Director",
+    "Senior Consultant",
+    "Senior",
+    "Manager",
+    "Associate Director",
+    "Assistant Manager",
+    "Consultant",
+    "Associate",
+    "Executive - Operations",
+    "Executive",
+    "Executive Assistant",
+    "Associate (Support) – Operations",
+    "Trainee",
+]
+EXTERNAL_ROLES = [
+    "Business Risk",
+    "Assurance",
+    "Stat Audit",
+    "Accounting Advisory",
+    "Tech Risk",
+    "HR",
+    "Operations",
+    "Pursuits",
+    "IT Operations",
+    "Content Writer",
+    "Website Operation Specialist",
+    "Financial Due Diligence",
+    "Brands, Marketing and Communications",
+]
+ROLES = [
+    dict(RoleName="Super Admin", Description="Manages the whole system"),
+    dict(RoleName="Admin", Description="Manages a specific LOB or department"),
+    dict(RoleName="Instructor", Description="Manages own courses and can propose new ones"),
+    dict(RoleName="Employee", Description="Can view and enroll in courses"),
+]
+SUPER_ADMIN = dict(
+    email="superadmin@example.com",
+    first_name="Super",
+    last_name="Admin",
+    role_name="Super Admin",
+    employee_id="SA001",
+    designation="Manager",
+    service_line_id="Software Development",
+    external_role_name="Assurance",
+    entity="PIERAG",
+)
+SUPER_ADMIN_PASSWORD = "password"
+
+
+def insert_missing(db: Session, model, key_column, rows: List[dict]) -> int:
+    """
+    Inserts the ``rows`` whose ``key_column`` value is not in the table yet.
+
+    Returns:
+    int: The number of rows inserted.
+    """
+    wanted = [row[key_column.key] for row in rows]
+    existing = set(db.scalars(select(key_column).where(key_column.in_(wanted))))
+    missing = [row for row in rows if row[key_column.key] not in existing]
+    if not missing:
+        return 0
+    # Another worker may insert the same rows between the read and the write
+    statement = dialect_insert(db.get_bind(), model.__table__).values(missing).on_conflict_do_nothing()
+    return db.execute(statement).rowcount
+
+
+def seed_reference_data(db: Session) -> Dict[str, int]:
+    """Adds whatever reference rows are missing, without committing, and returns the counts per table."""
+    inserted = {
+        "service_line": insert_missing(
+            db, ServiceLine, ServiceLine.name, [dict(name=name) for name in SERVICE_LINES]
+        ),
+        "designations": insert_missing(
+            db, Designations, Designations.name, [dict(name=name) for name in DESIGNATIONS]
+        ),
+        "external_roles": insert_missing(
+            db, ExternalRoles, ExternalRoles.name, [dict(name=name) for name in EXTERNAL_ROLES]
+        ),
+        "roles": insert_missing(db, Role, Role.RoleName, ROLES),
+        "users": 0,
+        "app_status": 0,
+    }
+
+    # Only hash the password when the account actually has to be created
+    if db.scalar(select(User.id).where(User.email == SUPER_ADMIN["email"])) is None:
+        super_admin = dict(SUPER_ADMIN, password=password_service.hash(SUPER_ADMIN_PASSWORD))
+        inserted["users"] = insert_missing(db, User, User.email, [super_admin])
+
+    if db.scalar(select(AppStatus.id).limit(1)) is None:
+        db.add(AppStatus(status_update=True, update_datetime=datetime.now()))
+        inserted["app_status"] = 1
+    return inserted
+
+
+def backfill_derived_tables(db: Session) -> Dict[str, int]:
+    """
+    Builds enrollment rollups that are missing, and the monthly learning activity
+    when that table is still empty. Commits each step.
+    """
+    built = {"enrollment_rollups": 0, "learning_activity_monthly": 0}
+    try:
+        built["enrollment_rollups"] = rebuild_enrollment_rollups(db, missing_only=True)
+        db.commit()
+        if db.scalar(select(LearningActivityMonthly.user_id).limit(1)) is None:
+            built["learning_activity_monthly"] = rebuild_learning_activity(db)
+            db.commit()
+    except IntegrityError:
+        # A worker starting at the same time got there first
+        db.rollback()
+    return built
+
+
+def seed_database() -> Dict[str, int]:
+    """Seeds reference data and backfills derived tables in a session of its own."""
+    db = SessionLocal()
+    try:
+        counts = seed_reference_data(db)
+        db.commit()
+        counts.update(backfill_derived_tables(db))
+        return counts
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from migrations import upgrade
+
+    parser = argparse.ArgumentParser(description="Insert missing reference data and backfill derived tables.")
+    parser.parse_args()
+
+    upgrade()
+    for table, count in seed_database().items():
+        print(f"{table:28} {count:>6}")
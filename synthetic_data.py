@@ -0,0 +1,372 @@
+"""
+Synthetic, production-sized data for load tests and ``benchmark.py``.
+
+Bulk-inserts users (employees with counselors, instructors, admins), courses
+with chapter / content / question fan-out, enrollments, progress, quiz
+completions, certificates and external certifications, then rebuilds the
+enrollment rollups, monthly learning activity and quiz attempt counters from them:
+
+    LMS_DATABASE_URL=sqlite:///./bench.db python synthetic_data.py --users 100000 --courses 2000
+
+Rows go in with Core ``executemany`` inserts of ``--batch-size`` rows and
+explicit primary keys continuing after the current maxima, so the generator
+must be the only writer while it runs. Every synthetic user's password is
+``password``. The same ``--seed`` always produces the same data.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from enrollment_rollups import rebuild_enrollment_rollups
+from learning_activity import rebuild_learning_activity
+from models import (
+    Certificate,
+    Chapter,
+    Content,
+    Course,
+    Designations,
+    Enrollment,
+    ExternalCertification,
+    ExternalRoles,
+    File,
+    Progress,
+    Questions,
+    QuizCompletions,
+    Role,
+    ServiceLine,
+    User,
+)
+from password_service import pwd_context
+from quiz_attempts import rebuild_attempt_counters
+
+SERVICE_LINES = ["Business Risk", "Assurance", "Stat Audit", "Tech Risk", "Operations", "HR"]
+DESIGNATIONS = ["Director", "Manager", "Senior Consultant", "Consultant", "Associate", "Trainee"]
+ROLES = ["Super Admin", "Admin", "Instructor", "Employee"]
+ENTITIES = ["PIERAG", "Pierian"]
+CATEGORIES = ["technical", "nonTechnical"]
+CERTIFICATION_FILE_ID = "synthetic-certification"
+
+
+class SyntheticDataGenerator:
+    def __init__(self, db: Session, seed: int = 1, batch_size: int = 5000):
+        self.db = db
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = datetime.now().replace(microsecond=0)
+        self.counts: Dict[str, int] = {}
+
+    def _next_id(self, model) -> int:
+        return (self.db.scalar(select(func.max(model.id))) or 0) + 1
+
+    def _insert(self, model, rows: Iterable[dict]) -> int:
+        """Inserts ``rows`` in batches and returns how many there were."""
+        table = model.__table__
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.db.execute(insert(table), batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.db.execute(insert(table), batch)
+            count += len(batch)
+        self.counts[table.name] = self.counts.get(table.name, 0) + count
+        return count
+
+    def _ensure_reference_data(self):
+        for model, column, names in (
+            (ServiceLine, ServiceLine.name, SERVICE_LINES),
+            (Designations, Designations.name, DESIGNATIONS),
+            (ExternalRoles, ExternalRoles.name, SERVICE_LINES),
+            (Role, Role.RoleName, ROLES),
+        ):
+            existing = set(self.db.scalars(select(column)))
+            missing = [{column.key: name} for name in names if name not in existing]
+            if missing:
+                self.db.execute(insert(model.__table__), missing)
+        if self.db.get(File, CERTIFICATION_FILE_ID) is None:
+            self.db.execute(
+                insert(File.__table__),
+                [dict(FileID=CERTIFICATION_FILE_ID, FileName="certificate.pdf",
+                      FilePath="file_storage/synthetic-certificate.pdf",
+                      FileType="application/pdf", type="Certificate")],
+            )
+
+    def _moment(self, start: datetime, end: datetime) -> datetime:
+        span = max(int((end - start).total_seconds()), 1)
+        return start + timedelta(seconds=self.random.randrange(span))
+
+    def generate_users(self, count: int) -> Tuple[List[int], List[int], List[int]]:
+        """Returns the ids of the new employees, instructors and counselors."""
+        first_id = self._next_id(User)
+        password = pwd_context.hash("password")
+        instructor_count = max(count // 50, 1)
+        admin_count = max(count // 500, 1)
+        counselor_count = max(count // 20, 1)
+        ids = list(range(first_id, first_id + count))
+        instructors = ids[admin_count:admin_count + instructor_count]
+        counselors = ids[:counselor_count]
+
+        def rows() -> Iterator[dict]:
+            for position, user_id in enumerate(ids):
+                if position < admin_count:
+                    role = "Admin"
+                elif position < admin_count + instructor_count:
+                    role = "Instructor"
+                else:
+                    role = "Employee"
+                service_line = self.random.choice(SERVICE_LINES)
+                yield dict(
+                    id=user_id,
+                    account_creation_date=self._moment(self.now - timedelta(days=3 * 365), self.now),
+                    first_name=f"User{user_id}",
+                    last_name="Synthetic",
+                    email=f"user{user_id}@synthetic.example.com",
+                    password=password,
+                    employee_id=f"SYN{user_id:07d}",
+                    designation=self.random.choice(DESIGNATIONS),
+                    role_name=role,
+                    service_line_id=service_line,
+                    external_role_name=service_line,
+                    entity=self.random.choice(ENTITIES),
+                    total_training_hours=0,
+                    counselor_id=self.random.choice(counselors) if position >= counselor_count else None,
+                )
+
+        self._insert(User, rows())
+        return ids[admin_count + instructor_count:], instructors, counselors
+
+    def generate_courses(
+        self,
+        count: int,
+        instructors: List[int],
+        chapters: Tuple[int, int] = (3, 10),
+        contents: Tuple[int, int] = (2, 8),
+        questions: Tuple[int, int] = (0, 5),
+    ) -> Dict[int, Tuple[List[Tuple[int, int, int]], List[int]]]:
+        """
+        Creates courses with their chapters, contents and chapter questions.
+
+        Returns:
+        Dict[int, tuple]: Per approved course, its (chapter id, content id, minutes)
+        in course order and its question ids.
+        """
+        course_id = self._next_id(Course)
+        chapter_id = self._next_id(Chapter)
+        content_id = self._next_id(Content)
+        question_id = self._next_id(Questions)
+        course_rows, chapter_rows, content_rows, question_rows = [], [], [], []
+        structure = {}
+
+        for _ in range(count):
+            created = self._moment(self.now - timedelta(days=2 * 365), self.now)
+            approved = self.random.random() < 0.9
+            course_rows.append(dict(
+                id=course_id,
+                title=f"Synthetic course {course_id}",
+                description="Generated for load testing.",
+                category=self.random.choice(CATEGORIES),
+                created_by=self.random.choice(instructors),
+                service_line_id=self.random.choice(SERVICE_LINES),
+                difficulty_level=str(self.random.randint(0, 3)),
+                tags=self.random.choice(["none", "python", "audit,risk", "excel"]),
+                ratings=0,
+                status="approve" if approved else "approval pending",
+                creation_date=created,
+                approved_date=created + timedelta(days=1) if approved else None,
+                entity=self.random.choice(ENTITIES),
+            ))
+            course_contents, course_questions = [], []
+            for _ in range(self.random.randint(*chapters)):
+                chapter_rows.append(dict(
+                    id=chapter_id, course_id=course_id,
+                    title=f"Chapter {chapter_id}", description="Generated chapter.",
+                ))
+                for _ in range(self.random.randint(*contents)):
+                    minutes = self.random.randint(5, 60)
+                    content_rows.append(dict(
+                        id=content_id, chapter_id=chapter_id, title=f"Content {content_id}",
+                        content_type=self.random.choice(["video/mp4", "application/pdf"]),
+                        expected_time_to_complete=minutes,
+                    ))
+                    course_contents.append((chapter_id, content_id, minutes))
+                    content_id += 1
+                for _ in range(self.random.randint(*questions)):
+                    question_rows.append(dict(
+                        id=question_id, chapter_id=chapter_id, question=f"Question {question_id}?",
+                        option_a="a", option_b="b", option_c="c", option_d="d",
+                        correct_answer=self.random.choice("abcd"),
+                    ))
+                    course_questions.append(question_id)
+                    question_id += 1
+                chapter_id += 1
+            if approved:
+                structure[course_id] = (course_contents, course_questions)
+            course_id += 1
+
+        self._insert(Course, course_rows)
+        self._insert(Chapter, chapter_rows)
+        self._insert(Content, content_rows)
+        self._insert(Questions, question_rows)
+        return structure
+
+    def generate_activity(
+        self,
+        employees: List[int],
+        structure: Dict[int, Tuple[List[Tuple[int, int, int]], List[int]]],
+        enrollments: Tuple[int, int] = (2, 15),
+    ):
+        """Enrolls employees in approved courses and records their progress and quiz answers."""
+        course_ids = list(structure)
+        if not course_ids:
+            return
+        enrollment_id = self._next_id(Enrollment)
+        progress_id = self._next_id(Progress)
+        completion_id = self._next_id(QuizCompletions)
+        completed: List[Tuple[int, int, int, datetime]] = []
+
+        # A chunk of users at a time: their enrollments, then their progress
+        users_per_chunk = max(self.batch_size // 10, 1)
+        for start in range(0, len(employees), users_per_chunk):
+            enrollment_rows, progress_rows = [], []
+            for user_id in employees[start:start + users_per_chunk]:
+                count = min(self.random.randint(*enrollments), len(course_ids))
+                for course_id in self.random.sample(course_ids, count):
+                    enrolled = self._moment(self.now - timedelta(days=365), self.now)
+                    enrollment_rows.append(dict(
+                        id=enrollment_id, user_id=user_id, course_id=course_id,
+                        enroll_date=enrolled.date(), year=enrolled.year,
+                        due_date=(enrolled + timedelta(days=self.random.randint(30, 120))).date(),
+                        status="Enrolled",
+                    ))
+                    course_contents, _ = structure[course_id]
+                    share = self.random.random()
+                    done = 0 if share < 0.3 else len(course_contents) if share > 0.75 else int(
+                        len(course_contents) * self.random.random()
+                    )
+                    for chapter_id, content_id, _ in course_contents[:done]:
+                        progress_rows.append(dict(
+                            id=progress_id, enrollment_id=enrollment_id, chapter_id=chapter_id,
+                            content_id=content_id, completed_at=self._moment(enrolled, self.now),
+                        ))
+                        progress_id += 1
+                    if course_contents and done == len(course_contents):
+                        completed.append((enrollment_id, user_id, course_id, enrolled))
+                    enrollment_id += 1
+            self._insert(Enrollment, enrollment_rows)
+            self._insert(Progress, progress_rows)
+
+        def completion_rows() -> Iterator[dict]:
+            nonlocal completion_id
+            for enrollment_id, _, course_id, enrolled in completed:
+                for question_id in structure[course_id][1]:
+                    for _ in range(self.random.choice((1, 1, 2))):
+                        yield dict(
+                            id=completion_id, question_id=question_id,
+                            correct_answer=self.random.random() < 0.8, source="synthetic",
+                            enrollment_id=enrollment_id, attempt_datetime=self._moment(enrolled, self.now),
+                        )
+                        completion_id += 1
+
+        self._insert(QuizCompletions, completion_rows())
+        self._insert(Certificate, (
+            dict(user_id=user_id, course_id=course_id, issue_date=self._moment(enrolled, self.now))
+            for _, user_id, course_id, enrolled in completed
+        ))
+
+    def generate_external_certifications(self, employees: List[int], share: float = 0.2):
+        def rows() -> Iterator[dict]:
+            for user_id in employees:
+                if self.random.random() >= share:
+                    continue
+                for _ in range(self.random.randint(1, 3)):
+                    completed_on = self._moment(self.now - timedelta(days=365), self.now)
+                    approved = self.random.random() < 0.7
+                    yield dict(
+                        course_name="External course", category=self.random.choice(CATEGORIES),
+                        status="approved" if approved else "pending",
+                        date_of_completion=completed_on.date(), hours=self.random.randint(1, 40),
+                        file_id=CERTIFICATION_FILE_ID, certificate_provider="Synthetic provider",
+                        uploaded_by_id=user_id, approved_date=completed_on if approved else None,
+                    )
+
+        self._insert(ExternalCertification, rows())
+
+    def generate(self, users: int, courses: int, **fan_out) -> Dict[str, int]:
+        """
+        Generates the whole dataset in one transaction and returns the rows inserted per table.
+
+        Args:
+        users (int): Number of users; about 2% are instructors and 5% counselors.
+        courses (int): Number of courses; about 90% are approved.
+        fan_out: ``chapters``, ``contents`` and ``questions`` (min, max) per parent,
+            and ``enrollments`` (min, max) per employee.
+        """
+        try:
+            self._ensure_reference_data()
+            employees, instructors, _ = self.generate_users(users)
+            structure = self.generate_courses(
+                courses,
+                instructors,
+                **{key: fan_out[key] for key in ("chapters", "contents", "questions") if key in fan_out},
+            )
+            self.generate_activity(employees, structure, **{
+                key: fan_out[key] for key in ("enrollments",) if key in fan_out
+            })
+            self.generate_external_certifications(employees)
+            self.db.flush()
+            self.counts["enrollment_rollups"] = rebuild_enrollment_rollups(self.db, missing_only=True)
+            self.counts["learning_activity_monthly"] = rebuild_learning_activity(self.db)
+            self.counts["quiz_attempt_counters"] = rebuild_attempt_counters(self.db)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return self.counts
+
+
+def _range(value: str) -> Tuple[int, int]:
+    low, _, high = value.partition("-")
+    return int(low), int(high or low)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from database import SessionLocal
+    from migrations import upgrade
+
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic LMS data.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--courses", type=int, default=100)
+    parser.add_argument("--chapters", type=_range, default=(3, 10), help="Chapters per course, e.g. 3-10")
+    parser.add_argument("--contents", type=_range, default=(2, 8), help="Contents per chapter")
+    parser.add_argument("--questions", type=_range, default=(0, 5), help="Questions per chapter")
+    parser.add_argument("--enrollments", type=_range, default=(2, 15), help="Enrollments per employee")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    upgrade()
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        counts = SyntheticDataGenerator(db, args.seed, args.batch_size).generate(
+            args.users,
+            args.courses,
+            chapters=args.chapters,
+            contents=args.contents,
+            questions=args.questions,
+            enrollments=args.enrollments,
+        )
+    finally:
+        db.close()
+    for table, count in counts.items():
+        print(f"{table:28} {count:>10}")
+    print(f"Generated in {time.perf_counter() - started:.1f}s")